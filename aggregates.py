@@ -0,0 +1,152 @@
+import logging
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+
+from rates import RateTable
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+def _add_amount(target: Dict, currency: str, amount: float):
+    target[currency] = target.get(currency, 0) + amount
+
+
+class SalesAggregates:
+    """Инкрементальные агрегаты продаж по дням, сохраняемые в локальный JSON.
+
+    Каждая продажа раскладывается в корзину своего дня (по дате продажи):
+    выручка по валютам, каналы, менеджеры (кто занес продажу) и их комиссии.
+    Отчеты за период собираются суммированием корзин без чтения таблицы.
+    Корзины хранят суммы в исходных валютах; приведение к валюте отчетов
+    делается при сводке по курсу дня корзины, поэтому смена курсов не требует пересчета.
+    """
+
+    def __init__(self, path: str, rates: Optional[RateTable] = None):
+        self.path = path
+        self.rates = rates
+        self._lock = threading.Lock()
+        self._days: Dict[str, Dict] = load_json(path, {}).get('days', {})
+
+    def reload(self):
+        """Перечитывает корзины из файла (его мог изменить другой экземпляр)"""
+        with self._lock:
+            self._days = load_json(self.path, {}).get('days', {})
+
+    @staticmethod
+    def _day_key(date_str: str) -> Optional[str]:
+        # Дата продажи хранится как dd.mm.YYYY, ключ корзины — ISO для сортировки
+        try:
+            return datetime.strptime(date_str, '%d.%m.%Y').date().isoformat()
+        except (TypeError, ValueError):
+            return None
+
+    def add_sale(self, data: Dict, commission: float = 0.0):
+        """Учитывает продажу в корзине ее дня"""
+        self._apply(data, commission, 1)
+
+    def remove_sale(self, data: Dict, commission: float = 0.0):
+        """Откатывает ранее учтенную продажу (правка или удаление записи)"""
+        self._apply(data, commission, -1)
+
+    def replace_range(self, start: date, end: date, sales: Iterable[Dict]) -> int:
+        """Пересобирает корзины дней [start, end] по продажам из зеркала после сверки с таблицей.
+
+        Так в отчеты попадают продажи, внесенные в таблицу вручную или до
+        появления агрегатов. Комиссия берется из поля commission продажи.
+        """
+        start_key, end_key = start.isoformat(), end.isoformat()
+        days: Dict[str, Dict] = {}
+        count = 0
+        for data in sales:
+            key = self._day_key(data.get('date'))
+            if key and start_key <= key <= end_key:
+                self._apply_to(days, key, data, data.get('commission') or 0.0, 1)
+                count += 1
+        with self._lock:
+            self._days = {k: v for k, v in self._days.items() if not start_key <= k <= end_key}
+            self._days.update(days)
+            self._save_locked()
+        return count
+
+    def _apply(self, data: Dict, commission: float, sign: int):
+        key = self._day_key(data.get('date'))
+        if not key:
+            logger.warning(f"Агрегаты: некорректная дата продажи {data.get('date')}")
+            return
+        with self._lock:
+            self._apply_to(self._days, key, data, commission, sign)
+            self._save_locked()
+
+    @staticmethod
+    def _apply_to(days: Dict[str, Dict], key: str, data: Dict, commission: float, sign: int):
+        currency = data['currency']
+        amount = float(data['amount']) * sign
+        channel = data.get('channel') or '—'
+        manager = data.get('manager_username') or 'unknown'
+        bucket = days.setdefault(key, {'count': 0, 'revenue': {}, 'channels': {}, 'managers': {}})
+        bucket['count'] += sign
+        _add_amount(bucket['revenue'], currency, amount)
+        _add_amount(bucket['channels'].setdefault(channel, {}), currency, amount)
+        manager_bucket = bucket['managers'].setdefault(manager, {'count': 0, 'revenue': {}, 'commission': {}})
+        manager_bucket['count'] += sign
+        _add_amount(manager_bucket['revenue'], currency, amount)
+        if commission:
+            _add_amount(manager_bucket['commission'], currency, commission * sign)
+
+    def summary(self, start: date, end: date) -> Dict:
+        """Сводка за период [start, end] включительно.
+
+        normalized / channels_normalized / managers[*]['normalized'] — суммы в валюте
+        отчетов (есть только при заданной таблице курсов).
+        """
+        start_key, end_key = start.isoformat(), end.isoformat()
+        result = {'count': 0, 'revenue': {}, 'channels': {}, 'managers': {}}
+        if self.rates:
+            result['reporting_currency'] = self.rates.reporting_currency
+            result['normalized'] = 0.0
+            result['channels_normalized'] = {}
+        with self._lock:
+            for key, bucket in self._days.items():
+                if not (start_key <= key <= end_key):
+                    continue
+                result['count'] += bucket['count']
+                for currency, amount in bucket['revenue'].items():
+                    _add_amount(result['revenue'], currency, amount)
+                    if self.rates:
+                        result['normalized'] += self._convert(amount, currency, key)
+                for channel, amounts in bucket['channels'].items():
+                    target = result['channels'].setdefault(channel, {})
+                    for currency, amount in amounts.items():
+                        _add_amount(target, currency, amount)
+                        if self.rates:
+                            _add_amount(result['channels_normalized'], channel, self._convert(amount, currency, key))
+                for manager, stats in bucket['managers'].items():
+                    target = result['managers'].setdefault(manager, {'count': 0, 'revenue': {}, 'commission': {}})
+                    target['count'] += stats['count']
+                    for currency, amount in stats['revenue'].items():
+                        _add_amount(target['revenue'], currency, amount)
+                        if self.rates:
+                            target['normalized'] = target.get('normalized', 0.0) + self._convert(amount, currency, key)
+                    for currency, amount in stats.get('commission', {}).items():
+                        _add_amount(target['commission'], currency, amount)
+        # Записи, полностью откатанные правками/удалениями, в сводку не попадают
+        result['channels'] = {k: v for k, v in result['channels'].items() if any(abs(a) > 1e-9 for a in v.values())}
+        if self.rates:
+            result['channels_normalized'] = {k: v for k, v in result['channels_normalized'].items()
+                                             if k in result['channels']}
+        result['managers'] = {k: v for k, v in result['managers'].items() if v['count'] > 0}
+        return result
+
+    def _convert(self, amount: float, currency: str, day_key: str) -> float:
+        try:
+            return self.rates.convert(amount, currency, day_key)
+        except KeyError:
+            return 0.0
+
+    def _save_locked(self):
+        try:
+            save_json_atomic(self.path, {'days': self._days})
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить агрегаты в {self.path}: {e}")
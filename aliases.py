@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+from typing import Callable, List, Mapping, NamedTuple, Optional, Tuple
+
+from textmatch import CommentSplitter
+
+logger = logging.getLogger(__name__)
+
+
+class AliasSnapshot(NamedTuple):
+    """Неизменяемый набор словарей нормализации, собранный из файла"""
+    channels: Mapping[str, str]
+    payment_types: Mapping[str, str]
+    internal_external: Mapping[str, str]
+    comment_splitter: CommentSplitter
+    mtime: float
+
+
+def _lower_keys(section) -> Mapping[str, str]:
+    return MappingProxyType({str(k).strip().lower(): str(v) for k, v in (section or {}).items()})
+
+
+def compile_snapshot(raw: dict, mtime: float = 0.0) -> AliasSnapshot:
+    return AliasSnapshot(
+        channels=_lower_keys(raw.get('channels')),
+        payment_types=_lower_keys(raw.get('payment_types')),
+        internal_external=_lower_keys(raw.get('internal_external')),
+        comment_splitter=CommentSplitter(
+            raw.get('comment_delimiters') or [],
+            raw.get('comment_keywords') or []
+        ),
+        mtime=mtime,
+    )
+
+
+class AliasRegistry:
+    """Словари алиасов (каналы, типы оплаты, внешняя/внутренняя, триггеры комментария).
+
+    Загружаются из JSON-файла и перечитываются фоновым потоком при изменении
+    mtime. Новый набор компилируется целиком и подменяется одной операцией
+    присваивания, поэтому парсер всегда видит согласованный снимок.
+    """
+
+    def __init__(self, path: str, reload_interval: float = 30.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._listeners: List[Callable[[AliasSnapshot], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.current: AliasSnapshot = self._load() or compile_snapshot({})
+
+    def subscribe(self, listener: Callable[[AliasSnapshot], None]):
+        """Регистрирует обработчик, вызываемый после подмены снимка"""
+        self._listeners.append(listener)
+
+    def _read(self) -> Optional[Tuple[dict, float]]:
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f), mtime
+        except FileNotFoundError:
+            logger.warning(f"Файл алиасов {self.path} не найден")
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Не удалось прочитать файл алиасов {self.path}: {e}")
+        return None
+
+    def _load(self) -> Optional[AliasSnapshot]:
+        loaded = self._read()
+        if not loaded:
+            return None
+        raw, mtime = loaded
+        try:
+            return compile_snapshot(raw, mtime)
+        except Exception as e:
+            logger.error(f"Некорректный файл алиасов {self.path}: {e}")
+            return None
+
+    def check_reload(self) -> bool:
+        """Перечитывает файл, если он изменился; возвращает True при подмене"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self.current.mtime:
+            return False
+        snapshot = self._load()
+        if not snapshot:
+            # Оставляем прежний снимок, но запоминаем mtime, чтобы не перечитывать битый файл
+            self.current = self.current._replace(mtime=mtime)
+            return False
+        self.current = snapshot
+        logger.info(f"Алиасы перезагружены из {self.path}")
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка применения новых алиасов: {e}")
+        return True
+
+    def start(self):
+        if self.reload_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._loop, name='alias-reloader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.reload_interval):
+            self.check_reload()
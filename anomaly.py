@@ -0,0 +1,220 @@
+import logging
+import math
+import os
+import secrets
+import threading
+import time
+from typing import Dict, List, Optional
+
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class RollingStats:
+    """Скользящие среднее и дисперсия log(суммы), O(1) на наблюдение.
+
+    Пока наблюдений меньше 1/alpha, вес нового значения 1/(n+1) — это точные
+    среднее и дисперсия (как у Уэлфорда); дальше — экспоненциальное
+    сглаживание с весом alpha, чтобы модель следовала за ростом цен.
+    """
+
+    __slots__ = ('n', 'mean', 'var')
+
+    def __init__(self, n: int = 0, mean: float = 0.0, var: float = 0.0):
+        self.n = n
+        self.mean = mean
+        self.var = var
+
+    def update(self, x: float, alpha: float):
+        weight = max(alpha, 1.0 / (self.n + 1))
+        diff = x - self.mean
+        increment = weight * diff
+        self.mean += increment
+        self.var = (1 - weight) * (self.var + diff * increment)
+        self.n += 1
+
+    def zscore(self, x: float, min_sd: float) -> float:
+        return abs(x - self.mean) / max(math.sqrt(self.var), min_sd)
+
+
+class AnomalyDetector:
+    """Модель обычных продаж по каналу и формату: сумма (в логарифме) и валюта.
+
+    Суммы сравниваются в логарифмической шкале, поэтому лишний ноль дает
+    одинаковое отклонение и для 500, и для 50 000. Статистика обновляется
+    при каждой записанной продаже и хранится в JSON; к таблице модель не
+    обращается. Пока по ключу меньше min_samples продаж, он не проверяется.
+    """
+
+    def __init__(self, path: str, alpha: float = 0.05, threshold: float = 3.0, min_samples: int = 8,
+                 min_log_sd: float = 0.25, rare_currency_share: float = 0.05):
+        self.path = path
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.min_log_sd = min_log_sd
+        self.rare_currency_share = rare_currency_share
+        self._lock = threading.Lock()
+        self._amounts: Dict[str, RollingStats] = {}
+        self._currencies: Dict[str, Dict[str, float]] = {}
+        self.reload()
+
+    def reload(self):
+        """Читает статистику из файла (при старте и когда экземпляр становится ведущим)"""
+        raw = load_json(self.path, {})
+        with self._lock:
+            self._amounts = {key: RollingStats(*values) for key, values in raw.get('amounts', {}).items()}
+            self._currencies = raw.get('currencies', {})
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    @staticmethod
+    def _amount_keys(data: Dict, scope: str):
+        currency = str(data.get('currency', '')).upper()
+        yield 'канала', str(data.get('channel', '')), f"{scope}|channel|{str(data.get('channel', '')).lower()}|{currency}"
+        if data.get('format'):
+            yield 'формата', str(data['format']), f"{scope}|format|{data['format']}|{currency}"
+
+    @staticmethod
+    def _currency_key(data: Dict, scope: str) -> str:
+        return f"{scope}|channel|{str(data.get('channel', '')).lower()}"
+
+    def check(self, data: Dict, scope: str = '') -> List[str]:
+        """Причины считать продажу подозрительной (пустой список — продажа обычная)"""
+        try:
+            amount = float(data['amount'])
+        except (KeyError, TypeError, ValueError):
+            return []
+        if amount <= 0:
+            return []
+        currency = str(data.get('currency', '')).upper()
+        reasons = []
+        with self._lock:
+            counts = self._currencies.get(self._currency_key(data, scope), {})
+            total = sum(counts.values())
+            if total >= self.min_samples:
+                usual = max(counts, key=counts.get)
+                if usual != currency and counts.get(currency, 0.0) / total < self.rare_currency_share:
+                    reasons.append(f"валюта {currency} необычна для канала «{data.get('channel')}» (обычно {usual})")
+            x = math.log(amount)
+            for label, name, key in self._amount_keys(data, scope):
+                stats = self._amounts.get(key)
+                if not stats or stats.n < self.min_samples:
+                    continue
+                if stats.zscore(x, self.min_log_sd) >= self.threshold:
+                    typical = f"{math.exp(stats.mean):,.0f}".replace(',', ' ')
+                    reasons.append(
+                        f"сумма {data['amount']} {currency} нетипична для {label} «{name}» "
+                        f"(обычно около {typical} {currency})"
+                    )
+        return reasons
+
+    def observe(self, data: Dict, scope: str = '', save: bool = True):
+        """Учитывает записанную продажу"""
+        try:
+            amount = float(data['amount'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if amount <= 0:
+            return
+        currency = str(data.get('currency', '')).upper()
+        with self._lock:
+            x = math.log(amount)
+            for _, _, key in self._amount_keys(data, scope):
+                self._amounts.setdefault(key, RollingStats()).update(x, self.alpha)
+            # Доли валют канала: экспоненциальное затухание старых продаж с тем же alpha
+            counts = self._currencies.setdefault(self._currency_key(data, scope), {})
+            for known in counts:
+                counts[known] *= 1 - self.alpha
+            counts[currency] = counts.get(currency, 0.0) + 1.0
+            if save:
+                self._save_locked()
+
+    def rebuild(self, sales) -> int:
+        """Прогрев модели по записанным продажам (например, из зеркала), если файла еще нет"""
+        count = 0
+        for data in sales:
+            self.observe(data, save=False)
+            count += 1
+        with self._lock:
+            self._save_locked()
+        return count
+
+    def _save_locked(self):
+        try:
+            save_json_atomic(self.path, {
+                'amounts': {key: [s.n, s.mean, s.var] for key, s in self._amounts.items()},
+                'currencies': self._currencies,
+            })
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить статистику продаж: {e}")
+
+
+class PendingSales:
+    """Продажи, ожидающие подтверждения, по короткому токену для callback_data"""
+
+    def __init__(self, ttl: float = 3600.0, max_size: int = 500):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._items: Dict[str, Dict] = {}
+
+    def hold(self, item: Dict) -> str:
+        with self._lock:
+            self._expire_locked()
+            while len(self._items) >= self.max_size:
+                self._items.pop(next(iter(self._items)))
+            token = secrets.token_urlsafe(6)
+            self._items[token] = dict(item, held_at=time.time())
+            return token
+
+    def get(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            self._expire_locked()
+            return self._items.get(token)
+
+    def pop(self, token: str) -> Optional[Dict]:
+        with self._lock:
+            self._expire_locked()
+            return self._items.pop(token, None)
+
+    def discard_message(self, chat_id: int, message_id: int) -> int:
+        """Убирает продажи, отложенные по сообщению (его исправили — подтверждать нечего)"""
+        with self._lock:
+            tokens = [t for t, item in self._items.items()
+                      if item['chat_id'] == chat_id and item['message_id'] == message_id]
+            for token in tokens:
+                del self._items[token]
+            return len(tokens)
+
+    def save(self, path: str) -> int:
+        """Сохраняет неподтвержденные продажи, чтобы кнопки работали и после рестарта"""
+        with self._lock:
+            self._expire_locked()
+            items = dict(self._items)
+        if items:
+            save_json_atomic(path, items)
+            logger.warning(f"Неподтвержденных продаж сохранено: {len(items)}")
+        return len(items)
+
+    def restore(self, path: str) -> int:
+        """Возвращает продажи, сохраненные при прошлой остановке (токены прежние)"""
+        items = load_json(path, {})
+        with self._lock:
+            self._items.update(items)
+            self._expire_locked()
+            restored = len(self._items)
+        if items:
+            os.remove(path)
+            logger.info(f"Восстановлено неподтвержденных продаж: {restored}")
+        return restored
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _expire_locked(self):
+        deadline = time.time() - self.ttl
+        for token in [t for t, item in self._items.items() if item['held_at'] < deadline]:
+            del self._items[token]
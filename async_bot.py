@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from telebot.async_telebot import AsyncTeleBot
+
+import config
+from sheets_async import AsyncSheetsClient
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSalesBot:
+    """Асинхронный режим (BOT_MODE=async) поверх SalesBot.
+
+    Состояние (зеркало, агрегаты, индекс сообщений, уведомления) остается в
+    SalesBot; здесь — транспорт. Обновления принимает AsyncTeleBot, продажи
+    обрабатываются в цикле событий: строка дописывается в таблицу через
+    AsyncSheetsClient, подтверждение уходит асинхронно, а запись в SQLite/JSON
+    выполняется в пуле потоков. Остальные команды (/money с графиками,
+    /export, правки сообщений, кнопки) передаются обработчикам SalesBot
+    в том же пуле — core создается с threaded=False, поэтому обработчик
+    выполняется прямо в потоке пула.
+    """
+
+    def __init__(self, core, workers: int = config.ASYNC_WORKERS, pool_size: int = config.SHEETS_HTTP_POOL_SIZE):
+        self.core = core
+        # Продолжаем с сохраненного offset — как и синхронный режим, пропущенные продажи догоняются
+        saved = core.offset_store.load()
+        self.bot = AsyncTeleBot(core.bot_token, offset=saved + 1 if saved else None)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sales-async')
+        self.sheets: Optional[AsyncSheetsClient] = None
+        if core.sheet and core.credentials:
+            self.sheets = AsyncSheetsClient(core.credentials, core.sheets_id, pool_size=pool_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._polling_task: Optional[asyncio.Task] = None
+        self._batches = 0
+        self._processed_upto = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._register_handlers()
+        self._track_updates()
+        core.heartbeat.wrap_async(self.bot)
+
+    def _register_handlers(self):
+        @self.bot.message_handler(func=self._is_sale)
+        async def sale_message(message):
+            await self._handle_sale(message)
+
+        @self.bot.message_handler(func=lambda message: True)
+        async def other_message(message):
+            await self._offload(self.core.bot.process_new_messages, [message])
+
+        @self.bot.edited_message_handler(func=lambda message: True)
+        async def edited_message(message):
+            await self._offload(self.core.bot.process_new_edited_messages, [message])
+
+        @self.bot.callback_query_handler(func=lambda call: True)
+        async def callback_query(call):
+            await self._offload(self.core.bot.process_new_callback_query, [call])
+
+    def _is_sale(self, message) -> bool:
+        text = (message.text or '').strip()
+        if not text or text.startswith('/') or not self.core._looks_like_sale(text):
+            return False
+        # Продажи команд со своей таблицей идут синхронным путем SalesBot (в пуле потоков)
+        return self.core.tenants.for_chat(message.chat.id).is_default
+
+    async def _offload(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def _handle_sale(self, message):
+        core = self.core
+        # Разбор (регулярки, нечеткий поиск канала) — в пуле, чтобы не задерживать цикл событий
+        parsed_data = await self._offload(core._parse_cached, message.text.strip())
+        if not parsed_data:
+            await self._offload(core._reply_unrecognized, message)
+            return
+        # Сообщение уже записано (обработано до рестарта, но offset сохранить не успели)
+        if core.message_index.get(message.chat.id, message.message_id):
+            logger.info(f"Сообщение {message.chat.id}:{message.message_id} уже занесено — пропускаем")
+            return
+        if not core._validate_format(parsed_data.get('format', '')):
+            await self.bot.send_message(message.chat.id, core.FORMAT_ERROR_TEXT, parse_mode='HTML')
+            return
+
+        try:
+            parsed_data['manager_username'] = message.from_user.username
+            parsed_data['commission'] = core.commissions.commission_for_sale(parsed_data)
+            if await self._offload(core._hold_if_anomalous, message, parsed_data, core.tenants.default):
+                return
+
+            location = await self._append_to_sheet(parsed_data)
+            await self._offload(core._record_sale, parsed_data, location, message.chat.id, message.message_id)
+
+            confirmation_text, keyboard = core._sale_confirmation(parsed_data)
+            await self.bot.send_message(message.chat.id, confirmation_text, parse_mode='HTML', reply_markup=keyboard)
+            core._send_notification(parsed_data)
+        except Exception as e:
+            logger.error(f"Ошибка обработки сообщения: {e}")
+            await self.bot.send_message(message.chat.id, "❌ Произошла ошибка при обработке данных. Попробуйте еще раз.")
+
+    async def _replay_backlog(self):
+        """Догоняющая обработка накопившихся обновлений синхронным путем SalesBot.
+
+        Пачки проходят через обработчики core, строки пишутся в таблицу одним
+        запросом на пачку (см. SalesBot._replay_backlog); polling продолжает
+        с первого необработанного обновления.
+        """
+        core = self.core
+        await self._offload(core._replay_backlog)
+        replayed_upto = core.bot.last_update_id
+        if replayed_upto and replayed_upto + 1 > (self.bot.offset or 0):
+            self.bot.offset = replayed_upto + 1
+            self._processed_upto = max(self._processed_upto, replayed_upto)
+            await self._offload(core.offset_store.save, replayed_upto)
+
+    async def _append_to_sheet(self, data: Dict) -> Optional[Tuple[str, int]]:
+        row = self.core._sheet_row(data)
+        if not self.sheets:
+            logger.warning(f"❌ Google Sheets не подключен! Данные записаны в режиме симуляции: {data}")
+            return None
+        title = self.core.sheet.title
+        row_number = await self.sheets.append_row(title, row)
+        self.core.last_sheet_write = time.time()
+        logger.info(f"✅ Данные добавлены в строку {row_number} листа '{title}': {data}")
+        return title, row_number
+
+    def _track_updates(self):
+        """Считает пачки в обработке; когда все завершены, сохраняет последний обработанный update_id.
+
+        bot.offset сдвигается до запуска задачи пачки, поэтому сохраняем не его,
+        а максимум по завершенным пачкам (задачи стартуют в порядке создания).
+        """
+        process = self.bot.process_new_updates
+
+        async def tracked(updates):
+            self._batches += 1
+            self._idle.clear()
+            try:
+                await process(updates)
+            finally:
+                self._batches -= 1
+                if updates:
+                    self._processed_upto = max(self._processed_upto, updates[-1].update_id)
+                if not self._batches:
+                    self._idle.set()
+                    await self._offload(self.core.offset_store.save, self._processed_upto)
+
+        self.bot.process_new_updates = tracked
+
+    def request_stop(self):
+        if self.core.lifecycle.stopping:
+            logger.warning("Повторный сигнал — немедленное завершение")
+            raise SystemExit(1)
+        logger.info("Получен сигнал остановки. Останавливаем прием обновлений...")
+        self.core.lifecycle.request_stop()
+        if self._polling_task:
+            self._polling_task.cancel()
+
+    def _on_lease_lost(self):
+        # Вызывается из потока продления аренды
+        if self._loop and self._polling_task:
+            self._loop.call_soon_threadsafe(self._polling_task.cancel)
+
+    def run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        core = self.core
+        self._loop = asyncio.get_running_loop()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self._loop.add_signal_handler(signum, self.request_stop)
+        core.instance_lock.on_lost = self._on_lease_lost
+
+        logger.info("Запуск бота (асинхронный режим)...")
+        # Резервному экземпляру нужны только эндпоинты состояния
+        core._start_health()
+        prepared = False
+        try:
+            while not core.lifecycle.stopping:
+                if not core.instance_lock.held:
+                    acquired = await self._offload(core.instance_lock.wait_acquire, lambda: core.lifecycle.stopping)
+                    if not acquired:
+                        break
+                await self._offload(core._start_background)
+                # Offset мог уйти вперед, пока другой экземпляр был ведущим
+                saved = core.offset_store.load()
+                if saved and saved + 1 > (self.bot.offset or 0):
+                    self.bot.offset = saved + 1
+                if not prepared:
+                    try:
+                        await self.bot.delete_webhook()
+                        await self._replay_backlog()
+                    except Exception as e:
+                        logger.warning(f"Ошибка при догоняющей обработке: {e}")
+                    prepared = True
+                self._polling_task = asyncio.create_task(self.bot.polling(non_stop=True, interval=0, timeout=20))
+                try:
+                    await self._polling_task
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.error(f"Ошибка polling: {e}")
+                    await asyncio.sleep(5)
+                if not core.lifecycle.stopping and not core.instance_lock.held:
+                    core._pause_background()
+        finally:
+            await self._shutdown()
+
+    async def _shutdown(self):
+        core = self.core
+        fetched_upto = (self.bot.offset or 1) - 1
+        deadline = self._loop.time() + core.lifecycle.timeout
+        # Ждем и пачки в обработке, и уже полученные, чьи задачи еще не стартовали
+        while (self._batches or self._processed_upto < fetched_upto) and self._loop.time() < deadline:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=0.1)
+            except asyncio.TimeoutError:
+                pass
+            await asyncio.sleep(0)
+        if self._batches or self._processed_upto < fetched_upto:
+            logger.warning(f"Не дождались обработчиков ({self._batches} пачек в работе), offset не подтвержден")
+        elif fetched_upto:
+            core.offset_store.save(fetched_upto)
+            try:
+                await self.bot.get_updates(offset=fetched_upto + 1, limit=1, timeout=0)
+                logger.info(f"Offset обновлений подтвержден: {fetched_upto}")
+            except Exception as e:
+                logger.warning(f"Не удалось подтвердить offset обновлений: {e}")
+        # Шаги остановки SalesBot: аренда, уведомления, фоновые потоки, зеркало
+        await self._offload(core.lifecycle.shutdown)
+        if self.sheets:
+            await self.sheets.close()
+        await self.bot.close_session()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,52 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Маркер промаха: None — допустимое закэшированное значение
+MISSING = object()
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш фиксированного размера со счетчиками попаданий"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Возвращает значение или MISSING при промахе"""
+        with self._lock:
+            value = self._data.get(key, MISSING)
+            if value is MISSING:
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else None,
+            }
+
@@ -0,0 +1,204 @@
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+_NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize_key(name: str) -> str:
+    """Ключ для сравнения: нижний регистр, без пунктуации, одиночные пробелы"""
+    return ' '.join(_NON_WORD_RE.sub(' ', name.lower()).split())
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Левенштейна с отсечкой: при превышении limit возвращает limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            current.append(value)
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+# Одна опечатка на каждые 8 символов (сходство не ниже 7/8): короткие названия
+# ('Криптон' / 'Крипто') и разные слова с общим корнем ('Экономист' / 'Экономика')
+# не склеиваются
+TYPO_SPAN = 8
+MAX_TYPOS = 3
+
+
+def max_typos(key: str) -> int:
+    return min(len(key) // TYPO_SPAN, MAX_TYPOS)
+
+
+class ChannelCatalog:
+    """Справочник каналов с триграммным индексом для исправления опечаток.
+
+    Сначала ищется точное совпадение по алиасам и известным каналам, затем
+    кандидаты из триграммного индекса ранжируются по расстоянию Левенштейна.
+    В файл выученных алиасов попадают только исправления, найденные по
+    частотам колонки каналов таблицы (learn); исправление в отдельной продаже
+    применяется к ней, но не запоминается.
+    """
+
+    MAX_CANDIDATES = 5
+
+    def __init__(self, aliases: Mapping[str, str], learned_path: str):
+        self.learned_path = learned_path
+        self._lock = threading.Lock()
+        # Ключ (алиас или имя канала) -> каноническое имя; по ключам строится индекс
+        self._targets: Dict[str, str] = {}
+        self._index: Dict[str, Set[str]] = defaultdict(set)
+        self._frequency: Counter = Counter()
+        # Каналы, узнанные из таблицы и новых продаж (не из словаря алиасов)
+        self._known: Dict[str, str] = {}
+        self._learned: Dict[str, str] = load_json(learned_path, {})
+        self._aliases: Mapping[str, str] = aliases
+        self._targets, self._index = self._build(aliases)
+
+    def _build(self, aliases: Mapping[str, str]) -> Tuple[Dict[str, str], Dict[str, Set[str]]]:
+        targets: Dict[str, str] = {}
+        index: Dict[str, Set[str]] = defaultdict(set)
+
+        def add(key: str, canonical: str):
+            if not key or key in targets:
+                return
+            targets[key] = canonical
+            for gram in trigrams(key):
+                index[gram].add(key)
+
+        for alias, canonical in aliases.items():
+            add(normalize_key(alias), canonical)
+            add(normalize_key(canonical), canonical)
+        for alias, canonical in self._learned.items():
+            add(alias, canonical)
+            add(normalize_key(canonical), canonical)
+        for key, name in self._known.items():
+            add(key, name)
+        return targets, index
+
+    def replace_aliases(self, aliases: Mapping[str, str]):
+        """Пересобирает индекс под новый словарь алиасов, сохраняя выученное"""
+        with self._lock:
+            self._aliases = aliases
+            targets, index = self._build(aliases)
+            # Индекс читается под блокировкой, словарь точных ключей — без нее
+            self._index = index
+            self._targets = targets
+
+    def reload(self):
+        """Перечитывает выученные алиасы из файла (его мог пополнить другой экземпляр)"""
+        with self._lock:
+            self._learned = load_json(self.learned_path, {})
+            self._targets, self._index = self._build(self._aliases)
+
+    def _add_key_locked(self, key: str, canonical: str):
+        if not key or key in self._targets:
+            return
+        self._targets[key] = canonical
+        for gram in trigrams(key):
+            self._index[gram].add(key)
+
+    def _add_channel_locked(self, key: str, name: str):
+        self._known.setdefault(key, name)
+        self._add_key_locked(key, name)
+
+    def learn(self, names: Iterable[str]):
+        """Учит список каналов (например, колонку I таблицы).
+
+        Имена обрабатываются по убыванию частоты: редкое написание, похожее на
+        уже известный канал, считается опечаткой и становится алиасом.
+        """
+        counts = Counter(n.strip() for n in names if n and n.strip())
+        learned_aliases = 0
+        with self._lock:
+            for name, count in counts.most_common():
+                key = normalize_key(name)
+                if not key:
+                    continue
+                if key in self._targets:
+                    self._frequency[self._targets[key]] += count
+                    continue
+                match = self._fuzzy_locked(key)
+                if match:
+                    self._remember_alias_locked(key, match)
+                    self._frequency[match] += count
+                    learned_aliases += 1
+                else:
+                    self._add_channel_locked(key, name)
+                    self._frequency[name] += count
+            self._save_locked()
+        logger.info(f"Справочник каналов: {len(self._targets)} ключей, новых алиасов из таблицы: {learned_aliases}")
+
+    def resolve(self, name: str, learn: bool = True) -> str:
+        """Возвращает каноническое имя канала или исходное, если канал новый.
+
+        learn=True — новый канал запоминается (в памяти), чтобы опечатки в нем
+        тоже исправлялись; learn=False — только поиск (фильтры запросов,
+        неподтвержденные подсказки).
+        """
+        key = normalize_key(name)
+        if not key:
+            return name
+        canonical = self._targets.get(key)
+        if canonical:
+            return canonical
+        with self._lock:
+            match = self._fuzzy_locked(key)
+            if match:
+                logger.info(f"Канал '{name}' распознан как '{match}'")
+                return match
+            if learn:
+                self._add_channel_locked(key, name)
+        return name
+
+    def _fuzzy_locked(self, key: str) -> Optional[str]:
+        limit = max_typos(key)
+        if not limit:
+            return None
+        shared: Counter = Counter()
+        for gram in trigrams(key):
+            for candidate in self._index.get(gram, ()):
+                shared[candidate] += 1
+        best_name, best_rank = None, None
+        for candidate, _ in shared.most_common(self.MAX_CANDIDATES):
+            distance = edit_distance(key, candidate, limit)
+            if distance > limit:
+                continue
+            name = self._targets[candidate]
+            rank = (distance, -self._frequency[name])
+            if best_rank is None or rank < best_rank:
+                best_name, best_rank = name, rank
+        return best_name
+
+    def _remember_alias_locked(self, key: str, canonical: str):
+        self._add_key_locked(key, canonical)
+        self._learned[key] = canonical
+
+    def _save_locked(self):
+        try:
+            save_json_atomic(self.learned_path, self._learned)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить алиасы каналов: {e}")
+
+    def channels(self) -> List[str]:
+        return sorted(set(self._targets.values()))
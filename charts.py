@@ -0,0 +1,266 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from io import BytesIO
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+# Рендеринг графиков без дисплея; без matplotlib графики просто не предлагаются
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import PercentFormatter
+except Exception:
+    matplotlib = None
+
+# Квантизация палитры PNG — через Pillow (зависимость matplotlib), тоже опционально
+try:
+    from PIL import Image
+except Exception:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+
+
+class ChartVariant(NamedTuple):
+    title: str
+    figsize: Tuple[float, float]
+    panels: Sequence[str]       # панели по порядку: daily_rub, daily_usdt, heatmap, pareto
+    grid: Tuple[int, int]
+    compact: bool = False
+
+
+VARIANTS: Dict[str, ChartVariant] = {
+    'dashboard': ChartVariant('Дэшборд', (12, 8), ('daily_rub', 'daily_usdt', 'heatmap', 'pareto'), (2, 2)),
+    'daily': ChartVariant('По дням', (10, 4), ('daily_rub', 'daily_usdt'), (1, 2)),
+    'heatmap': ChartVariant('Активность', (8, 4), ('heatmap',), (1, 1)),
+    'pareto': ChartVariant('Каналы', (8, 5), ('pareto',), (1, 1)),
+    'thumb': ChartVariant('Мини', (6, 4), ('daily_rub', 'daily_usdt', 'heatmap', 'pareto'), (2, 2), compact=True),
+}
+
+
+class ChartData(NamedTuple):
+    dates: List[str]
+    daily_rub: List[float]
+    daily_usdt: List[float]
+    heat: List[List[int]]
+    channels: List[Tuple[str, float]]
+    reporting_currency: str
+
+
+def available() -> bool:
+    return matplotlib is not None
+
+
+def _parse_float(value) -> float:
+    try:
+        return float(str(value).replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', ''))
+    except ValueError:
+        return 0.0
+
+
+def _parse_hour(value: str) -> int:
+    value = (value or '').strip()
+    if ':' not in value:
+        if len(value) == 4:
+            value = f"{value[:2]}:{value[2:]}"
+        elif len(value) == 3:
+            value = f"0{value[0]}:{value[1:]}"
+    try:
+        return int(value.split(':')[0])
+    except ValueError:
+        return 0
+
+
+def collect_chart_data(rows: Sequence[Sequence], convert: Callable[[float, str, str], float],
+                       reporting_currency: str, top_channels: int = 10) -> ChartData:
+    """Собирает ряды для графиков из строк листа A:J (дата dd.mm.YYYY)"""
+    daily_usdt = defaultdict(float)
+    daily_rub = defaultdict(float)
+    heat = [[0] * 24 for _ in range(7)]
+    channel_revenue = defaultdict(float)
+
+    for r in rows:
+        try:
+            date_str = r[1] if len(r) > 1 else ''
+            amount = _parse_float(r[3] if len(r) > 3 else '')
+            currency = (r[4] if len(r) > 4 else '').strip().upper()
+            channel = (r[8] if len(r) > 8 else '').strip()
+            if amount <= 0 or not date_str:
+                continue
+            day = datetime.strptime(date_str, '%d.%m.%Y')
+
+            if currency == 'USDT':
+                daily_usdt[date_str] += amount
+            elif currency == 'RUB':
+                daily_rub[date_str] += amount
+
+            hour = _parse_hour(r[2] if len(r) > 2 else '')
+            if 0 <= hour <= 23:
+                heat[day.weekday()][hour] += 1
+
+            channel_revenue[channel or '—'] += convert(amount, currency, date_str)
+        except (ValueError, KeyError) as e:
+            logger.debug(f"skip row due to parse error: {e}")
+
+    dates = sorted(set(daily_usdt) | set(daily_rub), key=lambda d: datetime.strptime(d, '%d.%m.%Y'))
+    return ChartData(
+        dates=dates,
+        daily_rub=[daily_rub.get(d, 0) for d in dates],
+        daily_usdt=[daily_usdt.get(d, 0) for d in dates],
+        heat=heat,
+        channels=sorted(channel_revenue.items(), key=lambda kv: kv[1], reverse=True)[:top_channels],
+        reporting_currency=reporting_currency,
+    )
+
+
+def _set_title(ax, title: str, compact: bool):
+    if compact:
+        ax.set_title(title, fontsize=9)
+    else:
+        ax.set_title(title)
+
+
+class _Template:
+    """Заранее построенная фигура варианта: оси создаются один раз, при отрисовке только очищаются"""
+
+    def __init__(self, variant: ChartVariant):
+        self.variant = variant
+        self.figure = Figure(figsize=variant.figsize)
+        FigureCanvasAgg(self.figure)
+        rows, cols = variant.grid
+        # Поля заданы явно: подписи каналов/дат повернуты, в однострочных вариантах им нужно больше места
+        self.figure.subplots_adjust(
+            left=0.12 if variant.compact else 0.08, right=0.92, top=0.9, bottom=0.22 if rows == 1 else 0.12,
+            hspace=0.45 if variant.compact else 0.35, wspace=0.25
+        )
+        axes = self.figure.subplots(rows, cols, squeeze=False).flatten()
+        self.axes = dict(zip(variant.panels, axes))
+        self.colorbar_axis = None
+        self.twin_axis = None
+        if 'heatmap' in self.axes:
+            # Колорбар в своей оси, чтобы повторная отрисовка не сжимала теплокарту
+            ax = self.axes['heatmap']
+            pos = ax.get_position()
+            ax.set_position([pos.x0, pos.y0, pos.width * 0.92, pos.height])
+            self.colorbar_axis = self.figure.add_axes([pos.x0 + pos.width * 0.94, pos.y0, pos.width * 0.03, pos.height])
+        if 'pareto' in self.axes:
+            self.twin_axis = self.axes['pareto'].twinx()
+
+
+class ChartRenderer:
+    """Рендер вариантов графиков /money на переиспользуемых шаблонах фигур.
+
+    Вместо plt.subplots на каждый запрос каждая фигура строится один раз;
+    отрисовка очищает и заполняет ее оси. bbox_inches='tight' не используется
+    (это второй проход отрисовки) — поля заданы в шаблоне. PNG при наличии
+    Pillow сжимается квантизацией палитры до palette_colors цветов.
+    """
+
+    def __init__(self, dpi: int = 110, thumb_dpi: int = 72, palette_colors: int = 64):
+        self.dpi = dpi
+        self.thumb_dpi = thumb_dpi
+        self.palette_colors = palette_colors
+        self._templates: Dict[str, _Template] = {}
+        self._lock = threading.Lock()
+
+    def _template(self, name: str) -> _Template:
+        template = self._templates.get(name)
+        if template is None:
+            template = self._templates[name] = _Template(VARIANTS[name])
+        return template
+
+    def render(self, name: str, data: ChartData, fmt: str = 'png') -> BytesIO:
+        """Рисует вариант и возвращает буфер с PNG или SVG (позиция в начале)"""
+        buf = BytesIO()
+        with self._lock:
+            template = self._template(name)
+            self._draw(template, data)
+            dpi = self.thumb_dpi if template.variant.compact else self.dpi
+            template.figure.savefig(buf, format=fmt, dpi=dpi)
+        if fmt == 'png':
+            buf = self._quantize(buf)
+        buf.seek(0)
+        return buf
+
+    def _quantize(self, buf: BytesIO) -> BytesIO:
+        if not Image or self.palette_colors <= 0:
+            return buf
+        try:
+            buf.seek(0)
+            with Image.open(buf) as image:
+                quantized = image.convert('RGB').quantize(colors=self.palette_colors)
+                out = BytesIO()
+                quantized.save(out, format='PNG', optimize=True)
+            return out
+        except Exception as e:
+            logger.warning(f"Не удалось сжать PNG палитрой: {e}")
+            return buf
+
+    def _draw(self, template: _Template, data: ChartData):
+        variant = template.variant
+        compact = variant.compact
+        if variant.grid == (2, 2) and not compact:
+            template.figure.suptitle('Сводная аналитика', fontsize=14)
+        x = list(range(len(data.dates)))
+        labels = [d[:-5] for d in data.dates]
+        for panel, ax in template.axes.items():
+            ax.cla()
+            if panel == 'daily_rub':
+                self._draw_daily(ax, x, labels, data.daily_rub, 'Выручка по дням (RUB)', '#f28e2b', compact)
+            elif panel == 'daily_usdt':
+                self._draw_daily(ax, x, labels, data.daily_usdt, 'Выручка по дням (USDT)', '#4e79a7', compact)
+            elif panel == 'heatmap':
+                self._draw_heatmap(ax, template.colorbar_axis, data.heat, compact)
+            elif panel == 'pareto':
+                self._draw_pareto(ax, template.twin_axis, data, compact)
+
+    @staticmethod
+    def _draw_daily(ax, x, labels, values, title, color, compact):
+        ax.bar(x, values, color=color)
+        _set_title(ax, title, compact)
+        if compact:
+            ax.set_xticks([])
+        else:
+            ax.set_xticks(x)
+            ax.set_xticklabels(labels, rotation=30)
+
+    @staticmethod
+    def _draw_heatmap(ax, colorbar_axis, heat, compact):
+        im = ax.imshow(heat, aspect='auto', cmap='YlOrRd')
+        _set_title(ax, 'Активность: дни×часы', compact)
+        ax.set_yticks(range(7))
+        ax.set_yticklabels(WEEKDAYS)
+        ax.set_xticks([0, 4, 8, 12, 16, 20, 23])
+        ax.set_xticklabels(['0', '4', '8', '12', '16', '20', '23'])
+        colorbar_axis.cla()
+        ax.figure.colorbar(im, cax=colorbar_axis)
+
+    @staticmethod
+    def _draw_pareto(ax, twin, data: ChartData, compact):
+        twin.cla()
+        # cla() у парной оси сбрасывает расположение шкалы — возвращаем ее вправо
+        twin.yaxis.tick_right()
+        twin.yaxis.set_label_position('right')
+        _set_title(ax, f'Топ-каналы ({data.reporting_currency})', compact)
+        if not data.channels:
+            return
+        x = list(range(len(data.channels)))
+        values = [v for _, v in data.channels]
+        ax.bar(x, values, color='#59a14f')
+        ax.set_xticks(x)
+        ax.set_xticklabels([] if compact else [k for k, _ in data.channels], rotation=30, ha='right')
+        total = sum(values)
+        running = 0
+        cumulative = []
+        for v in values:
+            running += v
+            cumulative.append(running / total * 100 if total > 0 else 0)
+        twin.plot(x, cumulative, color='#e15759', marker='o')
+        twin.yaxis.set_major_formatter(PercentFormatter())
+        twin.set_ylim(0, 105)
+        twin.grid(False)
@@ -0,0 +1,117 @@
+import logging
+from datetime import date, datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from storage import load_json
+
+logger = logging.getLogger(__name__)
+
+
+class CommissionRule(NamedTuple):
+    manager: str                 # username менеджера без @, в нижнем регистре
+    rate: float                  # доля от суммы продажи, например 0.05
+    name: str = ''               # отображаемое имя в отчетах
+    currency: Optional[str] = None       # None — правило для любой валюты
+    valid_from: Optional[date] = None    # None — без нижней границы
+    valid_to: Optional[date] = None      # None — бессрочно
+    sheet_column: Optional[str] = None   # колонка комиссии в итоговом блоке листа (O–R)
+
+
+def _parse_rule_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class CommissionEngine:
+    """Таблица правил комиссий: менеджер, ставка, валюта, период действия.
+
+    Правила загружаются один раз при старте и применяются к каждой продаже
+    в момент записи. Если подходят несколько правил, выигрывает правило
+    с конкретной валютой, затем — с более поздней датой начала.
+
+    У сейлза с колонкой в листе (sheet_column) комиссия за месяц берется из
+    формул таблицы; пока его username не указан (manager пустой), к продажам
+    правило не применяется, а в /money видна только колонка листа.
+    """
+
+    def __init__(self, rules: List[CommissionRule]):
+        self._rules: Dict[str, List[CommissionRule]] = {}
+        self._sheet_rules: List[CommissionRule] = []
+        for rule in rules:
+            if rule.manager:
+                self._rules.setdefault(rule.manager, []).append(rule)
+            if rule.sheet_column:
+                self._sheet_rules.append(rule)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'CommissionEngine':
+        raw = load_json(path, None)
+        if raw is None:
+            logger.warning(f"Файл правил комиссий {path} не найден — комиссии не начисляются")
+            return cls([])
+        rules = []
+        for item in raw:
+            try:
+                manager = str(item.get('manager') or '').lstrip('@')
+                if not manager and not item.get('sheet_column'):
+                    raise ValueError("нужен manager или sheet_column")
+                rules.append(CommissionRule(
+                    manager=manager.lower(),
+                    rate=float(item['rate']),
+                    name=item.get('name') or f"@{manager}",
+                    currency=item['currency'].upper() if item.get('currency') else None,
+                    valid_from=_parse_rule_date(item.get('from')),
+                    valid_to=_parse_rule_date(item.get('to')),
+                    sheet_column=str(item['sheet_column']).upper() if item.get('sheet_column') else None,
+                ))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Пропущено некорректное правило комиссии {item}: {e}")
+        logger.info(f"Загружено правил комиссий: {len(rules)}")
+        return cls(rules)
+
+    def find_rule(self, manager_username: Optional[str], currency: str,
+                  sale_date: Optional[date] = None) -> Optional[CommissionRule]:
+        """Подбирает правило для продажи менеджера в валюте на дату"""
+        if not manager_username:
+            return None
+        candidates = self._rules.get(manager_username.lstrip('@').lower())
+        if not candidates:
+            return None
+        sale_date = sale_date or datetime.now().date()
+        best = None
+        for rule in candidates:
+            if rule.currency and rule.currency != currency:
+                continue
+            if rule.valid_from and sale_date < rule.valid_from:
+                continue
+            if rule.valid_to and sale_date > rule.valid_to:
+                continue
+            key = (rule.currency is not None, rule.valid_from or date.min)
+            if best is None or key > (best.currency is not None, best.valid_from or date.min):
+                best = rule
+        return best
+
+    def rate_for(self, manager_username: Optional[str], currency: str,
+                 sale_date: Optional[date] = None) -> float:
+        rule = self.find_rule(manager_username, currency, sale_date)
+        return rule.rate if rule else 0.0
+
+    def commission_for_sale(self, data: Dict) -> float:
+        """Комиссия по распарсенной продаже (дата в формате dd.mm.YYYY)"""
+        try:
+            sale_date = datetime.strptime(data['date'], '%d.%m.%Y').date()
+        except (KeyError, TypeError, ValueError):
+            sale_date = None
+        rate = self.rate_for(data.get('manager_username'), data['currency'], sale_date)
+        return float(data['amount']) * rate
+
+    def sheet_rules(self) -> List[CommissionRule]:
+        """Сейлзы с колонкой комиссии в листе, в порядке файла правил"""
+        return list(self._sheet_rules)
+
+    def display_name(self, manager_username: str) -> str:
+        rules = self._rules.get(manager_username.lstrip('@').lower())
+        if rules and rules[0].name:
+            return rules[0].name
+        return f"@{manager_username}"
@@ -29,3 +29,132 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
 # ID чата для пересылки уведомлений о продажах
 NOTIFICATION_CHAT_ID = os.getenv("NOTIFICATION_CHAT_ID", "")
+
+# Каталог для локального состояния бота (агрегаты, отметки отчетов и т.п.)
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Файл с агрегатами продаж по дням (источник для периодических отчетов)
+AGGREGATES_FILE = os.getenv("AGGREGATES_FILE", os.path.join(DATA_DIR, "aggregates.json"))
+
+# Периодические отчеты в NOTIFICATION_CHAT_ID (ежедневный, еженедельный, ежемесячный)
+REPORTS_ENABLED = os.getenv("REPORTS_ENABLED", "true").lower() in ['true', '1', 'yes']
+REPORT_HOUR = int(os.getenv("REPORT_HOUR", "9"))
+REPORT_TOP_CHANNELS = int(os.getenv("REPORT_TOP_CHANNELS", "5"))
+REPORT_STATE_FILE = os.getenv("REPORT_STATE_FILE", os.path.join(DATA_DIR, "report_state.json"))
+
+# Очередь уведомлений: NOTIFICATION_CHAT_ID может содержать несколько получателей через запятую
+# (например "-100123#45,-100678"); продажи в пределах окна склеиваются в одно сообщение
+NOTIFICATION_COALESCE_SECONDS = float(os.getenv("NOTIFICATION_COALESCE_SECONDS", "3"))
+NOTIFICATION_MAX_RETRIES = int(os.getenv("NOTIFICATION_MAX_RETRIES", "5"))
+
+# Таблица правил комиссий менеджеров (JSON: manager, name, rate, currency, from, to)
+COMMISSION_RULES_FILE = os.getenv("COMMISSION_RULES_FILE", "commission_rules.json")
+
+# Выученные алиасы каналов (исправленные опечатки), дополняют словарь в коде
+CHANNEL_ALIASES_FILE = os.getenv("CHANNEL_ALIASES_FILE", os.path.join(DATA_DIR, "channel_aliases.json"))
+
+# Словари алиасов (каналы, типы оплаты, внешняя/внутренняя, триггеры комментария);
+# файл перечитывается при изменении, проверка раз в ALIASES_RELOAD_SECONDS (0 — выключено)
+ALIASES_FILE = os.getenv("ALIASES_FILE", "aliases.json")
+ALIASES_RELOAD_SECONDS = float(os.getenv("ALIASES_RELOAD_SECONDS", "30"))
+
+# Кэш результатов парсинга и минимальный интервал подсказок о неверном формате (на чат)
+PARSE_CACHE_SIZE = int(os.getenv("PARSE_CACHE_SIZE", "256"))
+PARSE_ERROR_REPLY_INTERVAL = float(os.getenv("PARSE_ERROR_REPLY_INTERVAL", "60"))
+
+# Индекс "сообщение Telegram -> строка таблицы" для обработки правок сообщений
+MESSAGE_INDEX_FILE = os.getenv("MESSAGE_INDEX_FILE", os.path.join(DATA_DIR, "message_index.json"))
+
+# Локальное SQLite-зеркало продаж и интервал фоновой сверки с таблицей (0 — выключено)
+LEDGER_FILE = os.getenv("LEDGER_FILE", os.path.join(DATA_DIR, "ledger.sqlite3"))
+LEDGER_RECONCILE_SECONDS = float(os.getenv("LEDGER_RECONCILE_SECONDS", "600"))
+# Сколько последних месяцев (включая текущий) сверять в фоне: поздние правки прошлого месяца
+LEDGER_RECONCILE_MONTHS = int(os.getenv("LEDGER_RECONCILE_MONTHS", "2"))
+
+# Курсы валют по дням (JSON: {"USDT": {"YYYY-MM-DD": курс в RUB}}) и валюта сводных итогов;
+# для дат до начала таблицы и без файла используется USDT_RUB_RATE
+RATES_FILE = os.getenv("RATES_FILE", "rates.json")
+USDT_RUB_RATE = float(os.getenv("USDT_RUB_RATE", "95"))
+REPORTING_CURRENCY = os.getenv("REPORTING_CURRENCY", "RUB").upper()
+
+# Выгрузка /export: строк на пачку чтения и порог (байт), после которого файл уходит из памяти на диск
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(4 * 1024 * 1024)))
+
+# Графики /money: dpi полного и мини-варианта, число цветов палитры PNG (0 — без квантизации)
+# и кнопка выгрузки графика в SVG
+CHART_DPI = int(os.getenv("CHART_DPI", "110"))
+CHART_THUMB_DPI = int(os.getenv("CHART_THUMB_DPI", "72"))
+CHART_PALETTE_COLORS = int(os.getenv("CHART_PALETTE_COLORS", "64"))
+CHART_SVG_ENABLED = os.getenv("CHART_SVG_ENABLED", "false").lower() in ['true', '1', 'yes']
+
+# Выбор листа в /money: сколько секунд кэшируется список листов и кнопок на странице
+WORKSHEET_INDEX_TTL = float(os.getenv("WORKSHEET_INDEX_TTL", "300"))
+MONTH_PICKER_PAGE_SIZE = int(os.getenv("MONTH_PICKER_PAGE_SIZE", "9"))
+
+# Плавная остановка (SIGTERM при деплое): общий дедлайн на дренаж обработчиков и уведомлений;
+# не успевшие уйти уведомления сохраняются в файл и отправляются после рестарта
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+NOTIFICATION_SPOOL_FILE = os.getenv("NOTIFICATION_SPOOL_FILE", os.path.join(DATA_DIR, "pending_notifications.json"))
+
+# Единственный активный экземпляр: file — flock на файле (один хост/том), sheet — аренда
+# в служебном листе таблицы (реплики на разных машинах), none — без блокировки.
+# Резервные экземпляры ждут и перехватывают аренду, если ведущий не продлил ее за INSTANCE_LOCK_TTL
+INSTANCE_LOCK = os.getenv("INSTANCE_LOCK", "file").lower()
+INSTANCE_LOCK_FILE = os.getenv("INSTANCE_LOCK_FILE", os.path.join(DATA_DIR, "instance.lock"))
+INSTANCE_LOCK_TTL = float(os.getenv("INSTANCE_LOCK_TTL", "30"))
+
+# Последний обработанный update_id (сохраняется по мере обработки); после рестарта бот
+# догоняет пропущенные обновления пачками по REPLAY_BATCH_SIZE с пакетной записью в таблицу
+UPDATE_OFFSET_FILE = os.getenv("UPDATE_OFFSET_FILE", os.path.join(DATA_DIR, "update_offset.json"))
+REPLAY_BATCH_SIZE = int(os.getenv("REPLAY_BATCH_SIZE", "100"))
+
+# Режим работы: sync — TeleBot с пулом потоков; async — AsyncTeleBot, продажи пишутся в таблицу
+# через асинхронный клиент Sheets (пул HTTP-соединений), остальные команды — в пуле ASYNC_WORKERS потоков
+BOT_MODE = os.getenv("BOT_MODE", "sync").lower()
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "8"))
+SHEETS_HTTP_POOL_SIZE = int(os.getenv("SHEETS_HTTP_POOL_SIZE", "20"))
+
+# Команды (несколько таблиц в одном процессе): чат -> таблица, шаблон листа, получатели, алиасы.
+# Бюджет записей в Sheets на команду в минуту (квота Sheets API — 60 запросов в минуту на пользователя)
+TENANTS_FILE = os.getenv("TENANTS_FILE", "tenants.json")
+SHEETS_REQUESTS_PER_MINUTE = float(os.getenv("SHEETS_REQUESTS_PER_MINUTE", "60"))
+
+# Администраторы (Telegram user id через запятую): им доступна команда /profile
+ADMIN_USER_IDS = {int(x) for x in os.getenv("ADMIN_USER_IDS", "").replace(' ', '').split(',') if x}
+
+# /profile: сколько вызовов обработчиков профилировать (по умолчанию и максимум), период сэмплов и каталог
+PROFILE_DEFAULT_COUNT = int(os.getenv("PROFILE_DEFAULT_COUNT", "5"))
+PROFILE_MAX_COUNT = int(os.getenv("PROFILE_MAX_COUNT", "50"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# Эндпоинты /healthz и /readyz (0 — выключены; на Railway порт приходит в PORT).
+# Polling считается зависшим, если getUpdates не возвращался дольше HEALTH_POLL_STALE_SECONDS;
+# доступ к таблице проверяется запросом метаданных не чаще раза в HEALTH_SHEETS_PROBE_TTL секунд
+HEALTH_PORT = int(os.getenv("HEALTH_PORT", os.getenv("PORT", "0")))
+HEALTH_POLL_STALE_SECONDS = float(os.getenv("HEALTH_POLL_STALE_SECONDS", "90"))
+HEALTH_SHEETS_PROBE_TTL = float(os.getenv("HEALTH_SHEETS_PROBE_TTL", "60"))
+
+# Проверка необычных продаж (лишний ноль, не та валюта) до записи в таблицу.
+# Модель — скользящие среднее/разброс log(суммы) по каналу и формату и доли валют канала:
+# ANOMALY_ALPHA — вес новой продажи, ANOMALY_THRESHOLD — порог отклонения в сигмах,
+# ANOMALY_MIN_SAMPLES — сколько продаж нужно ключу, прежде чем его проверять
+ANOMALY_CHECK_ENABLED = os.getenv("ANOMALY_CHECK_ENABLED", "true").lower() in ['true', '1', 'yes']
+ANOMALY_STATS_FILE = os.getenv("ANOMALY_STATS_FILE", os.path.join(DATA_DIR, "sales_stats.json"))
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))
+ANOMALY_THRESHOLD = float(os.getenv("ANOMALY_THRESHOLD", "3"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "8"))
+ANOMALY_PENDING_TTL = float(os.getenv("ANOMALY_PENDING_TTL", "3600"))
+# Неподтвержденные продажи сохраняются при остановке и восстанавливаются ведущим
+PENDING_SALES_FILE = os.getenv("PENDING_SALES_FILE", os.path.join(DATA_DIR, "pending_sales.json"))
+
+# Разбор нераспознанных продаж по полям: что найдено, что нет, и исправленная строка
+# с кнопкой «Принять». SUGGESTION_MIN_FIELDS — сколько полей должно найтись, чтобы
+# вместо общей подсказки показать разбор; поля с уверенностью ниже
+# SUGGESTION_SURE_CONFIDENCE помечаются как догадка
+PARSE_SUGGESTIONS_ENABLED = os.getenv("PARSE_SUGGESTIONS_ENABLED", "true").lower() in ['true', '1', 'yes']
+SUGGESTION_MIN_FIELDS = int(os.getenv("SUGGESTION_MIN_FIELDS", "3"))
+SUGGESTION_SURE_CONFIDENCE = float(os.getenv("SUGGESTION_SURE_CONFIDENCE", "0.9"))
+SUGGESTION_TTL = float(os.getenv("SUGGESTION_TTL", "3600"))
+PENDING_SUGGESTIONS_FILE = os.getenv("PENDING_SUGGESTIONS_FILE", os.path.join(DATA_DIR, "pending_suggestions.json"))
@@ -0,0 +1,111 @@
+import re
+from datetime import date
+from typing import Dict, Optional
+
+# Названия месяцев для заголовков листов ('{month} {year}' -> 'Ноябрь 2025')
+MONTH_NAMES = ['Январь', 'Февраль', 'Март', 'Апрель', 'Май', 'Июнь',
+               'Июль', 'Август', 'Сентябрь', 'Октябрь', 'Ноябрь', 'Декабрь']
+
+# Формы месяца, встречающиеся в продажах: именительный, родительный, предложный
+# падежи и сокращения ('12 декабря', '12 дек.', '12 сент', 'в декабре')
+_MONTH_WORDS = (
+    ('январь', 'января', 'январе', 'янв'),
+    ('февраль', 'февраля', 'феврале', 'фев', 'февр'),
+    ('март', 'марта', 'марте', 'мар'),
+    ('апрель', 'апреля', 'апреле', 'апр'),
+    ('май', 'мая', 'мае'),
+    ('июнь', 'июня', 'июне', 'июн'),
+    ('июль', 'июля', 'июле', 'июл'),
+    ('август', 'августа', 'августе', 'авг'),
+    ('сентябрь', 'сентября', 'сентябре', 'сен', 'сент'),
+    ('октябрь', 'октября', 'октябре', 'окт'),
+    ('ноябрь', 'ноября', 'ноябре', 'ноя', 'нояб'),
+    ('декабрь', 'декабря', 'декабре', 'дек'),
+)
+
+
+def _build_month_lookup() -> Dict[str, int]:
+    """Слово -> номер месяца: все формы и их начала от трех букв ('сентяб', 'декаб').
+
+    Начало, общее для разных месяцев, не попадает в таблицу, так что поиск —
+    один доступ к словарю без перебора вариантов.
+    """
+    lookup: Dict[str, int] = {}
+    ambiguous = set()
+    for number, words in enumerate(_MONTH_WORDS, start=1):
+        for word in words:
+            for end in range(3, len(word) + 1):
+                prefix = word[:end]
+                if lookup.get(prefix, number) != number:
+                    ambiguous.add(prefix)
+                lookup[prefix] = number
+    for prefix in ambiguous:
+        del lookup[prefix]
+    return lookup
+
+
+MONTH_LOOKUP = _build_month_lookup()
+
+# Насколько вперед может быть дата продажи без года (анонс размещения на ближайшие недели)
+MAX_FUTURE_DAYS = 60
+
+# 14.05, 14/05, 14-05
+NUMERIC_DATE_RE = re.compile(r'^(\d{1,2})[./-](\d{1,2})$')
+# 12 декабря, 12 дек.
+WORD_DATE_RE = re.compile(r'^(\d{1,2})\s+([а-яё]+)\.?$', re.IGNORECASE)
+
+
+def month_number(word: str) -> Optional[int]:
+    """Номер месяца по слову; None — слово не похоже на месяц (а не январь по умолчанию)"""
+    return MONTH_LOOKUP.get(word.strip().rstrip('.').lower().replace('ё', 'е'))
+
+
+def title_month(title: str) -> Optional[int]:
+    """Номер месяца по названию листа ('Ноябрь', 'Продажи ноябрь 2025'); None — месяца в названии нет"""
+    for word in re.findall(r'[а-яё]+', (title or '').lower()):
+        month = month_number(word)
+        if month:
+            return month
+    return None
+
+
+def resolve_year(day: int, month: int, today: Optional[date] = None) -> Optional[date]:
+    """Ближайшая к сегодняшнему дню дата с таким днем и месяцем, не дальше MAX_FUTURE_DAYS вперед.
+
+    Год в продажах не пишут, поэтому выбираем из прошлого, текущего и
+    следующего года: '30.12', присланное 2 января, — прошлый год, '03.01',
+    присланное 30 декабря, — следующий. Продажи пишут задним числом, поэтому
+    будущее допускается только близкое: '15.06', присланное 20 декабря, — июнь
+    этого года, а не следующего. При равном удалении берется прошлая дата.
+    None — подходящей даты нет (31.04, 29.02 вне високосного года).
+    """
+    today = today or date.today()
+    candidates = []
+    for year in (today.year - 1, today.year, today.year + 1):
+        try:
+            candidate = date(year, month, day)
+        except ValueError:
+            continue
+        if (candidate - today).days <= MAX_FUTURE_DAYS:
+            candidates.append(candidate)
+    if not candidates:
+        return None
+    return min(candidates, key=lambda d: (abs((d - today).days), d > today))
+
+
+def parse_sale_date(text: str, today: Optional[date] = None) -> Optional[date]:
+    """Дата продажи из '14.05', '14/05', '14-05' или '12 декабря'; None — дата невозможна"""
+    text = (text or '').strip()
+    match = NUMERIC_DATE_RE.match(text)
+    if match:
+        day, month = int(match.group(1)), int(match.group(2))
+    else:
+        match = WORD_DATE_RE.match(text)
+        if not match:
+            return None
+        day, month = int(match.group(1)), month_number(match.group(2))
+        if month is None:
+            return None
+    if not 1 <= month <= 12:
+        return None
+    return resolve_year(day, month, today)
@@ -0,0 +1,204 @@
+import re
+from datetime import date, datetime
+from typing import Collection, Dict, List, NamedTuple, Optional
+
+from dates import month_number, parse_sale_date
+
+# Допустимые форматы размещения (см. SalesBot._validate_format)
+VALID_FORMATS = ('1/24', '1/48')
+
+# Обозначения валют -> код валюты в таблице
+CURRENCY_CODES = {
+    'р': 'RUB', 'руб': 'RUB', 'рублей': 'RUB', 'рубля': 'RUB', '₽': 'RUB', 'rub': 'RUB',
+    'usdt': 'USDT', 'юсдт': 'USDT', '$': 'USDT', 'usd': 'USDT',
+}
+
+# Поля, без которых продажу не записать
+REQUIRED_FIELDS = ('manager', 'date', 'time', 'amount', 'channel')
+
+FIELD_TITLES = {
+    'manager': 'Менеджер', 'date': 'Дата', 'time': 'Время', 'amount': 'Сумма',
+    'format': 'Формат', 'payment_type': 'Тип оплаты', 'internal_external': 'Внешняя/внутренняя',
+    'channel': 'Канал',
+}
+
+_CURRENCY = '|'.join(re.escape(c) for c in sorted(CURRENCY_CODES, key=len, reverse=True))
+AMOUNT_RE = re.compile(rf'^(\d+(?:[.,]\d+)?)({_CURRENCY})\.?$', re.IGNORECASE)
+PREFIX_AMOUNT_RE = re.compile(r'^\$(\d+(?:[.,]\d+)?)$')
+NUMBER_RE = re.compile(r'^\d+(?:[.,]\d+)?$')
+DATE_RE = re.compile(r'^(\d{1,2})[./-](\d{1,2})(?:[./-](\d{2}|\d{4}))?\.?$')
+TIME_RE = re.compile(r'^(\d{1,2})[:.](\d{2})$')
+COMPACT_TIME_RE = re.compile(r'^\d{3,4}$')
+FORMAT_RE = re.compile(r'^(\d{1,2})/(\d{1,3})(?:ч|h)?$', re.IGNORECASE)
+WORD_RE = re.compile(r'^[a-zа-яё]+$', re.IGNORECASE)
+
+
+class FieldMatch(NamedTuple):
+    value: object
+    confidence: float   # 1.0 — точно, меньше — догадка, 0 — найдено, но некорректно
+    raw: str
+    note: str = ''
+
+
+class SaleDiagnosis:
+    """Что удалось извлечь из нераспознанного сообщения, с уверенностью по каждому полю"""
+
+    def __init__(self, fields: Dict[str, FieldMatch]):
+        self.fields = fields
+
+    def problems(self) -> List[str]:
+        """Поля, которые не найдены или некорректны"""
+        problems = [name for name in REQUIRED_FIELDS if name not in self.fields]
+        problems += [name for name, match in self.fields.items() if match.confidence <= 0]
+        return problems
+
+    @property
+    def found(self) -> int:
+        return sum(1 for match in self.fields.values() if match.confidence > 0)
+
+    def complete(self) -> bool:
+        return not self.problems()
+
+    def sale_data(self) -> Dict:
+        """Продажа в формате результата парсера (канал — как написан, без алиасов)"""
+        value = lambda name: self.fields[name].value if name in self.fields else ''
+        amount, currency = value('amount')
+        return {
+            'manager': value('manager'),
+            'date': value('date').strftime('%d.%m.%Y'),
+            'time': value('time'),
+            'amount': amount,
+            'currency': currency,
+            'payment_type': value('payment_type'),
+            'format': value('format'),
+            'internal_external': value('internal_external'),
+            'channel': value('channel'),
+            'comment': '',
+        }
+
+
+def format_sale_line(data: Dict) -> str:
+    """Продажа одной строкой: все поля, которые будут записаны, в порядке полного шаблона парсера"""
+    currency = 'р' if data['currency'] == 'RUB' else 'usdt'
+    parts = [data['manager'], data['date'][:5], data['time'], f"{data['amount']:g}{currency}"]
+    parts += [data[name] for name in ('payment_type', 'format', 'internal_external') if data.get(name)]
+    parts.append(data['channel'])
+    if data.get('comment'):
+        parts += ['/', data['comment']]
+    return ' '.join(str(part) for part in parts)
+
+
+def _time_value(hours: int, minutes: int) -> Optional[str]:
+    if hours < 24 and minutes < 60:
+        return f"{hours:02d}:{minutes:02d}"
+    return None
+
+
+def diagnose_sale(text: str, today: Optional[date] = None, payment_types: Collection[str] = (),
+                  internal_external: Collection[str] = ()) -> SaleDiagnosis:
+    """Разбор сообщения по полям независимо друг от друга.
+
+    В отличие от шаблонов парсера, порядок полей и пропуски не важны: каждое
+    слово проверяется на сумму, дату, время, формат и словарные значения, а
+    что осталось после последнего найденного поля — канал. payment_types и
+    internal_external — известные варианты (ключи словарей алиасов, в нижнем
+    регистре).
+    """
+    today = today or datetime.now().date()
+    tokens = [t.strip(',;') for t in text.split()]
+    tokens = [t for t in tokens if t]
+    fields: Dict[str, FieldMatch] = {}
+    used = set()
+
+    def take(name: str, index: int, match: FieldMatch, width: int = 1):
+        if name not in fields or fields[name].confidence < match.confidence:
+            fields[name] = match
+            used.update(range(index, index + width))
+
+    # Менеджер: @ник или «Имя Фамилия» в начале
+    if tokens and tokens[0].startswith('@') and len(tokens[0]) > 1:
+        take('manager', 0, FieldMatch(tokens[0], 1.0, tokens[0]))
+    elif (len(tokens) >= 2 and WORD_RE.match(tokens[0]) and WORD_RE.match(tokens[1])
+          and month_number(tokens[1]) is None and tokens[1].lower() not in CURRENCY_CODES):
+        take('manager', 0, FieldMatch(f"{tokens[0]} {tokens[1]}", 0.8, f"{tokens[0]} {tokens[1]}"), width=2)
+
+    for i, token in enumerate(tokens):
+        if i in used:
+            continue
+        lowered = token.lower()
+        following = tokens[i + 1].lower().rstrip('.') if i + 1 < len(tokens) else ''
+
+        match = AMOUNT_RE.match(lowered) or PREFIX_AMOUNT_RE.match(lowered)
+        if match:
+            currency = CURRENCY_CODES[match.group(2)] if match.re is AMOUNT_RE else 'USDT'
+            amount = float(match.group(1).replace(',', '.'))
+            take('amount', i, FieldMatch((amount, currency), 1.0, token))
+            continue
+        if NUMBER_RE.match(lowered) and following in CURRENCY_CODES:
+            # «500 р» — сумма и валюта раздельно
+            amount = float(lowered.replace(',', '.'))
+            take('amount', i, FieldMatch((amount, CURRENCY_CODES[following]), 0.9, f"{token} {tokens[i + 1]}"), width=2)
+            continue
+
+        match = FORMAT_RE.match(lowered)
+        if match and match.group(1) == '1' and int(match.group(2)) >= 13:
+            value = f"1/{int(match.group(2))}"
+            if value in VALID_FORMATS:
+                take('format', i, FieldMatch(value, 1.0 if value == lowered else 0.8, token))
+            else:
+                take('format', i, FieldMatch(value, 0.0, token, f"допустимы {', '.join(VALID_FORMATS)}"))
+            continue
+
+        match = DATE_RE.match(lowered)
+        if match and 'date' not in fields:
+            parsed = parse_sale_date(f"{match.group(1)}.{match.group(2)}", today)
+            if parsed:
+                take('date', i, FieldMatch(parsed, 0.9 if match.group(3) or lowered.endswith('.') else 1.0, token))
+                continue
+            # '17.30' — не дата, а время через точку; '31.04' — ни то, ни другое
+            as_time = TIME_RE.match(lowered)
+            if not as_time or not _time_value(int(as_time.group(1)), int(as_time.group(2))):
+                take('date', i, FieldMatch(None, 0.0, token, 'такой даты нет'))
+                continue
+        if lowered.isdigit() and len(lowered) <= 2 and following and month_number(following):
+            parsed = parse_sale_date(f"{lowered} {following}", today)
+            if parsed:
+                take('date', i, FieldMatch(parsed, 1.0, f"{token} {tokens[i + 1]}"), width=2)
+            else:
+                take('date', i, FieldMatch(None, 0.0, f"{token} {tokens[i + 1]}", 'такой даты нет'), width=2)
+            continue
+
+        match = TIME_RE.match(lowered)
+        if match:
+            value = _time_value(int(match.group(1)), int(match.group(2)))
+            if value:
+                take('time', i, FieldMatch(value, 1.0 if ':' in lowered else 0.7, token))
+            else:
+                take('time', i, FieldMatch(None, 0.0, token, 'такого времени нет'))
+            continue
+        if COMPACT_TIME_RE.match(lowered) and 'time' not in fields:
+            value = _time_value(int(lowered[:-2]), int(lowered[-2:]))
+            if value:
+                take('time', i, FieldMatch(value, 0.8, token))
+                continue
+
+        if lowered in payment_types and 'payment_type' not in fields:
+            take('payment_type', i, FieldMatch(token, 1.0, token))
+            continue
+        if lowered in internal_external and 'internal_external' not in fields:
+            take('internal_external', i, FieldMatch(token, 1.0, token))
+            continue
+
+    # Канал — то, что осталось после последнего найденного поля; остаток из середины — догадка
+    if used:
+        last = max(used)
+        tail = [t for i, t in enumerate(tokens) if i > last]
+        rest = [t for i, t in enumerate(tokens) if i not in used]
+        if tail:
+            channel = ' '.join(tail)
+            fields['channel'] = FieldMatch(channel, 0.9, channel)
+        elif rest:
+            channel = ' '.join(rest)
+            fields['channel'] = FieldMatch(channel, 0.5, channel)
+
+    return SaleDiagnosis(fields)
@@ -0,0 +1,90 @@
+import csv
+import gzip
+import io
+import logging
+from tempfile import SpooledTemporaryFile
+from typing import List, Tuple
+
+from ledger import SALE_COLUMNS, SalesLedger, from_iso_date
+from query import SalesQuery
+
+# Parquet — опционально, только если установлен pyarrow
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = SALE_COLUMNS + ['amount_normalized', 'manager_username', 'commission', 'sheet', 'row']
+
+EXPORT_HELP = """📤 <b>Выгрузка продаж</b>
+
+<code>/export [csv|parquet] [фильтры]</code>
+
+Фильтры те же, что в /query (period:, from:, to:, @username, channel:, currency: …).
+Команда доступна только администраторам (ADMIN_USER_IDS).
+
+<b>Примеры:</b>
+• <code>/export period:lastmonth</code>
+• <code>/export parquet from:01.01.2025 to:31.12.2025</code>"""
+
+
+def export_formats() -> List[str]:
+    return ['csv', 'parquet'] if pa else ['csv']
+
+
+def _select(query: SalesQuery) -> Tuple[str, List]:
+    where = ' AND '.join(query.where) if query.where else '1'
+    sql = f"SELECT {', '.join(EXPORT_COLUMNS)} FROM sales WHERE {where} ORDER BY date, time, sheet, row"
+    return sql, list(query.params)
+
+
+def write_csv_gz(ledger: SalesLedger, query: SalesQuery, chunk_size: int = 1000,
+                 spool_bytes: int = 4 * 1024 * 1024) -> Tuple[SpooledTemporaryFile, int]:
+    """CSV (UTF-8 с BOM для Excel), сжатый gzip на лету.
+
+    Строки читаются из зеркала пачками и сразу пишутся в сжатый поток; файл
+    держится в памяти до spool_bytes, дальше — во временном файле на диске.
+    Возвращает (файл, позиционированный в начало, число строк).
+    """
+    output = SpooledTemporaryFile(max_size=spool_bytes)
+    rows_written = 0
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+        text = io.TextIOWrapper(compressed, encoding='utf-8-sig', newline='')
+        writer = csv.writer(text)
+        writer.writerow(EXPORT_COLUMNS)
+        sql, params = _select(query)
+        for chunk in ledger.iter_chunks(sql, params, chunk_size):
+            for r in chunk:
+                values = [r[c] if r[c] is not None else '' for c in EXPORT_COLUMNS]
+                values[1] = from_iso_date(r['date'])
+                writer.writerow(values)
+            rows_written += len(chunk)
+        text.flush()
+        text.detach()
+    output.seek(0)
+    return output, rows_written
+
+
+def write_parquet(ledger: SalesLedger, query: SalesQuery, chunk_size: int = 1000,
+                  spool_bytes: int = 4 * 1024 * 1024) -> Tuple[SpooledTemporaryFile, int]:
+    """Parquet (сжатие zstd внутри файла), по одной группе строк на пачку чтения"""
+    if not pa:
+        raise RuntimeError("pyarrow не установлен")
+    schema = pa.schema([
+        (c, pa.float64() if c in ('amount', 'amount_normalized', 'commission') else
+         pa.int64() if c == 'row' else pa.string())
+        for c in EXPORT_COLUMNS
+    ])
+    output = SpooledTemporaryFile(max_size=spool_bytes)
+    rows_written = 0
+    sql, params = _select(query)
+    with pq.ParquetWriter(output, schema, compression='zstd') as writer:
+        for chunk in ledger.iter_chunks(sql, params, chunk_size):
+            columns = {c: [r[c] for r in chunk] for c in EXPORT_COLUMNS}
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows_written += len(chunk)
+    output.seek(0)
+    return output, rows_written
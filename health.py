@@ -0,0 +1,127 @@
+import functools
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat:
+    """Отметка последнего успешного getUpdates — признак живого цикла polling"""
+
+    def __init__(self):
+        self.started = time.time()
+        self._last: Optional[float] = None
+
+    def beat(self):
+        self._last = time.time()
+
+    def age(self) -> Optional[float]:
+        return None if self._last is None else time.time() - self._last
+
+    def wrap(self, bot):
+        """Оборачивает bot.get_updates (TeleBot вызывает его через атрибут экземпляра)"""
+        get_updates = bot.get_updates
+
+        @functools.wraps(get_updates)
+        def wrapper(*args, **kwargs):
+            updates = get_updates(*args, **kwargs)
+            self.beat()
+            return updates
+        bot.get_updates = wrapper
+
+    def wrap_async(self, bot):
+        get_updates = bot.get_updates
+
+        @functools.wraps(get_updates)
+        async def wrapper(*args, **kwargs):
+            updates = await get_updates(*args, **kwargs)
+            self.beat()
+            return updates
+        bot.get_updates = wrapper
+
+
+class CachedProbe:
+    """Проверка зависимости, результат которой кэшируется на ttl секунд.
+
+    Одновременные запросы /readyz не порождают параллельных проверок: пока одна
+    идет, остальные ждут ее результата.
+    """
+
+    def __init__(self, check: Callable[[], None], ttl: float = 60.0):
+        self.check = check
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._result: Optional[Dict] = None
+
+    def status(self) -> Dict:
+        with self._lock:
+            if self._result is None or time.time() - self._result['checked_at'] >= self.ttl:
+                started = time.perf_counter()
+                try:
+                    self.check()
+                    self._result = {'ok': True, 'error': None}
+                except Exception as e:
+                    self._result = {'ok': False, 'error': str(e)[:200]}
+                self._result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+                self._result['checked_at'] = time.time()
+            result = dict(self._result)
+        result['age'] = round(time.time() - result.pop('checked_at'), 1)
+        return result
+
+
+class HealthServer:
+    """HTTP-эндпоинты /healthz (процесс и polling живы) и /readyz (готов писать продажи).
+
+    report() возвращает словарь с ключами live и ready и подробностями; код
+    ответа — 200 или 503, тело — сам словарь в JSON.
+    """
+
+    def __init__(self, port: int, report: Callable[[], Dict], host: str = '0.0.0.0'):
+        self.port = port
+        self.host = host
+        self.report = report
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._server:
+            return
+        report = self.report
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path not in ('/healthz', '/readyz'):
+                    self.send_error(404)
+                    return
+                try:
+                    body = report()
+                    ok = body['live'] if path == '/healthz' else body['ready']
+                except Exception as e:
+                    logger.error(f"Ошибка проверки состояния: {e}")
+                    body, ok = {'error': str(e)}, False
+                payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+                self.send_response(200 if ok else 503)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(f"health: {format % args}")
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='health-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Эндпоинты состояния на порту {self.port}: /healthz, /readyz")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
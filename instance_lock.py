@@ -0,0 +1,218 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+# flock есть только на POSIX; без него файловая блокировка не работает
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Служебный лист с арендой в таблице продаж
+LEASE_SHEET_TITLE = '_instance_lease'
+
+
+def instance_id() -> str:
+    """Идентификатор экземпляра: реплика Railway (если есть), хост, pid и случайный суффикс"""
+    replica = os.getenv('RAILWAY_REPLICA_ID', '')
+    base = f"{replica or socket.gethostname()}:{os.getpid()}"
+    return f"{base}:{uuid.uuid4().hex[:6]}"
+
+
+class NoLease:
+    """INSTANCE_LOCK=none: блокировка всегда свободна"""
+
+    def acquire(self) -> bool:
+        return True
+
+    def renew(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+
+class FileLease:
+    """Эксклюзивная блокировка файла (flock) — один экземпляр на хосте/томе.
+
+    Держится, пока открыт дескриптор; процесс, умерший без release, отпускает
+    ее автоматически.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        if fcntl is None:
+            logger.warning("fcntl недоступен — файловая блокировка экземпляра отключена")
+            return True
+        if self._file:
+            return True
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        handle = open(self.path, 'a+')
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        handle.seek(0)
+        handle.truncate()
+        handle.write(f"{os.getpid()}\n")
+        handle.flush()
+        self._file = handle
+        return True
+
+    def renew(self) -> bool:
+        return self._file is not None or fcntl is None
+
+    def release(self):
+        if self._file:
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._file.close()
+                self._file = None
+
+
+class SheetLease:
+    """Аренда в служебном листе таблицы: строка (владелец, истекает_в, отметка).
+
+    Таблица — единственное хранилище, общее для реплик на разных машинах.
+    Атомарного compare-and-set у Sheets нет, поэтому захват — запись и
+    повторное чтение через confirm_delay секунд: из двух одновременно
+    записавших останется тот, чья запись последняя.
+    """
+
+    def __init__(self, worksheet: Callable[[], object], holder: str, ttl: float = 30.0,
+                 confirm_delay: float = 1.5):
+        self.worksheet = worksheet
+        self.holder = holder
+        self.ttl = ttl
+        self.confirm_delay = confirm_delay
+        self._last_renewed: Optional[float] = None
+
+    def _read(self):
+        # Неформатированное значение: в таблице с русской локалью форматированное
+        # число приходит как '1760000000,5', и срок аренды читался бы как истекший
+        values = self.worksheet().get('A2:B2', value_render_option='UNFORMATTED_VALUE')
+        if not values or not values[0]:
+            return '', 0.0
+        row = values[0] + ['']
+        try:
+            expires_at = float(str(row[1] or 0).replace(',', '.'))
+        except ValueError:
+            logger.warning(f"Некорректный срок аренды в листе {LEASE_SHEET_TITLE}: {row[1]!r}")
+            expires_at = 0.0
+        return str(row[0]), expires_at
+
+    def _write(self, holder: str, expires_at: float):
+        # Срок — целые секунды: без дробной части локаль таблицы на запись не влияет
+        self.worksheet().update('A2:C2', [[holder, int(expires_at), time.strftime('%Y-%m-%d %H:%M:%S')]])
+
+    def acquire(self) -> bool:
+        holder, expires_at = self._read()
+        if holder and holder != self.holder and expires_at > time.time():
+            return False
+        self._write(self.holder, time.time() + self.ttl)
+        time.sleep(self.confirm_delay)
+        holder, _ = self._read()
+        if holder != self.holder:
+            return False
+        self._last_renewed = time.monotonic()
+        return True
+
+    def renew(self) -> bool:
+        try:
+            holder, expires_at = self._read()
+            if holder and holder != self.holder:
+                logger.warning(f"Аренду перехватил другой экземпляр: {holder}")
+                return False
+            self._write(self.holder, time.time() + self.ttl)
+            self._last_renewed = time.monotonic()
+            return True
+        except Exception as e:
+            # Временная ошибка Sheets: остаемся ведущим, пока не истек срок последнего продления
+            alive = self._last_renewed is not None and time.monotonic() - self._last_renewed < self.ttl
+            logger.warning(f"Не удалось продлить аренду ({'держим' if alive else 'срок истек'}): {e}")
+            return alive
+
+    def release(self):
+        try:
+            holder, _ = self._read()
+            if holder == self.holder:
+                self._write('', 0)
+        except Exception as e:
+            logger.warning(f"Не удалось освободить аренду: {e}")
+
+
+class InstanceLock:
+    """Единственный активный экземпляр бота поверх FileLease/SheetLease.
+
+    Резервные экземпляры полностью инициализированы и ждут в wait_acquire,
+    пытаясь захватить аренду раз в retry_interval секунд. Ведущий продлевает
+    аренду в фоне; при ее потере вызывается on_lost (остановка polling).
+    """
+
+    def __init__(self, lease, renew_interval: float = 10.0, retry_interval: float = 5.0):
+        self.lease = lease
+        self.renew_interval = renew_interval
+        self.retry_interval = retry_interval
+        self.on_lost: Optional[Callable[[], None]] = None
+        self._held = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def held(self) -> bool:
+        return self._held.is_set()
+
+    def wait_acquire(self, should_stop: Callable[[], bool]) -> bool:
+        """Блокирует, пока аренда не захвачена; False — остановка запрошена раньше"""
+        announced = False
+        while not should_stop():
+            try:
+                if self.lease.acquire():
+                    self._held.set()
+                    logger.info("Экземпляр стал ведущим")
+                    self._start_renewal()
+                    return True
+            except Exception as e:
+                logger.warning(f"Ошибка захвата аренды: {e}")
+            if not announced:
+                logger.info("Другой экземпляр активен — ждем в резерве")
+                announced = True
+            self._stop.wait(self.retry_interval)
+        return False
+
+    def _start_renewal(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._renew_loop, name='instance-lock', daemon=True)
+        self._thread.start()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.renew_interval):
+            if not self.held:
+                return
+            if not self.lease.renew():
+                self._held.clear()
+                logger.warning("Аренда потеряна — экземпляр уходит в резерв")
+                if self.on_lost:
+                    self.on_lost()
+                return
+
+    def release(self):
+        self._stop.set()
+        if self.held:
+            self._held.clear()
+            self.lease.release()
+            logger.info("Аренда экземпляра освобождена")
@@ -0,0 +1,214 @@
+import bisect
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ledger import SalesLedger
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ('day', 'week', 'month', 'all')
+
+WINDOW_TITLES = {
+    'day': 'сегодня',
+    'week': 'эта неделя',
+    'month': 'этот месяц',
+    'all': 'все время',
+}
+
+# Сколько прошедших корзин хранить: старые окна не запрашиваются, но продажи
+# задним числом (дата продажи раньше даты записи) должны попадать в свою корзину
+RETENTION = {
+    'day': timedelta(days=7),
+    'week': timedelta(weeks=8),
+    'month': timedelta(days=400),
+}
+
+
+def window_key(window: str, day: date) -> str:
+    """Ключ корзины окна, в которую попадает продажа с датой day"""
+    if window == 'day':
+        return day.isoformat()
+    if window == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if window == 'month':
+        return day.strftime('%Y-%m')
+    return 'all'
+
+
+class Ranking:
+    """Отсортированный по убыванию рейтинг: список (-значение, имя) + текущее значение по имени.
+
+    Обновление — два бинарных поиска (удалить старую позицию, вставить новую),
+    поэтому топ читается без пересортировки.
+    """
+
+    def __init__(self):
+        self._order: List[Tuple[float, str]] = []
+        self._values: Dict[str, float] = {}
+
+    def update(self, name: str, value: float):
+        old = self._values.pop(name, None)
+        if old is not None:
+            index = bisect.bisect_left(self._order, (-old, name))
+            if index < len(self._order) and self._order[index] == (-old, name):
+                del self._order[index]
+        if value > 1e-9:
+            self._values[name] = value
+            bisect.insort(self._order, (-value, name))
+
+    def top(self, limit: int) -> List[Tuple[str, float]]:
+        return [(name, -value) for value, name in self._order[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+
+class _Bucket:
+    """Показатели менеджеров в одной корзине окна и рейтинги по ним"""
+
+    def __init__(self):
+        self.stats: Dict[str, Dict] = {}
+        self.rankings: Dict[str, Ranking] = {}
+
+    def apply(self, poster: str, currency: str, amount: float, sign: int):
+        stats = self.stats.setdefault(poster, {'count': 0, 'deals': {}, 'revenue': {}})
+        stats['count'] += sign
+        stats['deals'][currency] = stats['deals'].get(currency, 0) + sign
+        stats['revenue'][currency] = stats['revenue'].get(currency, 0) + amount * sign
+
+        deals = stats['deals'][currency]
+        revenue = stats['revenue'][currency]
+        self._ranking('count').update(poster, stats['count'])
+        self._ranking(f'revenue:{currency}').update(poster, revenue)
+        self._ranking(f'avg:{currency}').update(poster, revenue / deals if deals > 0 else 0)
+        if stats['count'] <= 0:
+            del self.stats[poster]
+
+    def _ranking(self, metric: str) -> Ranking:
+        ranking = self.rankings.get(metric)
+        if ranking is None:
+            ranking = self.rankings[metric] = Ranking()
+        return ranking
+
+
+class Leaderboard:
+    """Рейтинг менеджеров (кто занес продажу) по окнам день/неделя/месяц/все время.
+
+    Обновляется при записи и откате каждой продажи; при старте и после сверки
+    зеркала пересобирается из SQLite-зеркала продаж.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, _Bucket]] = {window: {} for window in WINDOWS}
+
+    def add_sale(self, data: Dict):
+        self._apply(data, 1)
+
+    def remove_sale(self, data: Dict):
+        self._apply(data, -1)
+
+    def _apply(self, data: Dict, sign: int):
+        poster = data.get('manager_username')
+        if not poster:
+            return
+        try:
+            day = datetime.strptime(data.get('date') or '', '%d.%m.%Y').date()
+        except ValueError:
+            logger.warning(f"Рейтинг: некорректная дата продажи {data.get('date')}")
+            return
+        with self._lock:
+            self._apply_locked(poster, day, data['currency'], float(data['amount']), sign)
+            self._prune_locked(datetime.now().date())
+
+    def _apply_locked(self, poster: str, day: date, currency: str, amount: float, sign: int):
+        for window in WINDOWS:
+            buckets = self._buckets[window]
+            key = window_key(window, day)
+            bucket = buckets.get(key)
+            if bucket is None:
+                if sign < 0:
+                    continue
+                bucket = buckets[key] = _Bucket()
+            bucket.apply(poster, currency, amount, sign)
+
+    def _prune_locked(self, today: date):
+        for window, retention in RETENTION.items():
+            oldest = window_key(window, today - retention)
+            buckets = self._buckets[window]
+            for key in [k for k in buckets if k < oldest]:
+                del buckets[key]
+
+    def rebuild(self, ledger: SalesLedger):
+        """Пересобирает рейтинги из зеркала продаж (строки без автора пропускаются)"""
+        rows = ledger.fetchall(
+            """SELECT manager_username, date, currency, amount FROM sales
+               WHERE manager_username IS NOT NULL AND manager_username != '' AND date IS NOT NULL"""
+        )
+        buckets: Dict[str, Dict[str, _Bucket]] = {window: {} for window in WINDOWS}
+        with self._lock:
+            self._buckets = buckets
+            for r in rows:
+                self._apply_locked(r['manager_username'], date.fromisoformat(r['date']),
+                                   r['currency'], r['amount'] or 0, 1)
+            self._prune_locked(datetime.now().date())
+        logger.info(f"Рейтинг менеджеров собран из зеркала: продаж {len(rows)}")
+
+    def top(self, window: str, metric: str, limit: int = 10,
+            today: Optional[date] = None) -> List[Tuple[str, float, Dict]]:
+        """Топ текущего окна по метрике: 'count', 'revenue:RUB', 'avg:USDT' и т.п.
+
+        Возвращает (менеджер, значение метрики, копия его показателей).
+        """
+        key = window_key(window, today or datetime.now().date())
+        with self._lock:
+            bucket = self._buckets[window].get(key)
+            if not bucket or metric not in bucket.rankings:
+                return []
+            return [
+                (poster, value, {'count': bucket.stats[poster]['count'],
+                                 'deals': dict(bucket.stats[poster]['deals']),
+                                 'revenue': dict(bucket.stats[poster]['revenue'])})
+                for poster, value in bucket.rankings[metric].top(limit)
+            ]
+
+
+def _format_value(currency: str, value: float) -> str:
+    return f"{value:,.0f}" if currency == 'RUB' else f"{value:,.2f}"
+
+
+def build_leaderboard(board: Leaderboard, window: str, by_average: bool = False, limit: int = 10,
+                      display_name=lambda username: f"@{username}") -> str:
+    """HTML-текст рейтинга: по выручке (или среднему чеку) в каждой валюте и по числу сделок"""
+    lines = [f"🏆 <b>Рейтинг менеджеров</b> — {WINDOW_TITLES[window]}"]
+    medals = {1: '🥇', 2: '🥈', 3: '🥉'}
+    empty = True
+    for currency in ('RUB', 'USDT'):
+        metric = f"{'avg' if by_average else 'revenue'}:{currency}"
+        rows = board.top(window, metric, limit)
+        if not rows:
+            continue
+        empty = False
+        lines.append('')
+        lines.append(f"<b>{'Средний чек' if by_average else 'Выручка'}, {currency}:</b>")
+        for place, (poster, value, stats) in enumerate(rows, start=1):
+            deals = stats['deals'].get(currency, 0)
+            revenue = stats['revenue'].get(currency, 0)
+            if by_average:
+                details = f"{deals} шт., всего {_format_value(currency, revenue)}"
+            else:
+                details = f"{deals} шт., ср. чек {_format_value(currency, revenue / deals if deals else 0)}"
+            lines.append(f"{medals.get(place, f'{place}.')} {display_name(poster)} — "
+                         f"{_format_value(currency, value)} {currency} ({details})")
+    rows = board.top(window, 'count', limit)
+    if rows:
+        lines.append('')
+        lines.append("<b>Сделок:</b>")
+        for place, (poster, value, _) in enumerate(rows, start=1):
+            lines.append(f"{medals.get(place, f'{place}.')} {display_name(poster)} — {value:.0f}")
+    if empty:
+        lines.append('')
+        lines.append("Продаж за период пока нет")
+    return '\n'.join(lines)
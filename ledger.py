@@ -0,0 +1,364 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Колонки зеркала в порядке config.SHEET_HEADERS (A:J) — ключи распарсенной продажи
+SALE_COLUMNS = [
+    'manager', 'date', 'time', 'amount', 'currency', 'payment_type',
+    'format', 'internal_external', 'channel', 'comment'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sheet TEXT,
+    row INTEGER,
+    manager TEXT,
+    date TEXT,
+    time TEXT,
+    amount REAL,
+    currency TEXT,
+    amount_normalized REAL,
+    payment_type TEXT,
+    format TEXT,
+    internal_external TEXT,
+    channel TEXT,
+    comment TEXT,
+    manager_username TEXT,
+    commission REAL,
+    chat_id INTEGER,
+    message_id INTEGER,
+    updated_at REAL,
+    UNIQUE (sheet, row)
+);
+CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date);
+CREATE INDEX IF NOT EXISTS idx_sales_manager ON sales (manager);
+CREATE INDEX IF NOT EXISTS idx_sales_manager_username ON sales (manager_username);
+CREATE INDEX IF NOT EXISTS idx_sales_channel ON sales (channel);
+CREATE INDEX IF NOT EXISTS idx_sales_currency ON sales (currency);
+CREATE TABLE IF NOT EXISTS sheet_sync (
+    sheet TEXT PRIMARY KEY,
+    synced_at REAL,
+    rows INTEGER
+);
+CREATE TABLE IF NOT EXISTS sheet_summary (
+    sheet TEXT,
+    currency TEXT,
+    col TEXT,
+    value REAL,
+    PRIMARY KEY (sheet, currency, col)
+);
+"""
+
+# Итоговый блок листа (формулы таблицы): в колонке L валюта, правее — выручка (M),
+# чистые (N) и комиссии сейлзов (O–R)
+SUMMARY_CURRENCY_INDEX = 11
+SUMMARY_COLUMNS = 'MNOPQR'
+
+# Колонки, добавленные после первого выпуска зеркала: существующие базы дополняются ALTER TABLE
+ADDED_COLUMNS = [
+    ('amount_normalized', 'REAL'),
+]
+
+# Строка листа при сверке — все та же продажа, что записал бот (а не сдвинутая ручной
+# вставкой/удалением строк): совпадают покупатель, дата и сумма
+SAME_SALE_SQL = (
+    "sales.manager IS excluded.manager AND sales.date IS excluded.date "
+    "AND ABS(COALESCE(sales.amount, 0) - COALESCE(excluded.amount, 0)) < 0.005"
+)
+
+# Данные бота, которых нет в листе: сохраняются при сверке, только если строка не сдвинулась
+BOT_COLUMNS = ['manager_username', 'commission', 'chat_id', 'message_id']
+
+# (сумма, валюта, ISO-дата) -> сумма в валюте отчетов
+Normalizer = Callable[[float, str, Optional[str]], float]
+
+
+def to_iso_date(date_str: str) -> Optional[str]:
+    """dd.mm.YYYY -> YYYY-MM-DD (в зеркале даты хранятся в ISO для индексных диапазонов)"""
+    try:
+        return datetime.strptime((date_str or '').strip(), '%d.%m.%Y').date().isoformat()
+    except ValueError:
+        return None
+
+
+def from_iso_date(iso: Optional[str]) -> str:
+    if not iso:
+        return ''
+    year, month, day = iso.split('-')
+    return f"{day}.{month}.{year}"
+
+
+def _parse_amount(value) -> Optional[float]:
+    try:
+        return float(str(value).replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.'))
+    except ValueError:
+        return None
+
+
+class SalesLedger:
+    """Локальное SQLite-зеркало листов с продажами.
+
+    Пишется в момент записи продажи и периодически сверяется с таблицей,
+    чтобы аналитика (/money, отчеты, запросы) не вызывала get_all_values.
+    """
+
+    def __init__(self, path: str, normalize: Optional[Normalizer] = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.normalize = normalize
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            existing = {r['name'] for r in self._conn.execute('PRAGMA table_info(sales)')}
+            for column, column_type in ADDED_COLUMNS:
+                if column not in existing:
+                    self._conn.execute(f'ALTER TABLE sales ADD COLUMN {column} {column_type}')
+                    logger.info(f"Зеркало продаж: добавлена колонка {column}")
+            self._conn.commit()
+
+    def record_sale(self, data: Dict, sheet: Optional[str] = None, row: Optional[int] = None,
+                    chat_id: Optional[int] = None, message_id: Optional[int] = None):
+        """Записывает (или перезаписывает по листу/строке) продажу, внесенную ботом"""
+        values = self._sale_values(data)
+        with self._lock:
+            self._conn.execute(
+                f"""INSERT INTO sales (sheet, row, {', '.join(SALE_COLUMNS)}, amount_normalized,
+                                       manager_username, commission, chat_id, message_id, updated_at)
+                    VALUES (?, ?, {', '.join('?' * len(SALE_COLUMNS))}, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (sheet, row) DO UPDATE SET
+                        {', '.join(f'{c} = excluded.{c}' for c in SALE_COLUMNS)},
+                        amount_normalized = excluded.amount_normalized,
+                        manager_username = excluded.manager_username,
+                        commission = excluded.commission,
+                        chat_id = excluded.chat_id,
+                        message_id = excluded.message_id,
+                        updated_at = excluded.updated_at""",
+                [sheet, row, *values, self._normalized(values[3], values[4], values[1]),
+                 data.get('manager_username'), data.get('commission'),
+                 chat_id, message_id, time.time()]
+            )
+            self._conn.commit()
+
+    def delete_row(self, sheet: str, row: int):
+        with self._lock:
+            self._conn.execute('DELETE FROM sales WHERE sheet = ? AND row = ?', (sheet, row))
+            self._conn.commit()
+
+    def _normalized(self, amount: Optional[float], currency: str, iso_date: Optional[str]) -> Optional[float]:
+        if amount is None or not self.normalize:
+            return None
+        try:
+            return self.normalize(amount, currency, iso_date)
+        except KeyError as e:
+            logger.warning(f"Зеркало продаж: {e}")
+            return None
+
+    def renormalize(self) -> int:
+        """Пересчитывает amount_normalized всех строк (после смены курсов или миграции)"""
+        with self._lock:
+            rows = self._conn.execute('SELECT id, amount, currency, date FROM sales').fetchall()
+            updates = [(self._normalized(r['amount'], r['currency'], r['date']), r['id']) for r in rows]
+            self._conn.executemany('UPDATE sales SET amount_normalized = ? WHERE id = ?', updates)
+            self._conn.commit()
+        return len(updates)
+
+    @staticmethod
+    def _sale_values(data: Dict) -> List:
+        values = []
+        for column in SALE_COLUMNS:
+            value = data.get(column, '')
+            if column == 'date':
+                value = to_iso_date(value)
+            elif column == 'amount':
+                value = float(value)
+            else:
+                value = str(value or '').strip()
+            values.append(value)
+        return values
+
+    def sync_sheet(self, sheet: str, values: Sequence[Sequence[str]]):
+        """Сверка с содержимым листа (результат get_all_values, первая строка — заголовки).
+
+        Строки бота сохраняют автора, комиссию и сообщение, пока содержимое
+        строки совпадает с записанным ботом; если под этим номером теперь другая
+        продажа (строки вставляли или удаляли вручную), эти поля сбрасываются.
+        Строки, исчезнувшие из листа, удаляются. Итоговый блок листа (L–R)
+        запоминается отдельно — см. sheet_summary.
+        """
+        records = []
+        for row_number, cells in enumerate(values[1:], start=2):
+            cells = list(cells[:len(SALE_COLUMNS)]) + [''] * (len(SALE_COLUMNS) - len(cells[:len(SALE_COLUMNS)]))
+            amount = _parse_amount(cells[3]) if cells[3] else None
+            if amount is None:
+                continue
+            record = [c.strip() for c in cells]
+            record[1] = to_iso_date(record[1])
+            record[3] = amount
+            records.append((sheet, row_number, *record,
+                            self._normalized(amount, record[4], record[1]), time.time()))
+
+        summary = []
+        for cells in values:
+            currency = cells[SUMMARY_CURRENCY_INDEX].strip() if len(cells) > SUMMARY_CURRENCY_INDEX else ''
+            if currency not in ('USDT', 'RUB'):
+                continue
+            for offset, column in enumerate(SUMMARY_COLUMNS, start=SUMMARY_CURRENCY_INDEX + 1):
+                value = _parse_amount(cells[offset]) if len(cells) > offset and cells[offset].strip() else None
+                if value is not None:
+                    summary.append((sheet, currency, column, value))
+
+        with self._lock:
+            self._conn.execute('SAVEPOINT sync')
+            try:
+                self._conn.execute('DELETE FROM sheet_summary WHERE sheet = ?', (sheet,))
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO sheet_summary (sheet, currency, col, value) VALUES (?, ?, ?, ?)', summary
+                )
+                present = [r[1] for r in records]
+                if present:
+                    self._conn.execute(
+                        f"DELETE FROM sales WHERE sheet = ? AND row NOT IN ({', '.join('?' * len(present))})",
+                        [sheet, *present]
+                    )
+                else:
+                    self._conn.execute('DELETE FROM sales WHERE sheet = ?', (sheet,))
+                self._conn.executemany(
+                    f"""INSERT INTO sales (sheet, row, {', '.join(SALE_COLUMNS)}, amount_normalized, updated_at)
+                        VALUES (?, ?, {', '.join('?' * len(SALE_COLUMNS))}, ?, ?)
+                        ON CONFLICT (sheet, row) DO UPDATE SET
+                            {', '.join(f'{c} = excluded.{c}' for c in SALE_COLUMNS)},
+                            amount_normalized = excluded.amount_normalized,
+                            {', '.join(f'{c} = CASE WHEN {SAME_SALE_SQL} THEN sales.{c} END' for c in BOT_COLUMNS)},
+                            updated_at = excluded.updated_at""",
+                    records
+                )
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO sheet_sync (sheet, synced_at, rows) VALUES (?, ?, ?)',
+                    (sheet, time.time(), len(records))
+                )
+                self._conn.execute('RELEASE sync')
+            except Exception:
+                self._conn.execute('ROLLBACK TO sync')
+                self._conn.execute('RELEASE sync')
+                raise
+            self._conn.commit()
+        logger.info(f"Зеркало продаж: лист '{sheet}' сверен, строк с продажами: {len(records)}")
+
+    def sheet_summary(self, sheet: str) -> Dict[str, Dict[str, float]]:
+        """Итоговый блок листа на момент последней сверки: {валюта: {колонка: значение}}"""
+        summary: Dict[str, Dict[str, float]] = {}
+        for r in self.fetchall('SELECT currency, col, value FROM sheet_summary WHERE sheet = ?', (sheet,)):
+            summary.setdefault(r['currency'], {})[r['col']] = r['value']
+        return summary
+
+    def synced_at(self, sheet: str) -> Optional[float]:
+        row = self.fetchone('SELECT synced_at FROM sheet_sync WHERE sheet = ?', (sheet,))
+        return row['synced_at'] if row else None
+
+    def sheet_rows(self, sheet: str) -> List[List]:
+        """Строки листа в формате таблицы A:J (дата dd.mm.YYYY), по порядку строк"""
+        rows = self.fetchall(
+            f"SELECT {', '.join(SALE_COLUMNS)} FROM sales WHERE sheet = ? ORDER BY row", (sheet,)
+        )
+        result = []
+        for r in rows:
+            values = [r[c] if r[c] is not None else '' for c in SALE_COLUMNS]
+            values[1] = from_iso_date(r['date'])
+            result.append(values)
+        return result
+
+    def iter_chunks(self, sql: str, params: Iterable = (), chunk_size: int = 1000) -> Iterator[List[sqlite3.Row]]:
+        """Построчная выдача результата пачками по chunk_size.
+
+        Читает через отдельное соединение (WAL допускает параллельных читателей),
+        чтобы долгая выгрузка не держала общую блокировку записи.
+        """
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, tuple(params))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def fetchall(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def fetchone(self, sql: str, params: Iterable = ()) -> Optional[sqlite3.Row]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchone()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LedgerReconciler:
+    """Фоновая сверка зеркала с таблицей раз в interval секунд.
+
+    fetch возвращает листы для сверки — пары (название, значения листа); по
+    одному чтению на лист за проход.
+    """
+
+    def __init__(self, ledger: SalesLedger, fetch: Callable[[], Iterable[Tuple[str, List[List[str]]]]],
+                 interval: float = 600.0, on_synced: Optional[Callable[[], None]] = None):
+        self.ledger = ledger
+        self.fetch = fetch
+        self.interval = interval
+        self.on_synced = on_synced
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_success: Optional[float] = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        if self._thread and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            # Перезапуск после stop(): ждем выхода прежнего потока
+            self._thread.join()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='ledger-reconciler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        synced = 0
+        try:
+            for sheet, values in self.fetch() or ():
+                self.ledger.sync_sheet(sheet, values)
+                synced += 1
+        except Exception as e:
+            logger.warning(f"Не удалось сверить зеркало продаж с таблицей: {e}")
+        if synced:
+            self.last_success = time.time()
+            if self.on_synced:
+                try:
+                    self.on_synced()
+                except Exception as e:
+                    logger.warning(f"Ошибка после сверки зеркала продаж: {e}")
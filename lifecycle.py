@@ -0,0 +1,142 @@
+import functools
+import logging
+import signal
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+from offsets import UpdateOffsetStore
+
+logger = logging.getLogger(__name__)
+
+# Списки обработчиков TeleBot, вызовы которых считаются "работой в процессе"
+HANDLER_LISTS = ('message_handlers', 'edited_message_handlers', 'callback_query_handlers')
+
+
+class Lifecycle:
+    """Плавная остановка бота по SIGTERM/SIGINT.
+
+    Порядок: прекращаем polling (новые обновления не запрашиваются), ждем
+    завершения уже запущенных и стоящих в очереди обработчиков, выполняем
+    шаги остановки (отправка уведомлений, сохранение состояния) и
+    подтверждаем Telegram обработанные обновления get_updates(offset=last+1).
+    Все укладывается в общий дедлайн timeout секунд.
+
+    Пока бот работает, каждый раз, когда все полученные обновления обработаны,
+    last_update_id сохраняется в offset_store — с него продолжит следующий запуск.
+    """
+
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, bot, timeout: float = 20.0, offset_store: Optional[UpdateOffsetStore] = None):
+        self.bot = bot
+        self.timeout = timeout
+        self.offset_store = offset_store
+        self._stop_requested = threading.Event()
+        self._done = False
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._steps: List[Tuple[str, Callable[[float], object]]] = []
+
+    @property
+    def stopping(self) -> bool:
+        return self._stop_requested.is_set()
+
+    def add_shutdown_step(self, name: str, step: Callable[[float], object]):
+        """Шаг остановки; получает оставшееся до дедлайна время в секундах"""
+        self._steps.append((name, step))
+
+    def track_handlers(self):
+        """Оборачивает зарегистрированные обработчики счетчиком выполняющихся вызовов"""
+        for attribute in HANDLER_LISTS:
+            for handler in getattr(self.bot, attribute, []):
+                handler['function'] = self._tracked(handler['function'])
+        # Разбор пачки тоже считается работой: пока задачи не поставлены в пул,
+        # last_update_id уже сдвинут, и сохранять его рано
+        self.bot.process_new_updates = self._tracked(self.bot.process_new_updates)
+
+    def _tracked(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self._lock:
+                self._in_flight += 1
+            try:
+                return function(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                if self.offset_store and not self.in_flight():
+                    self.offset_store.save(getattr(self.bot, 'last_update_id', 0))
+        return wrapper
+
+    def in_flight(self) -> int:
+        """Выполняющиеся обработчики плюс задачи, ждущие свободного потока TeleBot"""
+        with self._lock:
+            running = self._in_flight
+        pool = getattr(self.bot, 'worker_pool', None)
+        return running + (pool.tasks.qsize() if pool else 0)
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        if self.stopping:
+            logger.warning(f"Повторный сигнал {signum} — немедленное завершение")
+            raise SystemExit(1)
+        logger.info(f"Получен сигнал {signum}. Останавливаем прием обновлений...")
+        self.request_stop()
+
+    def request_stop(self):
+        self._stop_requested.set()
+        self.bot.stop_polling()
+
+    def shutdown(self):
+        """Дренаж и сохранение состояния; повторный вызов ничего не делает"""
+        if self._done:
+            return
+        self._done = True
+        deadline = time.monotonic() + self.timeout
+
+        drained = self.wait_idle(self.timeout)
+        if drained:
+            self._commit_offset()
+        else:
+            # Незавершенные обновления не подтверждаем — Telegram отдаст их следующему запуску
+            logger.warning(f"Не дождались обработчиков ({self.in_flight()} в работе), offset не подтвержден")
+
+        for name, step in self._steps:
+            remaining = max(0.0, deadline - time.monotonic())
+            try:
+                result = step(remaining)
+                if result is False:
+                    logger.warning(f"Остановка: шаг '{name}' не завершился в срок")
+            except Exception as e:
+                logger.error(f"Остановка: ошибка на шаге '{name}': {e}")
+
+        pool = getattr(self.bot, 'worker_pool', None)
+        if pool and drained:
+            pool.close()
+        logger.info("Бот остановлен")
+
+    def wait_idle(self, timeout: float) -> bool:
+        """Ждет, пока не останется выполняющихся и ожидающих обработчиков"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL)
+        return True
+
+    def _commit_offset(self):
+        last_update_id = getattr(self.bot, 'last_update_id', 0)
+        if not last_update_id:
+            return
+        if self.offset_store:
+            self.offset_store.save(last_update_id)
+        try:
+            # Сдвиг offset подтверждает Telegram все обновления до last_update_id включительно
+            self.bot.get_updates(offset=last_update_id + 1, limit=1, timeout=0)
+            logger.info(f"Offset обновлений подтвержден: {last_update_id}")
+        except Exception as e:
+            logger.warning(f"Не удалось подтвердить offset обновлений: {e}")
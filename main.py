@@ -1,27 +1,57 @@
+import html
 import os
 import re
 import logging
-import signal
 import sys
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from io import BytesIO
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import telebot
 from telebot import types
 import gspread
 from google.oauth2.service_account import Credentials
 
-# Рендеринг графиков без дисплея
-try:
-    import matplotlib
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-    from matplotlib.ticker import PercentFormatter
-except Exception:
-    plt = None
-
+import charts
 import config
+from aggregates import SalesAggregates
+from anomaly import AnomalyDetector, PendingSales
+from aliases import AliasRegistry
+from cache import LRUCache, MISSING
+from instance_lock import LEASE_SHEET_TITLE, FileLease, InstanceLock, NoLease, SheetLease, instance_id
+from lifecycle import Lifecycle
+from leaderboard import WINDOWS, Leaderboard, build_leaderboard
+from ledger import LedgerReconciler, SalesLedger, from_iso_date
+from message_index import MessageRowIndex
+from offsets import UpdateOffsetStore
+from profiler import HandlerProfiler
+from rates import RateTable
+from sheet_index import WorksheetIndex, add_month_page, page_of
+from tenants import Tenant, TenantRegistry
+from query import QUERY_HELP, QueryError, format_result, parse_query, run_query
+from channels import ChannelCatalog
+from commissions import CommissionEngine
+from dates import parse_sale_date, title_month
+from diagnosis import FIELD_TITLES, REQUIRED_FIELDS, diagnose_sale, format_sale_line
+from health import CachedProbe, HealthServer, Heartbeat
+from export import EXPORT_HELP, export_formats, write_csv_gz, write_parquet
+from notifier import NotificationQueue, parse_destinations
+from reports import ReportScheduler, build_digest, current_period
+
+# Быстрый предфильтр: в продаже всегда есть сумма с валютой и дата (14.05, 14/05, 14-05, 12 декабря)
+SALE_AMOUNT_RE = re.compile(r'\d(?:usdt|руб|р|\$|₽|юсдт)', re.IGNORECASE)
+SALE_DATE_RE = re.compile(r'\b\d{1,2}(?:[./-]\d{1,2}|\s+[а-яё]{3,})', re.IGNORECASE)
+
+# Отказ в отчетах по основной таблице для чатов других команд
+FOREIGN_TENANT_TEXT = "Статистика ведется только по таблице основной команды"
+
+# Ограничение Bot API на размер отправляемого документа
+MAX_DOCUMENT_BYTES = 50 * 1024 * 1024
+
+# Текст, на который редактируют сообщение о продаже, чтобы удалить запись
+DELETE_MARKERS = {'-', 'удалить', 'удалено', 'отмена'}
 
 # Настройка логирования
 logging.basicConfig(
@@ -31,12 +61,21 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 class SalesBot:
-    def __init__(self):
+    FORMAT_ERROR_TEXT = (
+        "❌ <b>Ошибка валидации формата!</b>\n\n"
+        "Принимаются только следующие форматы:\n"
+        "• <code>1/24</code>\n"
+        "• <code>1/48</code>\n\n"
+        "Другие значения не принимаются."
+    )
+
+    def __init__(self, threaded: bool = True):
+        """threaded=False — обработчики выполняются в вызывающем потоке (асинхронный режим, см. async_bot)"""
         self.bot_token = config.TELEGRAM_BOT_TOKEN
         if not self.bot_token:
             raise ValueError("TELEGRAM_BOT_TOKEN не найден в конфигурации")
         
-        self.bot = telebot.TeleBot(self.bot_token)
+        self.bot = telebot.TeleBot(self.bot_token, threaded=threaded)
         # На всякий случай убираем вебхук перед polling, чтобы избежать 409 Conflict
         try:
             self.bot.remove_webhook()
@@ -48,125 +87,199 @@ class SalesBot:
         self.sheets_id = config.GOOGLE_SHEETS_ID
         logger.info(f"Google Sheets ID из конфига: {self.sheets_id}")
         self.sheet = None
+        self.credentials = None
+        self.gspread_client = None
+        # Время последней успешной записи в таблицу (для /readyz)
+        self.last_sheet_write: Optional[float] = None
         self.stats = {
             'total_usdt': 0,
             'total_rub': 0,
+            'total_normalized': 0,
             'total_sales': 0,
             'sales_by_payment': {}
         }
 
-        # Разделители комментария после названия канала
-        self.comment_delimiters = [' -- ', ' — ', ' – ', ' | ', ' / ', '  ']
-        # Ключевые слова/триггеры, с которых часто начинается комментарий
-        self.comment_keywords = [
-            'мб', 'может', 'возможно', 'вероятно', 'наверн', 'скорее',
-            'коммент', 'комментар', 'примечан', 'замет', 'note', 'comment',
-            'ещё', 'еще', 'купит', 'доп', 'доп.', '+', 'потом'
-        ]
-
-        # Нормализация названий каналов
-        self.channel_aliases = {
-            # русские варианты и сокращения → каноническое имя
-            'русский бизнес': 'Русский бизнес | Стартапы',
-            'русский  бизнес': 'Русский бизнес | Стартапы',
-            'русский-бизнес': 'Русский бизнес | Стартапы',
-            'рб': 'Русский бизнес | Стартапы',
-            'rb': 'Русский бизнес | Стартапы',
-            'русбизнес': 'Русский бизнес | Стартапы',
-            # Нормализация для новых каналов
-            'источник': 'Источник',
-            'источник экономика': 'Источник | Экономика',
-            'источник | экономика': 'Источник | Экономика',
-            'источник | экономику': 'Источник | Экономика',
-            'источник экономику': 'Источник | Экономика',
-            'экономика': 'Источник | Экономика',
-            'валютный банк': 'Источник | Экономика'
-        }
-
-        # Нормализация типов оплаты
-        self.payment_type_aliases = {
-            'сбп': 'СБП',
-            'карта': 'Карта',
-            'крипта': 'Криптовалюта',
-            'криптовалюта': 'Криптовалюта',
-            'ип': 'ИП'
-        }
-
-        # Нормализация внешняя/внутренняя
-        self.internal_external_aliases = {
-            'внешка': 'Внешняя',
-            'внешняя': 'Внешняя',
-            'внутренняя': 'Внутренняя',
-            'внутреняя': 'Внутренняя',
-            'внутренний': 'Внутренняя',
-            'внутрянка': 'Внутренняя'
-        }
+        # Словари нормализации (каналы, типы оплаты, внешняя/внутренняя, триггеры комментария)
+        # загружаются из файла и подменяются на лету при его изменении
+        self.aliases = AliasRegistry(config.ALIASES_FILE, reload_interval=config.ALIASES_RELOAD_SECONDS)
+        # Справочник каналов с нечетким поиском; пополняется из колонки I таблицы
+        self.channel_catalog = ChannelCatalog(self.aliases.current.channels, config.CHANNEL_ALIASES_FILE)
+        self.aliases.subscribe(lambda snapshot: self.channel_catalog.replace_aliases(snapshot.channels))
+        
+        # Кэш результатов парсинга (повторные/пересланные сообщения) и антиспам ответов об ошибке
+        self.parse_cache = LRUCache(config.PARSE_CACHE_SIZE)
+        self.aliases.subscribe(lambda snapshot: self.parse_cache.clear())
+        self._error_reply_times: Dict[int, float] = {}
+        
+        # Сообщение -> строка таблицы, чтобы правки сообщений обновляли ту же строку
+        self.message_index = MessageRowIndex(config.MESSAGE_INDEX_FILE)
+        
+        # Курсы валют по дням: суммы в разных валютах приводятся к REPORTING_CURRENCY
+        self.rates = RateTable(config.RATES_FILE, {'USDT': config.USDT_RUB_RATE}, config.REPORTING_CURRENCY)
+        
+        # Локальное SQLite-зеркало продаж: пишется при записи, сверяется с таблицей в фоне
+        self.ledger = SalesLedger(config.LEDGER_FILE, normalize=self.rates.convert)
+        self.ledger.renormalize()
+        # Обычные суммы и валюты по каналам/форматам; подозрительная продажа ждет подтверждения автора
+        self.anomalies = AnomalyDetector(
+            config.ANOMALY_STATS_FILE, alpha=config.ANOMALY_ALPHA,
+            threshold=config.ANOMALY_THRESHOLD, min_samples=config.ANOMALY_MIN_SAMPLES
+        )
+        if not len(self.anomalies):
+            self.anomalies.rebuild(
+                dict(row) for row in self.ledger.fetchall("SELECT amount, currency, channel, format FROM sales ORDER BY id")
+            )
+        self.pending_sales = PendingSales(ttl=config.ANOMALY_PENDING_TTL)
+        # Исправления нераспознанных продаж, ожидающие кнопки «Принять»
+        self.pending_suggestions = PendingSales(ttl=config.SUGGESTION_TTL)
+        # Рейтинг менеджеров: собирается из зеркала, дальше обновляется при каждой записи
+        self.leaderboard = Leaderboard()
+        self.leaderboard.rebuild(self.ledger)
+        self.ledger_reconciler = LedgerReconciler(
+            self.ledger, self._fetch_recent_sheets, interval=config.LEDGER_RECONCILE_SECONDS,
+            on_synced=self._after_ledger_sync
+        )
+        
+        # Очередь исходящих уведомлений (получатели разбираются один раз при старте)
+        self.notifier = NotificationQueue(
+            self.bot,
+            parse_destinations(config.NOTIFICATION_CHAT_ID),
+            coalesce_window=config.NOTIFICATION_COALESCE_SECONDS,
+            max_retries=config.NOTIFICATION_MAX_RETRIES
+        )
+        
+        # Команды: чаты из TENANTS_FILE пишут в свои таблицы и уведомляют своих получателей;
+        # остальные чаты обслуживает команда по умолчанию (GOOGLE_SHEETS_ID, NOTIFICATION_CHAT_ID)
+        self.tenants = TenantRegistry.from_file(
+            config.TENANTS_FILE,
+            Tenant('default', self.sheets_id, notifier=self.notifier,
+                   requests_per_minute=config.SHEETS_REQUESTS_PER_MINUTE,
+                   client=lambda: self.gspread_client, is_default=True),
+            self._build_tenant
+        )
+        
+        # Правила комиссий загружаются один раз и применяются при записи каждой продажи
+        self.commissions = CommissionEngine.from_file(config.COMMISSION_RULES_FILE)
+        
+        # Агрегаты продаж по дням и планировщик периодических отчетов
+        self.aggregates = SalesAggregates(config.AGGREGATES_FILE, rates=self.rates)
+        self.report_scheduler = None
+        if config.REPORTS_ENABLED and config.NOTIFICATION_CHAT_ID:
+            self.report_scheduler = ReportScheduler(
+                self.aggregates,
+                self._post_to_notification_chat,
+                config.REPORT_STATE_FILE,
+                report_hour=config.REPORT_HOUR,
+                top_channels=config.REPORT_TOP_CHANNELS
+            )
+        
+        # Кэш списка листов для выбора месяца в /money (свежие месяцы первыми)
+        self.worksheet_index = WorksheetIndex(
+            self._fetch_worksheet_titles, ttl=config.WORKSHEET_INDEX_TTL, sort_key=self._worksheet_sort_key
+        )
+        
+        # Графики /money на переиспользуемых шаблонах фигур
+        self.chart_renderer = charts.ChartRenderer(
+            dpi=config.CHART_DPI, thumb_dpi=config.CHART_THUMB_DPI, palette_colors=config.CHART_PALETTE_COLORS
+        )
+        
+        # Пакетная запись строк в таблицу (включается на время догоняющей обработки)
+        self._sheet_batch_lock = threading.Lock()
+        self._sheet_batch: Optional[Dict] = None
         
         # Настройка Google Sheets
         self._setup_google_sheets()
         
+        # Профилирование по /profile: фазы обработчиков и сэмплы стеков (выключено, пока не включат)
+        self.profiler = HandlerProfiler(config.PROFILE_DIR, interval=config.PROFILE_INTERVAL_MS / 1000)
+        
         # Регистрация обработчиков
         self._register_handlers()
-
-    def _split_channel_and_comment(self, channel_with_comment: str):
+        self.profiler.instrument(self.bot)
+        
+        # Блокировка единственного активного экземпляра (вместо борьбы с 409 Conflict)
+        self.instance_lock = self._create_instance_lock()
+        self._background_started = False
+        
+        # Состояние для /healthz и /readyz: пульс polling и кэшируемая дешевая проверка таблицы
+        self.heartbeat = Heartbeat()
+        self.heartbeat.wrap(self.bot)
+        self.sheets_probe = CachedProbe(self._probe_sheets, ttl=config.HEALTH_SHEETS_PROBE_TTL)
+        self.health_server = HealthServer(config.HEALTH_PORT, self._health_report) if config.HEALTH_PORT else None
+        
+        # Плавная остановка: дренаж обработчиков и уведомлений, сохранение состояния
+        # Последний обработанный update_id: после рестарта догоняем пропущенное, а не сбрасываем очередь
+        self.offset_store = UpdateOffsetStore(config.UPDATE_OFFSET_FILE)
+        self.lifecycle = Lifecycle(self.bot, timeout=config.SHUTDOWN_TIMEOUT, offset_store=self.offset_store)
+        self.lifecycle.track_handlers()
+        self.lifecycle.add_shutdown_step('notifications', self._drain_notifications)
+        self.lifecycle.add_shutdown_step('pending_sales', lambda remaining: self._save_pending_sales())
+        self.lifecycle.add_shutdown_step('background', lambda remaining: self._stop_background())
+        self.lifecycle.add_shutdown_step('ledger', lambda remaining: self.ledger.close())
+        # Аренда освобождается последней: резерв начинает, когда очереди уже сохранены
+        self.lifecycle.add_shutdown_step('instance_lock', lambda remaining: self.instance_lock.release())
+
+    def _alias_snapshots(self, tenant: Optional[Tenant] = None) -> List:
+        """Словари алиасов по приоритету: сначала словарь команды (если есть), затем общий"""
+        if tenant is not None and tenant.aliases:
+            return [tenant.aliases.current, self.aliases.current]
+        return [self.aliases.current]
+
+    def _split_channel_and_comment(self, channel_with_comment: str, tenant: Optional[Tenant] = None,
+                                   learn: bool = True):
         """Отделяет комментарий от названия канала по известным разделителям.
         Возвращает (channel, comment). Если комментария нет — возвращает comment=''"""
         text = channel_with_comment.strip()
-        for delim in self.comment_delimiters:
-            if delim in text:
-                parts = text.split(delim, 1)
-                return self._normalize_channel_name(parts[0].strip()), parts[1].strip()
-        # Если специальных разделителей нет — пробуем по ключевым словам комментария
-        lowered = text.lower()
-        keyword_positions = [lowered.find(' ' + kw) for kw in self.comment_keywords]
-        keyword_positions = [pos for pos in keyword_positions if pos > 0]
-        if keyword_positions:
-            split_pos = min(keyword_positions)
-            return self._normalize_channel_name(text[:split_pos].strip()), text[split_pos:].strip()
+        # Один проход автомата: сначала разделители (по приоритету), затем ключевые слова;
+        # разделители команды проверяются раньше общих
+        for snapshot in self._alias_snapshots(tenant):
+            split = snapshot.comment_splitter.find_split(text)
+            if split:
+                channel_end, comment_start = split
+                return (self._normalize_channel_name(text[:channel_end].strip(), tenant, learn),
+                        text[comment_start:].strip())
         # Если ничего не нашли — считаем, что комментария нет
-        return self._normalize_channel_name(text), ''
-
-    def _normalize_channel_name(self, channel_name: str) -> str:
-        """Нормализует название канала по словарю синонимов/алиасов."""
-        key = channel_name.strip().lower()
-        # Убираем лишние пробелы/дефисы для сравнения
-        compact_key = key.replace('  ', ' ').replace('-', ' ').strip()
-        compact_key = ' '.join(compact_key.split())
-        if key in self.channel_aliases:
-            return self.channel_aliases[key]
-        if compact_key in self.channel_aliases:
-            return self.channel_aliases[compact_key]
-        return channel_name
-
-    def _normalize_payment_type(self, payment_type: str) -> str:
+        return self._normalize_channel_name(text, tenant, learn), ''
+
+    def _normalize_channel_name(self, channel_name: str, tenant: Optional[Tenant] = None,
+                                learn: bool = True) -> str:
+        """Нормализует название канала по алиасам и справочнику (с исправлением опечаток)."""
+        catalog = tenant.channel_catalog if tenant is not None and tenant.channel_catalog else self.channel_catalog
+        return catalog.resolve(channel_name, learn=learn)
+
+    def _normalize_payment_type(self, payment_type: str, tenant: Optional[Tenant] = None) -> str:
         """Нормализует тип оплаты."""
         if not payment_type:
             return ""
         key = payment_type.strip().lower()
-        return self.payment_type_aliases.get(key, payment_type)
+        for snapshot in self._alias_snapshots(tenant):
+            if key in snapshot.payment_types:
+                return snapshot.payment_types[key]
+        return payment_type
 
-    def _normalize_internal_external(self, internal_external: str) -> str:
+    def _normalize_internal_external(self, internal_external: str, tenant: Optional[Tenant] = None) -> str:
         """Нормализует внешняя/внутренняя."""
         if not internal_external:
             return ""
         key = internal_external.strip().lower()
-        return self.internal_external_aliases.get(key, internal_external)
-
-    def _send_notification(self, data: Dict):
-        """Отправка уведомления о продаже в другой чат/топик"""
-        if not config.NOTIFICATION_CHAT_ID:
+        for snapshot in self._alias_snapshots(tenant):
+            if key in snapshot.internal_external:
+                return snapshot.internal_external[key]
+        return internal_external
+
+    def _send_notification(self, data: Dict, tenant: Optional[Tenant] = None):
+        """Постановка уведомления о продаже в очередь отправки в другие чаты/топики"""
+        notifier = self.notifier if tenant is None or tenant.is_default else tenant.notifier
+        if not notifier or not notifier.destinations:
             logger.info("NOTIFICATION_CHAT_ID не настроен")
             return
         
-        logger.info(f"=== ОТПРАВКА УВЕДОМЛЕНИЯ ===")
-        logger.info(f"NOTIFICATION_CHAT_ID: {config.NOTIFICATION_CHAT_ID}")
-        
         try:
-            # Проверяем, является ли менеджер @mqwou
+            # Для менеджеров с комиссией по таблице правил показываем сумму за вычетом комиссии
             manager_username = data.get('manager_username', 'unknown')
-            if manager_username == 'mqwou':
-                # Специальный формат для @mqwou с комиссией 5%
-                commission = data['amount'] * 0.05
+            commission = self.commissions.commission_for_sale(data)
+            if commission:
+                commission_rate = commission / data['amount']
                 final_amount = data['amount'] - commission
                 notification_text = f"""
 ✅ <b>Новая продажа на {data['amount']} {data['currency']} от менеджера @{manager_username}</b>
@@ -174,7 +287,7 @@ class SalesBot:
 👤 <b>Покупатель:</b> {data['manager']}
 📅 <b>Дата:</b> {data['date']}
 🕐 <b>Время:</b> {data['time']}
-💰 <b>Сумма:</b> {data['amount']} {data['currency']} - 5% комиссия = {final_amount:.2f} {data['currency']}
+💰 <b>Сумма:</b> {data['amount']} {data['currency']} - {commission_rate:.0%} комиссия = {final_amount:.2f} {data['currency']}
 💳 <b>Тип оплаты:</b> {data.get('payment_type', 'Не указан')}
 📋 <b>Формат:</b> {data.get('format', 'Не указан')}
 🏢 <b>Внешняя/Внутренняя:</b> {data.get('internal_external', 'Не указано')}
@@ -195,35 +308,49 @@ class SalesBot:
 💬 <b>Комментарий:</b> {data.get('comment', 'Нет')}
                 """
             
-            # Проверяем, есть ли ID топика в переменной
-            if '#' in config.NOTIFICATION_CHAT_ID:
-                # Отправляем в топик
-                chat_id, topic_id = config.NOTIFICATION_CHAT_ID.split('#')
-                logger.info(f"Отправляем в топик: chat_id={chat_id}, topic_id={topic_id}")
-                
-                self.bot.send_message(
-                    chat_id,
-                    notification_text,
-                    parse_mode='HTML',
-                    message_thread_id=int(topic_id)
-                )
-                logger.info(f"✅ Уведомление отправлено в топик {config.NOTIFICATION_CHAT_ID}")
-            else:
-                # Отправляем в обычный чат
-                logger.info(f"Отправляем в чат: {config.NOTIFICATION_CHAT_ID}")
-                
-                self.bot.send_message(
-                    config.NOTIFICATION_CHAT_ID,
-                    notification_text,
-                    parse_mode='HTML'
-                )
-                logger.info(f"✅ Уведомление отправлено в чат {config.NOTIFICATION_CHAT_ID}")
+            # Короткая строка для сводки, если продажи придут пачкой
+            summary = f"• {data['amount']} {data['currency']} — {data['channel']} (@{manager_username})"
+            notifier.enqueue(notification_text, summary=summary)
             
         except Exception as e:
-            logger.error(f"❌ Ошибка отправки уведомления: {e}")
-            logger.error(f"NOTIFICATION_CHAT_ID: {config.NOTIFICATION_CHAT_ID}")
-        
-        logger.info(f"================================")
+            logger.error(f"❌ Ошибка постановки уведомления в очередь: {e}")
+
+    def _build_tenant(self, raw: Dict) -> Tenant:
+        """Команда из описания в TENANTS_FILE: свои очередь уведомлений и словарь алиасов"""
+        destinations = parse_destinations(raw.get('notification_chat_id', ''))
+        notifier = None
+        if destinations:
+            notifier = NotificationQueue(
+                self.bot, destinations,
+                coalesce_window=config.NOTIFICATION_COALESCE_SECONDS,
+                max_retries=config.NOTIFICATION_MAX_RETRIES
+            )
+        tenant_id = str(raw['id'])
+        aliases = None
+        if raw.get('aliases_file'):
+            aliases = AliasRegistry(raw['aliases_file'], reload_interval=config.ALIASES_RELOAD_SECONDS)
+        # Свой справочник каналов: алиасы команды перекрывают общие, выученное хранится отдельно
+        merged_channels = lambda: {**self.aliases.current.channels,
+                                   **(aliases.current.channels if aliases else {})}
+        channel_catalog = ChannelCatalog(merged_channels(), f"{config.CHANNEL_ALIASES_FILE}.{tenant_id}")
+        self.aliases.subscribe(lambda snapshot: channel_catalog.replace_aliases(merged_channels()))
+        if aliases:
+            aliases.subscribe(lambda snapshot: channel_catalog.replace_aliases(merged_channels()))
+            aliases.subscribe(lambda snapshot: self.parse_cache.clear())
+        return Tenant(
+            tenant_id, raw['spreadsheet_id'],
+            chats=raw.get('chats', []),
+            sheet_title=raw.get('sheet_title', 'Ноябрь'),
+            notifier=notifier,
+            aliases=aliases,
+            channel_catalog=channel_catalog,
+            requests_per_minute=float(raw.get('requests_per_minute', config.SHEETS_REQUESTS_PER_MINUTE)),
+            client=lambda: self.gspread_client
+        )
+
+    def _post_to_notification_chat(self, text: str):
+        """Отправляет HTML-текст во все получатели NOTIFICATION_CHAT_ID без склейки"""
+        self.notifier.enqueue(text)
         
     def _setup_google_sheets(self):
         """Настройка подключения к Google Sheets"""
@@ -287,11 +414,15 @@ class SalesBot:
 
             creds = Credentials.from_service_account_info(creds_data, scopes=config.SHEET_SCOPE)
             gc = gspread.authorize(creds)
+            self.credentials = creds
+            self.gspread_client = gc
             
             # Открываем таблицу и выбираем/создаем вкладку "Ноябрь"
             logger.info(f"Открываем Google Sheets с ID: {self.sheets_id}")
             spreadsheet = gc.open_by_key(self.sheets_id)
             self.spreadsheet = spreadsheet
+            # (Пере)подключение к таблице — список листов перечитаем
+            self.worksheet_index.invalidate()
             self.sheet = self._ensure_november_sheet(self.spreadsheet)
             
             # Создаем заголовки если их нет или если они неправильные
@@ -302,6 +433,12 @@ class SalesBot:
                     self.sheet.delete_rows(1)
                 # Добавляем правильные заголовки
                 self.sheet.insert_row(config.SHEET_HEADERS, 1)
+            
+            # Учим справочник каналов по колонке I ('Канал где была публикация')
+            try:
+                self.channel_catalog.learn(self.sheet.col_values(9)[1:])
+            except Exception as e:
+                logger.warning(f"Не удалось загрузить каналы из таблицы: {e}")
                 
             logger.info("Google Sheets подключен успешно")
             
@@ -340,13 +477,53 @@ class SalesBot:
                 logger.error(f"Ошибка обработки выбора месяца: {e}")
                 self.bot.answer_callback_query(call.id, text="Ошибка")
         
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith('money_page:'))
+        def money_page_callback(call):
+            self._handle_money_page(call)
+        
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(('anomaly_ok:', 'anomaly_no:')))
+        def anomaly_callback(call):
+            self._handle_anomaly_callback(call)
+        
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith(('suggest_ok:', 'suggest_no:')))
+        def suggestion_callback(call):
+            self._handle_suggestion_callback(call)
+        
+        @self.bot.callback_query_handler(func=lambda call: call.data.startswith('chart:'))
+        def chart_variant_callback(call):
+            self._handle_chart_callback(call)
+        
         @self.bot.message_handler(commands=['debug'])
         def debug_command(message):
             self._handle_debug(message)
         
+        @self.bot.message_handler(commands=['report'])
+        def report_command(message):
+            self._handle_report(message)
+        
+        @self.bot.message_handler(commands=['query'])
+        def query_command(message):
+            self._handle_query(message)
+        
+        @self.bot.message_handler(commands=['leaderboard'])
+        def leaderboard_command(message):
+            self._handle_leaderboard(message)
+        
+        @self.bot.message_handler(commands=['profile'])
+        def profile_command(message):
+            self._handle_profile(message)
+        
+        @self.bot.message_handler(commands=['export'])
+        def export_command(message):
+            self._handle_export(message)
+        
         @self.bot.message_handler(func=lambda message: True)
         def handle_message(message):
             self._handle_sales_message(message)
+        
+        @self.bot.edited_message_handler(func=lambda message: True)
+        def handle_edited_message(message):
+            self._handle_edited_message(message)
 
     def _ensure_november_sheet(self, spreadsheet):
         """Гарантирует наличие и возврат листа 'Ноябрь'"""
@@ -356,6 +533,8 @@ class SalesBot:
         except gspread.WorksheetNotFound:
             logger.info("Вкладка 'Ноябрь' не найдена. Создаем новую вкладку...")
             sheet = spreadsheet.add_worksheet(title='Ноябрь', rows=1000, cols=10)
+            # Появился новый лист — список листов перечитаем
+            self.worksheet_index.invalidate()
             return sheet
 
     def _init_sheets(self):
@@ -382,8 +561,12 @@ class SalesBot:
                 creds_data['private_key'] = creds_data['private_key'].replace('\\n', '\n')
             creds = Credentials.from_service_account_info(creds_data, scopes=config.SHEET_SCOPE)
             gc = gspread.authorize(creds)
+            self.credentials = creds
+            self.gspread_client = gc
             spreadsheet = gc.open_by_key(self.sheets_id)
             self.spreadsheet = spreadsheet
+            # (Пере)подключение к таблице — список листов перечитаем
+            self.worksheet_index.invalidate()
             self.sheet = self._ensure_november_sheet(self.spreadsheet)
         except Exception as e:
             logger.warning(f"_init_sheets: не удалось переинициализировать Google Sheets: {e}")
@@ -417,10 +600,17 @@ class SalesBot:
 • <code>Максим Шариков 12.06 1215 500р ип 1/48 внутренняя русский бизнес / вероятно купят еще</code>
 • <code>Максим Шариков 12.06 1215 500р крипта внешка 1/48 русский бизнес / вероятно купят еще</code>
 
+// <b>Исправление:</b>
+Отредактируйте свое сообщение — строка в таблице обновится. Чтобы удалить запись, замените текст на <code>удалить</code>.
+
 // <b>Доступные команды:</b>
 /start — Главное меню
 /stats — Статистика продаж
 /money — Финансовая статистика
+/report — Сводка: /report day | week | month
+/query — Запрос по продажам с фильтрами и группировкой
+/leaderboard — Рейтинг менеджеров: day | week | month | all [avg]
+/export — Выгрузка продаж в CSV/Parquet
 /debug — Отладка таблицы
 
 // <b>ID чата:</b> <code>{message.chat.id}</code>
@@ -435,12 +625,15 @@ class SalesBot:
     
     def _handle_stats(self, message):
         """Обработчик команды /stats"""
+        if self._refuse_foreign_tenant(message):
+            return
         stats_text = f"""
 📊 <b>Статистика продаж</b>
 
 💰 <b>Общая сумма:</b>
 • USDT: {self.stats['total_usdt']:.2f}
 • Рубли: {self.stats['total_rub']:.2f} ₽
+• Итого в {self.rates.reporting_currency}: {self.stats['total_normalized']:,.2f}
 
 📈 <b>Количество продаж:</b> {self.stats['total_sales']}
 
@@ -465,9 +658,12 @@ class SalesBot:
     
     def _handle_reset_stats(self, message):
         """Обнуление статистики"""
+        if self._refuse_foreign_tenant(message):
+            return
         self.stats = {
             'total_usdt': 0,
             'total_rub': 0,
+            'total_normalized': 0,
             'total_sales': 0,
             'sales_by_payment': {}
         }
@@ -477,38 +673,55 @@ class SalesBot:
             parse_mode='HTML'
         )
     
+    def _handle_profile(self, message):
+        """/profile [N] — профилировать следующие N вызовов обработчиков; /profile off — отменить"""
+        if message.from_user.id not in config.ADMIN_USER_IDS:
+            self.bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам")
+            return
+        args = (message.text or '').split()[1:]
+        if args and args[0].lower() in ('off', 'stop', 'выкл'):
+            self.profiler.disarm()
+            self.bot.send_message(message.chat.id, "🔬 Профилирование отменено")
+            return
+        try:
+            count = int(args[0]) if args else config.PROFILE_DEFAULT_COUNT
+        except ValueError:
+            self.bot.send_message(message.chat.id, "Использование: /profile [N] или /profile off")
+            return
+        count = max(1, min(count, config.PROFILE_MAX_COUNT))
+        admin_chat_id = message.chat.id
+        self.profiler.arm(
+            count, lambda summary: self.bot.send_message(admin_chat_id, summary, parse_mode='HTML')
+        )
+        self.bot.send_message(
+            message.chat.id,
+            f"🔬 Профилируются следующие {count} вызовов обработчиков. Сводка придет сюда, "
+            f"стеки и фазы — в {config.PROFILE_DIR}"
+        )
+    
     def _handle_money(self, message, month_title_override: Optional[str] = None):
         """Обработчик команды /money - финансовая статистика из таблицы"""
+        if self._refuse_foreign_tenant(message):
+            return
         try:
             if not self.sheet:
                 self._init_sheets()
             
             # Выбор листа: по умолчанию 'Ноябрь' или по клику пользователя
             target_title = month_title_override or 'Ноябрь'
-            if hasattr(self, 'spreadsheet') and self.spreadsheet:
-                try:
-                    target_sheet = self.spreadsheet.worksheet(target_title)
-                except gspread.WorksheetNotFound:
-                    target_sheet = None
-            else:
-                target_sheet = None
             
-            # Если нет нужного листа — показываем выбор доступных
-            if not target_sheet and hasattr(self, 'spreadsheet') and self.spreadsheet:
-                months = [ws.title for ws in self.spreadsheet.worksheets()]
-                keyboard = types.InlineKeyboardMarkup()
-                # первые 12
-                for title in months[:12]:
-                    keyboard.add(types.InlineKeyboardButton(title, callback_data=f"money_month:{title}"))
+            # Если нет нужного листа — показываем выбор доступных (список листов из кэша)
+            if getattr(self, 'spreadsheet', None) and target_title not in self.worksheet_index:
                 self.bot.send_message(
                     message.chat.id,
                     "Выберите лист (месяц) для статистики:",
-                    reply_markup=keyboard
+                    reply_markup=self._money_keyboard(None, 0)
                 )
                 return
 
-            # Получаем финансовые данные из выбранного листа
-            financial_data = self._get_financial_data(target_sheet)
+            # Получаем финансовые данные выбранного листа из локального зеркала
+            with self.profiler.phase('financial'):
+                financial_data = self._get_financial_data(target_title)
             
             if not financial_data:
                 self.bot.send_message(
@@ -527,30 +740,15 @@ class SalesBot:
 💵 <b>Выручка:</b>
 • USDT: {financial_data.get('revenue_usdt', 0):.2f}
 • RUB: {financial_data.get('revenue_rub', 0):,.0f}
-Суммарная выручка: {financial_data.get('total_revenue', 0):,.2f}
+Суммарная выручка, {self.rates.reporting_currency}: {financial_data.get('total_revenue', 0):,.2f}
 
 💸 <b>Чистыми заработано:</b>
 • USDT: {financial_data.get('net_usdt', 0):.2f}
 • RUB: {financial_data.get('net_rub', 0):,.0f}
-Суммарная прибыль: {financial_data.get('total_profit', 0):,.2f}
+Суммарная прибыль, {self.rates.reporting_currency}: {financial_data.get('total_profit', 0):,.2f}
 
 💼 <b>Комиссии по сейлзам:</b>
-
-👨‍💼 <b>Дима (5%):</b>
-• USDT: {financial_data.get('dima_commission_usdt', 0):.2f}
-• RUB: {financial_data.get('dima_commission_rub', 0):,.0f}
-
-👩‍💼 <b>Алина (15%):</b>
-• USDT: {financial_data.get('alina_commission_usdt', 0):.2f}
-• RUB: {financial_data.get('alina_commission_rub', 0):,.0f}
-
-👩‍💼 <b>Ксения (10%):</b>
-• USDT: {financial_data.get('ksenia_commission_usdt', 0):.2f}
-• RUB: {financial_data.get('ksenia_commission_rub', 0):,.0f}
-
-👨‍💼 <b>Роман (10%):</b>
-• USDT: {financial_data.get('roman_commission_usdt', 0):.2f}
-• RUB: {financial_data.get('roman_commission_rub', 0):,.0f}
+{self._format_month_commissions(target_title)}
 
 💳 <b>По типам оплаты:</b>
 • СБП: {financial_data.get('sbp_count', 0)}
@@ -559,183 +757,15 @@ class SalesBot:
 • ИП: {financial_data.get('ip_count', 0)}
             """
             
-            # Клавиатура: открыть таблицу + выбрать месяц
-            keyboard = types.InlineKeyboardMarkup()
-            keyboard.add(types.InlineKeyboardButton(
-                "📊 Открыть таблицу", 
-                url=f"https://docs.google.com/spreadsheets/d/{self.sheets_id}"
-            ))
-            if hasattr(self, 'spreadsheet') and self.spreadsheet:
-                months = [ws.title for ws in self.spreadsheet.worksheets()]
-                # compact rows of buttons
-                row = []
-                for title in months[:12]:
-                    row.append(types.InlineKeyboardButton(title, callback_data=f"money_month:{title}"))
-                    if len(row) == 3:
-                        keyboard.row(*row)
-                        row = []
-                if row:
-                    keyboard.row(*row)
+            # Строки листа (A:J) из локального зеркала: график и его варианты без чтения таблицы
+            rows = self.ledger.sheet_rows(target_title) if charts.available() else []
             
-            # Если доступен matplotlib — рендерим сводный дэшборд 2x2 и отправляем как фото с подписью
-            if plt:
+            # Клавиатура: открыть таблицу + выбрать месяц (страница с текущим листом) + варианты графика
+            page = page_of(self.worksheet_index.titles(), target_title, config.MONTH_PICKER_PAGE_SIZE)
+            keyboard = self._money_keyboard(target_title, page, with_charts=bool(rows))
+            if rows:
                 try:
-                    # Загружаем все строки из выбранного листа (A:J)
-                    all_values = target_sheet.get_all_values()
-                    if len(all_values) < 2:
-                        # Нет данных — отправляем текст
-                        self.bot.send_message(
-                            message.chat.id,
-                            money_text,
-                            parse_mode='HTML',
-                            reply_markup=keyboard
-                        )
-                        return
-
-                    header = all_values[0]
-                    rows = all_values[1:]
-
-                    # Индексы колонок согласно записи бота A:J
-                    IDX_DATE = 1   # 'Дата' в формате dd.mm.YYYY
-                    IDX_TIME = 2   # 'Время' HH:MM
-                    IDX_AMOUNT = 3 # float
-                    IDX_CURRENCY = 4
-                    IDX_PAYMENT = 5
-                    IDX_CHANNEL = 8
-
-                    # Агрегации
-                    from collections import defaultdict, Counter
-                    # 1) Ежедневная выручка по валютам
-                    daily_usdt = defaultdict(float)
-                    daily_rub = defaultdict(float)
-                    # 2) Микс способов оплаты (кол-во)
-                    payment_counts = Counter()
-                    # 3) Теплокарта День×Час
-                    heat = [[0 for _ in range(24)] for _ in range(7)]  # 0=Mon ... 6=Sun
-                    # 4) Pareto каналов по выручке (общая сумма в RUB-эквиваленте? показываем раздельно, но для сортировки — сумма в своей валюте отдельно не сопоставима. Выберем просто по количеству строк)
-                    channel_revenue = defaultdict(float)
-
-                    # Функции парсинга
-                    def parse_float_safe(s: str) -> float:
-                        try:
-                            return float(str(s).replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', ''))
-                        except Exception:
-                            return 0.0
-
-                    def parse_hour_safe(t: str) -> int:
-                        t = (t or '').strip()
-                        if not t:
-                            return 0
-                        if ':' not in t:
-                            if len(t) == 4:
-                                t = f"{t[:2]}:{t[2:]}"
-                            elif len(t) == 3:
-                                t = f"0{t[0]}:{t[1:]}"
-                        try:
-                            return int(t.split(':')[0])
-                        except Exception:
-                            return 0
-
-                    def parse_dow(date_str: str) -> int:
-                        # ожидаем dd.mm.YYYY
-                        try:
-                            day, month, year = date_str.split('.')
-                            dt = datetime(int(year), int(month), int(day))
-                            return dt.weekday()  # 0-6
-                        except Exception:
-                            return 0
-
-                    for r in rows:
-                        try:
-                            date_str = r[IDX_DATE] if len(r) > IDX_DATE else ''
-                            time_str = r[IDX_TIME] if len(r) > IDX_TIME else ''
-                            amount = parse_float_safe(r[IDX_AMOUNT] if len(r) > IDX_AMOUNT else '')
-                            currency = (r[IDX_CURRENCY] if len(r) > IDX_CURRENCY else '').strip().upper()
-                            payment = (r[IDX_PAYMENT] if len(r) > IDX_PAYMENT else '').strip()
-                            channel = (r[IDX_CHANNEL] if len(r) > IDX_CHANNEL else '').strip()
-
-                            if amount <= 0 or not date_str:
-                                continue
-
-                            # 1) daily by currency
-                            if currency == 'USDT':
-                                daily_usdt[date_str] += amount
-                            elif currency == 'RUB':
-                                daily_rub[date_str] += amount
-
-                            # 2) payment mix
-                            payment_key = payment if payment else 'Не указан'
-                            payment_counts[payment_key] += 1
-
-                            # 3) heatmap
-                            dow = parse_dow(date_str)
-                            hour = parse_hour_safe(time_str)
-                            if 0 <= dow <= 6 and 0 <= hour <= 23:
-                                heat[dow][hour] += 1
-
-                            # 4) channel pareto (по сумме без конвертации)
-                            channel_revenue[channel or '—'] += amount
-                        except Exception as parse_e:
-                            logger.debug(f"skip row due to parse error: {parse_e}")
-
-                    # Подготовка фигур
-                    fig, axes = plt.subplots(2, 2, figsize=(12, 8))
-                    fig.suptitle('Сводная аналитика', fontsize=14)
-                    plt.subplots_adjust(hspace=0.35, wspace=0.25)
-
-                    # A) Ежедневная выручка RUB (отдельная диаграмма)
-                    dates_sorted = sorted(set(list(daily_usdt.keys()) + list(daily_rub.keys())), key=lambda d: datetime.strptime(d, '%d.%m.%Y'))
-                    usdt_vals = [daily_usdt.get(d, 0) for d in dates_sorted]
-                    rub_vals = [daily_rub.get(d, 0) for d in dates_sorted]
-                    x = range(len(dates_sorted))
-                    axes[0,0].bar(x, rub_vals, color='#f28e2b')
-                    axes[0,0].set_title('Выручка по дням (RUB)')
-                    axes[0,0].set_xticks(list(x))
-                    axes[0,0].set_xticklabels([d[:-5] for d in dates_sorted], rotation=30)
-
-                    # B) Ежедневная выручка USDT (отдельная диаграмма)
-                    axes[0,1].bar(x, usdt_vals, color='#4e79a7')
-                    axes[0,1].set_title('Выручка по дням (USDT)')
-                    axes[0,1].set_xticks(list(x))
-                    axes[0,1].set_xticklabels([d[:-5] for d in dates_sorted], rotation=30)
-
-                    # C) Теплокарта активностей (День×Час)
-                    im = axes[1,0].imshow(heat, aspect='auto', cmap='YlOrRd')
-                    axes[1,0].set_title('Активность: дни×часы')
-                    axes[1,0].set_yticks(range(7))
-                    axes[1,0].set_yticklabels(['Пн','Вт','Ср','Чт','Пт','Сб','Вс'])
-                    axes[1,0].set_xticks([0,4,8,12,16,20,23])
-                    axes[1,0].set_xticklabels(['0','4','8','12','16','20','23'])
-                    fig.colorbar(im, ax=axes[1,0], fraction=0.046, pad=0.04)
-
-                    # D) Топ-каналы: бары + кумулятив
-                    top_items = sorted(channel_revenue.items(), key=lambda kv: kv[1], reverse=True)[:10]
-                    labels_d = [k if k else '—' for k,_ in top_items]
-                    vals_d = [v for _,v in top_items]
-                    if vals_d:
-                        x2 = range(len(vals_d))
-                        bars = axes[1,1].bar(x2, vals_d, color='#59a14f')
-                        axes[1,1].set_title('Топ-каналы')
-                        axes[1,1].set_xticks(list(x2))
-                        axes[1,1].set_xticklabels(labels_d, rotation=30, ha='right')
-                        # Кумулятивная линия от 0 до 100%
-                        total = sum(vals_d)
-                        cum = []
-                        s = 0
-                        for v in vals_d:
-                            s += v
-                            cum.append(s / total if total > 0 else 0)
-                        ax2 = axes[1,1].twinx()
-                        ax2.plot(list(x2), [c*100 for c in cum], color='#e15759', marker='o')
-                        ax2.yaxis.set_major_formatter(PercentFormatter())
-                        ax2.set_ylim(0, 105)
-                        ax2.grid(False)
-
-                    buf = BytesIO()
-                    fig.savefig(buf, format='png', dpi=180, bbox_inches='tight')
-                    plt.close(fig)
-                    buf.seek(0)
-
+                    buf = self._render_chart('dashboard', self._chart_data(rows))
                     # Отправляем как фото с подписью (caption)
                     self.bot.send_photo(
                         message.chat.id,
@@ -745,23 +775,17 @@ class SalesBot:
                         reply_markup=keyboard
                     )
                     buf.close()
+                    return
                 except Exception as e:
                     logger.warning(f"Не удалось отрисовать диаграмму: {e}")
-                    # Фоллбек: просто текст если график не собрался
-                    self.bot.send_message(
-                        message.chat.id,
-                        money_text,
-                        parse_mode='HTML',
-                        reply_markup=keyboard
-                    )
-            else:
-                # Если matplotlib недоступен — отправляем текст
-                self.bot.send_message(
-                    message.chat.id,
-                    money_text,
-                    parse_mode='HTML',
-                    reply_markup=keyboard
-                )
+            
+            # Без графика (нет matplotlib, нет данных или рендер не удался) — просто текст
+            self.bot.send_message(
+                message.chat.id,
+                money_text,
+                parse_mode='HTML',
+                reply_markup=keyboard
+            )
             
         except Exception as e:
             logger.error(f"Ошибка получения финансовых данных: {e}")
@@ -771,19 +795,287 @@ class SalesBot:
                 parse_mode='HTML'
             )
     
-    def _get_financial_data(self, sheet) -> Dict:
-        """Получение финансовых данных из указанного листа таблицы"""
+    def _fetch_worksheet_titles(self) -> List[str]:
+        if not getattr(self, 'spreadsheet', None):
+            return []
+        return [ws.title for ws in self.spreadsheet.worksheets() if ws.title != LEASE_SHEET_TITLE]
+
+    def _worksheet_sort_key(self, title: str):
+        """Листы-месяцы от новых к старым, остальные — после них по алфавиту"""
+        month = self._sheet_month(title)
+        if month:
+            return (0, -month.toordinal(), title)
+        return (1, 0, title.lower())
+
+    def _money_keyboard(self, current_title: Optional[str], page: int, with_charts: bool = False):
+        """Клавиатура /money: ссылка на таблицу, страница выбора листа, варианты графика"""
+        keyboard = types.InlineKeyboardMarkup()
+        if current_title:
+            keyboard.add(types.InlineKeyboardButton(
+                "📊 Открыть таблицу",
+                url=f"https://docs.google.com/spreadsheets/d/{self.sheets_id}"
+            ))
+        add_month_page(keyboard, self.worksheet_index.titles(), page, context=current_title or '',
+                       per_page=config.MONTH_PICKER_PAGE_SIZE)
+        if with_charts and current_title:
+            self._add_chart_buttons(keyboard, current_title)
+        return keyboard
+
+    def _handle_money_page(self, call):
+        """Листание выбора месяца: меняется только клавиатура того же сообщения"""
+        if not self.tenants.for_chat(call.message.chat.id).is_default:
+            self.bot.answer_callback_query(call.id, text=FOREIGN_TENANT_TEXT)
+            return
         try:
-            if not sheet:
-                return {}
-            
-            # Получаем все данные из таблицы
-            all_values = sheet.get_all_values()
-            
-            if len(all_values) < 2:  # Только заголовки
+            parts = call.data.split(':', 2)
+            if parts[1] == 'noop':
+                self.bot.answer_callback_query(call.id)
+                return
+            current_title = parts[2] if len(parts) > 2 else ''
+            keyboard = self._money_keyboard(
+                current_title or None, int(parts[1]),
+                with_charts=call.message.content_type == 'photo'
+            )
+            self.bot.edit_message_reply_markup(
+                call.message.chat.id, call.message.message_id, reply_markup=keyboard
+            )
+            self.bot.answer_callback_query(call.id)
+        except Exception as e:
+            logger.error(f"Ошибка листания списка месяцев: {e}")
+            self.bot.answer_callback_query(call.id, text="Ошибка")
+
+    def _chart_data(self, rows: List[List]) -> charts.ChartData:
+        with self.profiler.phase('chart_data'):
+            return charts.collect_chart_data(rows, self.rates.convert, self.rates.reporting_currency)
+
+    def _render_chart(self, variant: str, data: charts.ChartData, fmt: str = 'png'):
+        with self.profiler.phase('render'):
+            return self.chart_renderer.render(variant, data, fmt=fmt)
+
+    def _add_chart_buttons(self, keyboard, sheet_title: str):
+        """Ряд кнопок вариантов графика: chart:<вариант>:<лист>"""
+        buttons = [
+            types.InlineKeyboardButton(variant.title, callback_data=f"chart:{name}:{sheet_title}")
+            for name, variant in charts.VARIANTS.items()
+        ]
+        if config.CHART_SVG_ENABLED:
+            buttons.append(types.InlineKeyboardButton("SVG", callback_data=f"chart:svg:{sheet_title}"))
+        keyboard.row(*buttons[:3])
+        keyboard.row(*buttons[3:])
+
+    def _handle_chart_callback(self, call):
+        """Перерисовка графика /money в выбранном варианте (фото меняется на месте)"""
+        if not self.tenants.for_chat(call.message.chat.id).is_default:
+            self.bot.answer_callback_query(call.id, text=FOREIGN_TENANT_TEXT)
+            return
+        try:
+            _, variant, sheet_title = call.data.split(':', 2)
+            rows = self.ledger.sheet_rows(sheet_title) if charts.available() else []
+            if not rows or (variant != 'svg' and variant not in charts.VARIANTS):
+                self.bot.answer_callback_query(call.id, text="Нет данных для графика")
+                return
+            data = self._chart_data(rows)
+            if variant == 'svg':
+                buf = self._render_chart('dashboard', data, fmt='svg')
+                self.bot.send_document(call.message.chat.id, buf, visible_file_name=f"{sheet_title}.svg")
+            else:
+                buf = self._render_chart(variant, data)
+                if call.message.content_type == 'photo':
+                    caption = getattr(call.message, 'html_caption', None) or call.message.caption
+                    self.bot.edit_message_media(
+                        types.InputMediaPhoto(buf, caption=caption, parse_mode='HTML'),
+                        chat_id=call.message.chat.id,
+                        message_id=call.message.message_id,
+                        reply_markup=call.message.reply_markup
+                    )
+                else:
+                    self.bot.send_photo(call.message.chat.id, buf)
+            buf.close()
+            self.bot.answer_callback_query(call.id)
+        except Exception as e:
+            logger.error(f"Ошибка отрисовки варианта графика: {e}")
+            self.bot.answer_callback_query(call.id, text="Ошибка")
+
+    def _handle_report(self, message):
+        """Обработчик команды /report - сводка за текущий день/неделю/месяц из агрегатов"""
+        if self._refuse_foreign_tenant(message):
+            return
+        parts = (message.text or '').split()
+        arg = parts[1].lower() if len(parts) > 1 else 'day'
+        kinds = {'day': 'daily', 'день': 'daily', 'week': 'weekly', 'неделя': 'weekly',
+                 'month': 'monthly', 'месяц': 'monthly'}
+        kind = kinds.get(arg)
+        if not kind:
+            self.bot.send_message(
+                message.chat.id,
+                "Используйте: <code>/report day</code>, <code>/report week</code> или <code>/report month</code>",
+                parse_mode='HTML'
+            )
+            return
+        start, end = current_period(kind, datetime.now().date())
+        text = build_digest(kind, start, end, self.aggregates.summary(start, end), config.REPORT_TOP_CHANNELS)
+        self.bot.send_message(message.chat.id, text, parse_mode='HTML')
+
+    def _handle_query(self, message):
+        """Обработчик команды /query - фильтры и группировки по локальному зеркалу продаж"""
+        if self._refuse_foreign_tenant(message):
+            return
+        args = (message.text or '').split(maxsplit=1)
+        if len(args) < 2:
+            self.bot.send_message(message.chat.id, QUERY_HELP, parse_mode='HTML')
+            return
+        try:
+            query = parse_query(args[1], {
+                'channel': lambda value: self.channel_catalog.resolve(value, learn=False),
+                'payment': self._normalize_payment_type,
+            })
+            text = format_result(query, run_query(self.ledger, query))
+        except QueryError as e:
+            text = f"❌ {html.escape(str(e))}\n\nСправка: <code>/query</code>"
+        except Exception as e:
+            logger.error(f"Ошибка выполнения запроса: {e}")
+            text = "❌ Не удалось выполнить запрос"
+        self.bot.send_message(message.chat.id, text, parse_mode='HTML')
+
+    def _handle_leaderboard(self, message):
+        """Обработчик команды /leaderboard - рейтинг менеджеров за окно"""
+        if self._refuse_foreign_tenant(message):
+            return
+        args = [a.lower() for a in (message.text or '').split()[1:]]
+        aliases = {'день': 'day', 'неделя': 'week', 'месяц': 'month', 'все': 'all', 'всё': 'all'}
+        window = 'week'
+        by_average = False
+        for arg in args:
+            arg = aliases.get(arg, arg)
+            if arg in WINDOWS:
+                window = arg
+            elif arg in ('avg', 'средний'):
+                by_average = True
+            else:
+                self.bot.send_message(
+                    message.chat.id,
+                    "Используйте: <code>/leaderboard day|week|month|all [avg]</code>",
+                    parse_mode='HTML'
+                )
+                return
+        text = build_leaderboard(self.leaderboard, window, by_average=by_average,
+                                 display_name=self.commissions.display_name)
+        self.bot.send_message(message.chat.id, text, parse_mode='HTML')
+
+    def _handle_export(self, message):
+        """Обработчик команды /export - выгрузка продаж из зеркала документом (CSV.gz или Parquet)"""
+        if message.from_user.id not in config.ADMIN_USER_IDS:
+            self.bot.send_message(message.chat.id, "⛔ Команда доступна только администраторам")
+            return
+        if self._refuse_foreign_tenant(message):
+            return
+        args = (message.text or '').split(maxsplit=1)
+        filters = args[1].strip() if len(args) > 1 else ''
+        fmt = 'csv'
+        first = filters.split(maxsplit=1)[0].lower() if filters else ''
+        if first in ('csv', 'parquet'):
+            fmt = first
+            filters = filters[len(first):].strip()
+        if not filters:
+            self.bot.send_message(message.chat.id, EXPORT_HELP, parse_mode='HTML')
+            return
+        if fmt not in export_formats():
+            self.bot.send_message(message.chat.id, "❌ Parquet недоступен: на сервере не установлен pyarrow")
+            return
+        
+        output = None
+        try:
+            query = parse_query(filters, {
+                'channel': lambda value: self.channel_catalog.resolve(value, learn=False),
+                'payment': self._normalize_payment_type,
+            })
+            if query.group_by:
+                raise QueryError("Группировка by: в выгрузке не поддерживается")
+            writer = write_parquet if fmt == 'parquet' else write_csv_gz
+            output, count = writer(self.ledger, query, chunk_size=config.EXPORT_CHUNK_ROWS,
+                                   spool_bytes=config.EXPORT_SPOOL_BYTES)
+            if not count:
+                self.bot.send_message(message.chat.id, "Продаж по фильтру не найдено")
+                return
+            output.seek(0, os.SEEK_END)
+            if output.tell() > MAX_DOCUMENT_BYTES:
+                self.bot.send_message(message.chat.id, "❌ Выгрузка больше 50 МБ — сузьте период")
+                return
+            output.seek(0)
+            filename = f"sales_{datetime.now().strftime('%Y%m%d_%H%M')}.{'parquet' if fmt == 'parquet' else 'csv.gz'}"
+            caption = f"📤 Продаж: {count}"
+            if query.description:
+                caption += f"\n{', '.join(query.description)}"
+            self.bot.send_document(message.chat.id, output, visible_file_name=filename, caption=caption)
+        except QueryError as e:
+            self.bot.send_message(message.chat.id, f"❌ {html.escape(str(e))}\n\nСправка: <code>/export</code>", parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки: {e}")
+            self.bot.send_message(message.chat.id, "❌ Не удалось подготовить выгрузку")
+        finally:
+            if output:
+                output.close()
+
+    def _sheet_month(self, title: str) -> Optional[date]:
+        """Первое число месяца листа ('Ноябрь', 'Ноябрь 2025'); None — лист не про месяц"""
+        today = datetime.now().date()
+        lowered = (title or '').lower()
+        month = title_month(lowered)
+        if not month:
+            return None
+        year_match = re.search(r'(20\d{2})', lowered)
+        if year_match:
+            year = int(year_match.group(1))
+        else:
+            # Без года считаем, что речь о последнем наступившем таком месяце
+            year = today.year if month <= today.month else today.year - 1
+        return date(year, month, 1)
+
+    def _month_range_for_title(self, title: str) -> Tuple[date, date]:
+        """Диапазон дат месяца по названию листа; для листов не про месяц — текущий месяц"""
+        start = self._sheet_month(title) or datetime.now().date().replace(day=1)
+        end = date(start.year + (start.month == 12), start.month % 12 + 1, 1) - timedelta(days=1)
+        return start, end
+
+    def _format_month_commissions(self, month_title: str) -> str:
+        """Комиссии менеджеров за месяц листа.
+
+        Сейлзы с колонкой в листе (O–R) — по формулам таблицы, как раньше; если
+        колонки нет, а username сейлза указан — по правилам. Остальные
+        менеджеры — по правилам, посчитанным при записи продаж.
+        """
+        start, end = self._month_range_for_title(month_title)
+        managers = self.aggregates.summary(start, end)['managers']
+        sheet_summary = self.ledger.sheet_summary(month_title)
+        lines = []
+        for rule in self.commissions.sheet_rules():
+            commission = {currency: columns[rule.sheet_column] for currency, columns in sheet_summary.items()
+                          if rule.sheet_column in columns}
+            mapped = [username for username in managers if rule.manager and username.lower() == rule.manager]
+            if not commission and mapped:
+                commission = managers[mapped[0]].get('commission') or {}
+            for username in mapped:
+                managers.pop(username)
+            if not commission:
+                continue
+            lines.append(f"👨‍💼 <b>{html.escape(rule.name)} ({rule.rate:.0%}):</b>")
+            lines.append(f"• USDT: {commission.get('USDT', 0):.2f}")
+            lines.append(f"• RUB: {commission.get('RUB', 0):,.0f}")
+        for username, stats in sorted(managers.items()):
+            commission = stats.get('commission') or {}
+            if not commission:
+                continue
+            lines.append(f"👨‍💼 <b>{self.commissions.display_name(username)}:</b>")
+            lines.append(f"• USDT: {commission.get('USDT', 0):.2f}")
+            lines.append(f"• RUB: {commission.get('RUB', 0):,.0f}")
+        return '\n'.join(lines) if lines else "• нет начислений"
+
+    def _get_financial_data(self, sheet_title: str) -> Dict:
+        """Финансовые данные листа, посчитанные по локальному зеркалу продаж"""
+        try:
+            if not self._ensure_ledger_sheet(sheet_title):
                 return {}
             
-            # Ищем строки с финансовыми данными
             financial_data = {
                 'revenue_usdt': 0,
                 'revenue_rub': 0,
@@ -792,207 +1084,137 @@ class SalesBot:
                 'sbp_count': 0,
                 'card_count': 0,
                 'crypto_count': 0,
-                'ip_count': 0,
-                # Комиссии по сейлзам
-                'dima_commission_usdt': 0,
-                'dima_commission_rub': 0,
-                'alina_commission_usdt': 0,
-                'alina_commission_rub': 0,
-                'ksenia_commission_usdt': 0,
-                'ksenia_commission_rub': 0,
-                'roman_commission_usdt': 0,
-                'roman_commission_rub': 0
+                'ip_count': 0
             }
             
-            # Добавляем отладочное логирование
-            logger.info(f"Всего строк в таблице: {len(all_values)}")
+            # Выручка и чистые по валютам. Чистые — из формулы листа (колонка N): у строк,
+            # пришедших из таблицы при сверке, комиссии в зеркале нет. Без итогового блока
+            # в листе — выручка за вычетом комиссий по правилам
+            sheet_summary = self.ledger.sheet_summary(sheet_title)
+            total_revenue = total_profit = 0.0
+            for row in self.ledger.fetchall(
+                "SELECT currency, SUM(amount) AS revenue, SUM(COALESCE(commission, 0)) AS commission, "
+                "SUM(amount_normalized) AS revenue_normalized "
+                "FROM sales WHERE sheet = ? GROUP BY currency",
+                (sheet_title,)
+            ):
+                net = sheet_summary.get(row['currency'], {}).get('N')
+                if net is None:
+                    net = row['revenue'] - row['commission']
+                key = (row['currency'] or '').lower()
+                if key in ('usdt', 'rub'):
+                    financial_data[f'revenue_{key}'] = row['revenue']
+                    financial_data[f'net_{key}'] = net
+                # Прибыль в валюте отчетов: доля чистых от выручки по курсу дня каждой продажи
+                revenue_normalized = row['revenue_normalized'] or 0
+                total_revenue += revenue_normalized
+                if row['revenue']:
+                    total_profit += revenue_normalized * net / row['revenue']
             
-            # Проходим по всем строкам и ищем финансовые данные
-            for i, row in enumerate(all_values):
-                logger.info(f"Строка {i}: {row}")
-                
-                if len(row) >= 22:  # Проверяем, что строка достаточно длинная (до колонки V)
-                    # Ищем строки с валютами USDT и RUB в колонке L (индекс 11)
-                    if len(row) > 11 and row[11] in ['USDT', 'RUB']:
-                        currency = row[11]
-                        logger.info(f"Найдена валюта {currency} в строке {i}")
-                        logger.info(f"Полная строка: {row}")
-                        logger.info(f"Колонка O (индекс 14): '{row[14] if len(row) > 14 else 'НЕТ'}'")
-                        logger.info(f"Колонка Q (индекс 16): '{row[16] if len(row) > 16 else 'НЕТ'}'")
-                        
-                        # Выручка (колонка M, индекс 12)
-                        if len(row) > 12 and row[12]:
-                            try:
-                                revenue_str = row[12].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                revenue = float(revenue_str)
-                                if currency == 'USDT':
-                                    financial_data['revenue_usdt'] = revenue
-                                elif currency == 'RUB':
-                                    financial_data['revenue_rub'] = revenue
-                                logger.info(f"Выручка {currency}: {revenue}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга выручки: {e}, значение: {row[12]}")
-                        
-                        # Чистыми заработано (колонка N, индекс 13)
-                        if len(row) > 13 and row[13]:
-                            try:
-                                net_str = row[13].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                net = float(net_str)
-                                if currency == 'USDT':
-                                    financial_data['net_usdt'] = net
-                                elif currency == 'RUB':
-                                    financial_data['net_rub'] = net
-                                logger.info(f"Чистыми {currency}: {net}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга чистых: {e}, значение: {row[13]}")
-                        
-                        # Комиссии по сейлзам (колонки O, P, Q, R - индексы 14, 15, 16, 17)
-                        # Дима (колонка O, индекс 14)
-                        if len(row) > 14 and row[14]:
-                            try:
-                                original_value = row[14]
-                                commission_str = row[14].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                commission = float(commission_str)
-                                if currency == 'USDT':
-                                    financial_data['dima_commission_usdt'] = commission
-                                elif currency == 'RUB':
-                                    financial_data['dima_commission_rub'] = commission
-                                logger.info(f"Комиссия Димы {currency}: исходное='{original_value}', обработанное='{commission_str}', результат={commission}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга комиссии Димы: {e}, значение: {row[14]}")
-                        
-                        # Алина (колонка P, индекс 15)
-                        if len(row) > 15 and row[15]:
-                            try:
-                                commission_str = row[15].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                commission = float(commission_str)
-                                if currency == 'USDT':
-                                    financial_data['alina_commission_usdt'] = commission
-                                elif currency == 'RUB':
-                                    financial_data['alina_commission_rub'] = commission
-                                logger.info(f"Комиссия Алины {currency}: {commission}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга комиссии Алины: {e}, значение: {row[15]}")
-                        
-                        # Ксения (колонка Q, индекс 16)
-                        if len(row) > 16 and row[16]:
-                            try:
-                                original_value = row[16]
-                                commission_str = row[16].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                commission = float(commission_str)
-                                if currency == 'USDT':
-                                    financial_data['ksenia_commission_usdt'] = commission
-                                elif currency == 'RUB':
-                                    financial_data['ksenia_commission_rub'] = commission
-                                logger.info(f"Комиссия Ксении {currency}: исходное='{original_value}', обработанное='{commission_str}', результат={commission}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга комиссии Ксении: {e}, значение: {row[16]}")
-                        
-                        # Роман (колонка R, индекс 17)
-                        if len(row) > 17 and row[17]:
-                            try:
-                                commission_str = row[17].replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                                commission = float(commission_str)
-                                if currency == 'USDT':
-                                    financial_data['roman_commission_usdt'] = commission
-                                elif currency == 'RUB':
-                                    financial_data['roman_commission_rub'] = commission
-                                logger.info(f"Комиссия Романа {currency}: {commission}")
-                            except (ValueError, IndexError) as e:
-                                logger.warning(f"Ошибка парсинга комиссии Романа: {e}, значение: {row[17]}")
-                        
-                        # Счетчики по типам оплаты (колонки S, T, U, V - индексы 18, 19, 20, 21)
-                        if len(row) > 18 and row[18]:  # СБП
-                            try:
-                                financial_data['sbp_count'] = int(row[18])
-                                logger.info(f"СБП: {row[18]}")
-                            except (ValueError, IndexError):
-                                pass
-                        
-                        if len(row) > 19 and row[19]:  # Карта
-                            try:
-                                financial_data['card_count'] = int(row[19])
-                                logger.info(f"Карта: {row[19]}")
-                            except (ValueError, IndexError):
-                                pass
-                        
-                        if len(row) > 20 and row[20]:  # Крипта
-                            try:
-                                financial_data['crypto_count'] = int(row[20])
-                                logger.info(f"Крипта: {row[20]}")
-                            except (ValueError, IndexError):
-                                pass
-                        
-                        if len(row) > 21 and row[21]:  # ИП
-                            try:
-                                financial_data['ip_count'] = int(row[21])
-                                logger.info(f"ИП: {row[21]}")
-                            except (ValueError, IndexError):
-                                pass
+            # Счетчики по типам оплаты
+            payment_keys = {'СБП': 'sbp_count', 'Карта': 'card_count', 'Криптовалюта': 'crypto_count', 'ИП': 'ip_count'}
+            for row in self.ledger.fetchall(
+                "SELECT payment_type, COUNT(*) AS cnt FROM sales WHERE sheet = ? GROUP BY payment_type",
+                (sheet_title,)
+            ):
+                key = payment_keys.get(self._normalize_payment_type(row['payment_type'] or ''))
+                if key:
+                    financial_data[key] += row['cnt']
             
-            # Дополнительно читаем суммарные значения из ячеек M4 и N4
-            try:
-                # Читаем ячейку M4 (суммарная выручка)
-                m4_value = sheet.acell('M4').value
-                if m4_value:
-                    try:
-                        m4_clean = str(m4_value).replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                        financial_data['total_revenue'] = float(m4_clean)
-                        logger.info(f"Суммарная выручка из M4: {financial_data['total_revenue']}")
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Ошибка парсинга суммарной выручки из M4: {e}, значение: {m4_value}")
-                
-                # Читаем ячейку N4 (суммарная прибыль)
-                n4_value = sheet.acell('N4').value
-                if n4_value:
-                    try:
-                        n4_clean = str(n4_value).replace(' ', '').replace('\xa0', '').replace('₽', '').replace(',', '.')
-                        financial_data['total_profit'] = float(n4_clean)
-                        logger.info(f"Суммарная прибыль из N4: {financial_data['total_profit']}")
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"Ошибка парсинга суммарной прибыли из N4: {e}, значение: {n4_value}")
-                        
-            except Exception as e:
-                logger.warning(f"Не удалось прочитать ячейки M4/N4: {e}")
+            # Суммарные выручка и прибыль в валюте отчетов по курсу дня каждой продажи
+            # (раньше читались из формул M4/N4 листа отдельным запросом к API)
+            financial_data['total_revenue'] = total_revenue
+            financial_data['total_profit'] = total_profit
             
-            logger.info(f"Итоговые данные: {financial_data}")
             return financial_data
             
         except Exception as e:
             logger.error(f"Ошибка получения финансовых данных: {e}")
             return {}
-    
+
+    def _after_ledger_sync(self):
+        """После фоновой сверки: подхватываем новые курсы, пересобираем рейтинг и агрегаты отчетов"""
+        if self.rates.reload():
+            self.ledger.renormalize()
+        self.leaderboard.rebuild(self.ledger)
+        # Дни сверяемых месяцев пересчитываются по зеркалу: ручные строки и продажи,
+        # записанные до появления агрегатов, попадают в отчеты и комиссии /money
+        end = datetime.now().date()
+        start = end.replace(day=1)
+        for _ in range(config.LEDGER_RECONCILE_MONTHS - 1):
+            start = (start - timedelta(days=1)).replace(day=1)
+        rows = self.ledger.fetchall(
+            "SELECT date, amount, currency, channel, manager_username, commission FROM sales "
+            "WHERE date BETWEEN ? AND ?",
+            (start.isoformat(), end.isoformat())
+        )
+        self.aggregates.replace_range(start, end, (dict(row, date=from_iso_date(row['date'])) for row in rows))
+
+    def _fetch_recent_sheets(self) -> Iterator[Tuple[str, List[List[str]]]]:
+        """Листы для фоновой сверки зеркала: текущий и листы последних LEDGER_RECONCILE_MONTHS месяцев.
+
+        Прошлый месяц сверяется и после смены месяца, чтобы поздние ручные
+        правки доходили до /money и рейтинга.
+        """
+        if not self.sheet:
+            return
+        current = self.sheet.title
+        yield current, self.sheet.get_all_values()
+        this_month = cutoff = datetime.now().date().replace(day=1)
+        for _ in range(config.LEDGER_RECONCILE_MONTHS - 1):
+            cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+        for title in self.worksheet_index.titles():
+            month = self._sheet_month(title)
+            if title == current or not month or not cutoff <= month <= this_month:
+                continue
+            sheet = self._worksheet_by_title(title)
+            if sheet:
+                yield title, sheet.get_all_values()
+
+    def _ensure_ledger_sheet(self, sheet_title: str) -> bool:
+        """Гарантирует, что лист сверен с зеркалом не раньше LEDGER_RECONCILE_SECONDS назад; False — данных нет"""
+        synced = self.ledger.synced_at(sheet_title)
+        if synced is not None and time.time() - synced < config.LEDGER_RECONCILE_SECONDS:
+            return True
+        sheet = self._worksheet_by_title(sheet_title) if getattr(self, 'spreadsheet', None) else None
+        if not sheet:
+            # Без таблицы работаем с тем, что бот записал сам
+            return bool(self.ledger.fetchone('SELECT 1 FROM sales WHERE sheet = ? LIMIT 1', (sheet_title,)))
+        try:
+            self.ledger.sync_sheet(sheet_title, sheet.get_all_values())
+        except Exception as e:
+            if synced is None:
+                raise
+            # Старое зеркало лучше, чем ничего
+            logger.warning(f"Не удалось пересверить лист '{sheet_title}', показываем зеркало: {e}")
+        return True
+
     def _handle_debug(self, message):
-        """Отладочная команда для просмотра структуры таблицы"""
+        """Отладочная команда: состояние зеркала продаж; /debug sheet — сырые строки листа"""
         try:
             if not self.sheet:
                 self._init_sheets()
             
-            all_values = self.sheet.get_all_values()
-            
-            debug_text = f"🔍 <b>Отладка таблицы</b>\n\n"
-            debug_text += f"📊 Всего строк: {len(all_values)}\n\n"
+            if 'sheet' in (message.text or '').split()[1:]:
+                self._handle_debug_sheet(message)
+                return
             
-            # Показываем первые 5 строк
-            for i, row in enumerate(all_values[:5]):
-                debug_text += f"<b>Строка {i}:</b>\n"
-                for j, cell in enumerate(row):
-                    if cell:  # Показываем только непустые ячейки
-                        debug_text += f"  {chr(65+j)}{i+1}: {cell}\n"
-                debug_text += "\n"
+            debug_text = f"🔍 <b>Отладка</b>\n\n"
+            debug_text += f"📄 Текущий лист: {self.sheet.title if self.sheet else 'не подключен'}\n"
             
-            # Ищем строки с валютами
-            currency_rows = []
-            for i, row in enumerate(all_values):
-                if len(row) > 11 and row[11] in ['USDT', 'RUB']:
-                    currency_rows.append(f"Строка {i}: {row[11]} - {row[12] if len(row) > 12 else 'нет данных'}")
+            debug_text += "\n<b>Зеркало продаж (SQLite):</b>\n"
+            for row in self.ledger.fetchall(
+                "SELECT COALESCE(sheet, '—') AS sheet, COUNT(*) AS cnt, MAX(date) AS last_date "
+                "FROM sales GROUP BY sheet ORDER BY sheet"
+            ):
+                synced = self.ledger.synced_at(row['sheet'])
+                synced_text = datetime.fromtimestamp(synced).strftime('%d.%m %H:%M') if synced else 'нет'
+                debug_text += f"• {row['sheet']}: {row['cnt']} строк, последняя дата {row['last_date']}, сверка: {synced_text}\n"
             
-            if currency_rows:
-                debug_text += f"<b>Строки с валютами:</b>\n"
-                for row_info in currency_rows:
-                    debug_text += f"• {row_info}\n"
-            else:
-                debug_text += "<b>Строки с валютами не найдены</b>\n"
+            if self.sheet:
+                debug_text += f"\n<b>Последние строки листа {self.sheet.title}:</b>\n"
+                for values in self.ledger.sheet_rows(self.sheet.title)[-5:]:
+                    debug_text += f"• {' | '.join(str(v) for v in values if v != '')}\n"
             
             self.bot.send_message(
                 message.chat.id,
@@ -1007,9 +1229,43 @@ class SalesBot:
                 f"❌ Ошибка отладки: {str(e)}",
                 parse_mode='HTML'
             )
-    
-    def _parse_sales_message(self, text: str) -> Optional[Dict]:
-        """Парсинг сообщения о продаже"""
+
+    def _handle_debug_sheet(self, message):
+        """Первые строки листа и строки с валютами напрямую из таблицы"""
+        # Читаем только первые 50 строк вместо всего листа
+        all_values = self.sheet.get('A1:V50')
+        
+        debug_text = f"🔍 <b>Отладка таблицы</b>\n\n"
+        
+        # Показываем первые 5 строк
+        for i, row in enumerate(all_values[:5]):
+            debug_text += f"<b>Строка {i}:</b>\n"
+            for j, cell in enumerate(row):
+                if cell:  # Показываем только непустые ячейки
+                    debug_text += f"  {chr(65+j)}{i+1}: {cell}\n"
+            debug_text += "\n"
+        
+        # Ищем строки с валютами
+        currency_rows = []
+        for i, row in enumerate(all_values):
+            if len(row) > 11 and row[11] in ['USDT', 'RUB']:
+                currency_rows.append(f"Строка {i}: {row[11]} - {row[12] if len(row) > 12 else 'нет данных'}")
+        
+        if currency_rows:
+            debug_text += f"<b>Строки с валютами:</b>\n"
+            for row_info in currency_rows:
+                debug_text += f"• {row_info}\n"
+        else:
+            debug_text += "<b>Строки с валютами не найдены</b>\n"
+        
+        self.bot.send_message(
+            message.chat.id,
+            debug_text,
+            parse_mode='HTML'
+        )
+
+    def _parse_sales_message(self, text: str, tenant: Optional[Tenant] = None) -> Optional[Dict]:
+        """Парсинг сообщения о продаже (каналы и типы оплаты — по словарям команды)"""
         # Паттерны для различных форматов
         patterns = [
             # @ads_busine 17.09 17:00 148usdt криптовалюта 1/24 внутренняя русский бизнес
@@ -1077,7 +1333,7 @@ class SalesBot:
                         format_str = groups[6]
                         internal_external = groups[7]
                         channel = groups[8].strip()
-                        channel, comment = self._split_channel_and_comment(channel)
+                        channel, comment = self._split_channel_and_comment(channel, tenant)
                     else:
                         # Новый формат: Максим Шариков 12.06 1215 500р сбп 1/48 внешка русский бизнес / комментарий
                         date_str = groups[1]
@@ -1088,7 +1344,7 @@ class SalesBot:
                         format_str = groups[6]
                         internal_external = groups[7]
                         channel = groups[8].strip()
-                        channel, comment = self._split_channel_and_comment(channel)
+                        channel, comment = self._split_channel_and_comment(channel, tenant)
                 elif len(groups) == 9 and ' ' in manager:
                     # Формат: Максим Шариков 12.06 1215 500р крипта внешка 1/48 русский бизнес / комментарий
                     date_str = groups[1]
@@ -1099,7 +1355,7 @@ class SalesBot:
                     internal_external = groups[6]
                     format_str = groups[7]
                     channel = groups[8].strip()
-                    channel, comment = self._split_channel_and_comment(channel)
+                    channel, comment = self._split_channel_and_comment(channel, tenant)
                 elif len(groups) == 7 and groups[5] and '/' in str(groups[5]):
                     # Старый формат с форматом (7 групп)
                     if ' ' in manager:
@@ -1122,7 +1378,7 @@ class SalesBot:
                     currency = groups[4].lower()
                     format_str = groups[5]
                     channel = groups[6].strip()
-                    channel, comment = self._split_channel_and_comment(channel)
+                    channel, comment = self._split_channel_and_comment(channel, tenant)
                     payment_type = ""
                     internal_external = ""
                 elif len(groups) == 6:
@@ -1133,7 +1389,7 @@ class SalesBot:
                     currency = groups[4].lower()
                     format_str = ""
                     channel = groups[5].strip()
-                    channel, comment = self._split_channel_and_comment(channel)
+                    channel, comment = self._split_channel_and_comment(channel, tenant)
                     payment_type = ""
                     internal_external = ""
                 else:
@@ -1153,7 +1409,7 @@ class SalesBot:
                     currency = groups[4].lower()
                     format_str = groups[5]
                     channel = groups[6].strip()
-                    channel, comment = self._split_channel_and_comment(channel)
+                    channel, comment = self._split_channel_and_comment(channel, tenant)
                     payment_type = ""
                     internal_external = ""
                 
@@ -1181,10 +1437,10 @@ class SalesBot:
                         currency = 'RUB'  # По умолчанию рубли
                 
                 # Нормализация типа оплаты
-                payment_type = self._normalize_payment_type(payment_type)
+                payment_type = self._normalize_payment_type(payment_type, tenant)
                 
                 # Нормализация внешняя/внутренняя
-                internal_external = self._normalize_internal_external(internal_external)
+                internal_external = self._normalize_internal_external(internal_external, tenant)
                 
                 # Парсинг даты
                 try:
@@ -1193,41 +1449,11 @@ class SalesBot:
                         logger.error(f"Ошибка: date_str содержит время: {date_str}")
                         continue
                     
-                    if '.' in date_str:
-                        # Формат 14.05 или 12.12
-                        day, month = date_str.split('.')
-                        current_year = datetime.now().year
-                        parsed_date = datetime(current_year, int(month), int(day))
-                    elif '/' in date_str:
-                        # Формат 14/05 или 12/12
-                        day, month = date_str.split('/')
-                        current_year = datetime.now().year
-                        parsed_date = datetime(current_year, int(month), int(day))
-                    elif '-' in date_str:
-                        # Формат 14-05 или 12-12
-                        day, month = date_str.split('-')
-                        current_year = datetime.now().year
-                        parsed_date = datetime(current_year, int(month), int(day))
-                    else:
-                        # Формат "12 декабря" или "12 янв"
-                        month_names = {
-                            # Полные названия
-                            'января': 1, 'февраля': 2, 'марта': 3, 'апреля': 4,
-                            'мая': 5, 'июня': 6, 'июля': 7, 'августа': 8,
-                            'сентября': 9, 'октября': 10, 'ноября': 11, 'декабря': 12,
-                            # Сокращенные названия
-                            'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4,
-                            'май': 5, 'июн': 6, 'июл': 7, 'авг': 8,
-                            'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12
-                        }
-                        parts = date_str.split()
-                        if len(parts) < 2:
-                            logger.error(f"Ошибка: некорректный формат даты: {date_str}")
-                            continue
-                        day = int(parts[0])
-                        month = month_names.get(parts[1].lower(), 1)
-                        current_year = datetime.now().year
-                        parsed_date = datetime(current_year, month, day)
+                    # 14.05, 14/05, 14-05, 12 декабря; год — ближайший, в будущее не дальше MAX_FUTURE_DAYS
+                    parsed_date = parse_sale_date(date_str, datetime.now().date())
+                    if parsed_date is None:
+                        logger.warning(f"Невозможная или нераспознанная дата продажи: {date_str}")
+                        continue
                     
                     return {
                         'manager': manager,
@@ -1247,6 +1473,135 @@ class SalesBot:
         
         return None
     
+    def _looks_like_sale(self, text: str) -> bool:
+        """Дешевая проверка до регулярок парсера: есть сумма с валютой и дата"""
+        return bool(SALE_AMOUNT_RE.search(text)) and bool(SALE_DATE_RE.search(text))
+
+    def _parse_cached(self, text: str, tenant: Optional[Tenant] = None) -> Optional[Dict]:
+        """Парсинг с LRU-кэшем; ключ включает день (от него зависит год продажи) и команду"""
+        key = (text, datetime.now().date(), tenant.id if tenant is not None else None)
+        cached = self.parse_cache.get(key)
+        if cached is MISSING:
+            with self.profiler.phase('parse'):
+                cached = self._parse_sales_message(text, tenant)
+            self.parse_cache.put(key, cached)
+        # Вызывающий код дополняет результат — отдаем копию
+        return dict(cached) if cached else None
+
+    def _reply_unrecognized(self, message, suggest: bool = True):
+        """Исправление по найденным полям или подсказка по формату.
+
+        Общая подсказка — не чаще раза в PARSE_ERROR_REPLY_INTERVAL секунд на чат.
+        """
+        if suggest and self._suggest_correction(message):
+            return
+        now = time.monotonic()
+        last = self._error_reply_times.get(message.chat.id)
+        if last is not None and now - last < config.PARSE_ERROR_REPLY_INTERVAL:
+            logger.debug(f"Подсказка по формату для чата {message.chat.id} подавлена")
+            return
+        self._error_reply_times[message.chat.id] = now
+        self.bot.send_message(
+            message.chat.id,
+            "❓ Не удалось распознать формат сообщения.\n\n"
+            "Используйте формат:\n"
+            "<code>@менеджер дата время сумма [формат] канал</code>\n\n"
+            "Примеры:\n"
+            "• <code>@maxim 12 декабря 11:11 1489usdt 1/24 BusinessChannel</code>\n"
+            "• <code>@anna 14.05 11:11 500р каналбизнес</code>\n\n"
+            "<b>Доступные форматы:</b> 1/24, 1/48",
+            parse_mode='HTML'
+        )
+
+    def _suggest_correction(self, message) -> bool:
+        """Разбор по полям: что найдено, что нет, и исправленная строка с кнопкой «Принять».
+
+        False — сообщение слишком далеко от продажи, нужна общая подсказка.
+        """
+        text = (message.text or '').strip()
+        if not config.PARSE_SUGGESTIONS_ENABLED or not self._looks_like_sale(text):
+            return False
+        tenant = self.tenants.for_chat(message.chat.id)
+        snapshots = self._alias_snapshots(tenant)
+        diagnosis = diagnose_sale(text, datetime.now().date(),
+                                  payment_types={key for s in snapshots for key in s.payment_types},
+                                  internal_external={key for s in snapshots for key in s.internal_external})
+        if diagnosis.found < config.SUGGESTION_MIN_FIELDS:
+            return False
+        
+        lines = ["🤔 <b>Продажа распознана не полностью</b>", ""]
+        for name, title in FIELD_TITLES.items():
+            match = diagnosis.fields.get(name)
+            if match is None:
+                if name in REQUIRED_FIELDS:
+                    lines.append(f"❌ {title}: не найдено")
+                continue
+            if match.confidence <= 0:
+                lines.append(f"❌ {title}: <code>{html.escape(match.raw)}</code> — {match.note}")
+                continue
+            icon = '✅' if match.confidence >= config.SUGGESTION_SURE_CONFIDENCE else '⚠️'
+            lines.append(f"{icon} {title}: <code>{html.escape(match.raw)}</code>")
+        
+        keyboard = None
+        if diagnosis.complete():
+            data = diagnosis.sale_data()
+            # Канал из догадки не запоминаем — только если исправление примут
+            data['channel'], data['comment'] = self._split_channel_and_comment(data['channel'], tenant, learn=False)
+            data['payment_type'] = self._normalize_payment_type(data['payment_type'], tenant)
+            data['internal_external'] = self._normalize_internal_external(data['internal_external'], tenant)
+            data['manager_username'] = message.from_user.username
+            token = self.pending_suggestions.hold({
+                'data': data,
+                'chat_id': message.chat.id,
+                'message_id': message.message_id,
+                'user_id': message.from_user.id,
+                'tenant': None if tenant.is_default else tenant.id,
+            })
+            lines += ["", "Предлагаю записать так:", f"<code>{html.escape(format_sale_line(data))}</code>"]
+            keyboard = types.InlineKeyboardMarkup()
+            keyboard.row(
+                types.InlineKeyboardButton("✅ Принять", callback_data=f"suggest_ok:{token}"),
+                types.InlineKeyboardButton("❌ Отмена", callback_data=f"suggest_no:{token}")
+            )
+        else:
+            lines += ["", "Исправьте отмеченные поля и отправьте сообщение заново."]
+        
+        self.bot.send_message(
+            message.chat.id, '\n'.join(lines), parse_mode='HTML', reply_markup=keyboard,
+            reply_to_message_id=message.message_id
+        )
+        return True
+    
+    def _handle_suggestion_callback(self, call):
+        """Кнопки под исправлением: suggest_ok — записать исправленную продажу, suggest_no — отказаться"""
+        action, item = self._claim_pending(call, self.pending_suggestions)
+        if not item:
+            return
+        try:
+            if action == 'suggest_no':
+                self.bot.edit_message_text(
+                    "❌ Исправление отклонено. Отправьте продажу заново.",
+                    call.message.chat.id, call.message.message_id
+                )
+                return
+            # Сообщение уже записано (например, его исправили вручную, пока висела подсказка)
+            if self.message_index.get(item['chat_id'], item['message_id']):
+                self.bot.edit_message_text("ℹ️ Эта продажа уже записана", call.message.chat.id, call.message.message_id)
+                return
+            
+            data = item['data']
+            tenant = self.tenants.get(item['tenant'])
+            self._normalize_channel_name(data['channel'], tenant, learn=True)
+            data['commission'] = self.commissions.commission_for_sale(data)
+            self.bot.edit_message_text(
+                f"✅ Исправление принято: <code>{html.escape(format_sale_line(data))}</code>",
+                call.message.chat.id, call.message.message_id, parse_mode='HTML'
+            )
+            self._commit_sale(data, item['chat_id'], item['message_id'], tenant)
+        except Exception as e:
+            logger.error(f"Ошибка записи исправленной продажи: {e}")
+            self.bot.send_message(call.message.chat.id, "❌ Произошла ошибка при обработке данных. Попробуйте еще раз.")
+    
     def _validate_format(self, format_str: str) -> bool:
         """Валидация формата - принимаются только 1/24 или 1/48"""
         if not format_str:
@@ -1255,49 +1610,163 @@ class SalesBot:
         valid_formats = ['1/24', '1/48']
         return format_str in valid_formats
     
-    def _add_to_sheets(self, data: Dict):
-        """Добавление данных в Google Sheets"""
+    def _sheet_row(self, data: Dict) -> List:
+        """Строка таблицы A:J из распарсенной продажи"""
+        # Форматируем сумму с пробелами для тысяч
+        amount_str = self._format_amount(data['amount'])
+        
+        # Формируем данные в нужном формате
+        # Покупатель, Дата, Время, Сумма, Валюта, Тип оплаты, Формат, Внешняя/Внутренняя, Канал где была публикация, Комментарий
+        return [
+            str(data['manager']).strip(),  # Покупатель (без @, так как @ добавляется в парсере)
+            data['date'],  # Дата как строка без лишних символов
+            data['time'],  # Время как строка без лишних символов
+            float(amount_str),  # Сумма как число
+            str(data['currency']).strip(),  # Валюта
+            str(data.get('payment_type', '')).strip(),  # Тип оплаты
+            str(data.get('format', '')).strip(),  # Формат (может быть пустым)
+            str(data.get('internal_external', '')).strip(),  # Внешняя/Внутренняя
+            str(data['channel']).strip(),  # Канал
+            str(data.get('comment', '')).strip()  # Комментарий
+        ]
+
+    def _add_to_sheets(self, data: Dict) -> Optional[Tuple[str, int]]:
+        """Добавление данных в Google Sheets; возвращает (лист, номер строки) или None в режиме симуляции"""
         try:
-            # Форматируем сумму с пробелами для тысяч
-            amount_str = self._format_amount(data['amount'])
-            
-            # Формируем данные в нужном формате
-            # Покупатель, Дата, Время, Сумма, Валюта, Тип оплаты, Формат, Внешняя/Внутренняя, Канал где была публикация, Комментарий
-            row = [
-                str(data['manager']).strip(),  # Покупатель (без @, так как @ добавляется в парсере)
-                data['date'],  # Дата как строка без лишних символов
-                data['time'],  # Время как строка без лишних символов
-                float(amount_str),  # Сумма как число
-                str(data['currency']).strip(),  # Валюта
-                str(data.get('payment_type', '')).strip(),  # Тип оплаты
-                str(data.get('format', '')).strip(),  # Формат (может быть пустым)
-                str(data.get('internal_external', '')).strip(),  # Внешняя/Внутренняя
-                str(data['channel']).strip(),  # Канал
-                str(data.get('comment', '')).strip()  # Комментарий
-            ]
+            row = self._sheet_row(data)
             
             # На всякий случай каждый раз убеждаемся, что используем именно вкладку 'Ноябрь'
-            if hasattr(self, 'spreadsheet') and self.spreadsheet:
+            # (в пакетном режиме лист не перезапрашиваем на каждую строку)
+            if hasattr(self, 'spreadsheet') and self.spreadsheet and self._sheet_batch is None:
                 try:
                     self.sheet = self._ensure_november_sheet(self.spreadsheet)
                 except Exception as e:
                     logger.warning(f"Не удалось переутвердить лист 'Ноябрь' перед записью: {e}")
 
             if self.sheet:
+                with self._sheet_batch_lock:
+                    if self._sheet_batch is not None:
+                        return self._queue_sheet_row(row)
+                
+                self.tenants.default.throttle()
                 # Получаем следующую пустую строку
                 next_row = len(self.sheet.get_all_values()) + 1
                 logger.info(f"Добавляем данные в строку {next_row} Google Sheets")
                 
                 # Добавляем данные с явным указанием типов
                 self.sheet.update(f'A{next_row}:J{next_row}', [row], value_input_option='USER_ENTERED')
+                self.last_sheet_write = time.time()
                 logger.info(f"✅ Данные успешно добавлены в Google Sheets: {data}")
+                return self.sheet.title, next_row
             else:
                 logger.warning(f"❌ Google Sheets не подключен! Данные записаны в режиме симуляции: {data}")
                 logger.info(f"Строка для Google Sheets: {row}")
+                return None
             
         except Exception as e:
             logger.error(f"Ошибка добавления в Google Sheets: {e}")
             raise
+
+    def _add_to_tenant_sheet(self, tenant: Tenant, data: Dict) -> Optional[Tuple[str, int]]:
+        """Запись продажи в таблицу команды: лист по шаблону команды и дате продажи"""
+        row = self._sheet_row(data)
+        try:
+            day = datetime.strptime(data['date'], '%d.%m.%Y').date()
+        except (KeyError, ValueError):
+            day = None
+        location = tenant.append_row(tenant.worksheet_title(day), row, config.SHEET_HEADERS)
+        if location:
+            self.last_sheet_write = time.time()
+            logger.info(f"✅ Команда {tenant.id}: строка {location[1]} листа '{location[0]}': {data}")
+        else:
+            logger.warning(f"❌ Команда {tenant.id}: Google Sheets не подключен, запись в режиме симуляции: {data}")
+        return location
+
+    def _queue_sheet_row(self, row: List[str]) -> Tuple[str, int]:
+        """Пакетный режим: резервирует следующую строку без записи (под _sheet_batch_lock)"""
+        batch = self._sheet_batch
+        if not self._same_worksheet(batch['sheet'], self.sheet):
+            # Лист сменился (новый месяц) — дописываем накопленное в старый
+            self._flush_sheet_batch_locked()
+            batch['sheet'] = self.sheet
+        if batch['next_row'] is None:
+            batch['next_row'] = len(self.sheet.get_all_values()) + 1
+        if not batch['rows']:
+            batch['first_row'] = batch['next_row']
+        row_number = batch['next_row']
+        batch['rows'].append(row)
+        batch['next_row'] += 1
+        return self.sheet.title, row_number
+
+    def _flush_sheet_batch(self):
+        with self._sheet_batch_lock:
+            self._flush_sheet_batch_locked()
+
+    def _flush_sheet_batch_locked(self):
+        """Записывает накопленные строки одним update (диапазон строк подряд)"""
+        batch = self._sheet_batch
+        if not batch or not batch['rows']:
+            return
+        sheet, first, rows = batch['sheet'], batch['first_row'], batch['rows']
+        last = first + len(rows) - 1
+        batch['rows'] = []
+        batch['next_row'] = last + 1 if self._same_worksheet(sheet, self.sheet) else None
+        sheet.update(f'A{first}:J{last}', rows, value_input_option='USER_ENTERED')
+        self.last_sheet_write = time.time()
+        logger.info(f"✅ Пакетом записано строк: {len(rows)} (лист '{sheet.title}', {first}-{last})")
+
+    @staticmethod
+    def _same_worksheet(a, b) -> bool:
+        """gspread отдает новый объект Worksheet на каждый запрос — сравниваем по id листа"""
+        return a is not None and b is not None and a.id == b.id
+
+    @contextmanager
+    def _batched_sheet_writes(self):
+        """Строки продаж копятся в памяти и пишутся одним запросом на сброс пакета.
+
+        Номер строки выдается сразу (индекс сообщений и леджер получают его как
+        обычно), а get_all_values запрашивается один раз на пакет, а не на продажу.
+        """
+        with self._sheet_batch_lock:
+            self._sheet_batch = {'sheet': self.sheet, 'first_row': None, 'next_row': None, 'rows': []}
+        try:
+            yield
+        finally:
+            with self._sheet_batch_lock:
+                try:
+                    self._flush_sheet_batch_locked()
+                finally:
+                    self._sheet_batch = None
+
+    def _worksheet_by_title(self, title: str):
+        """Лист по названию; текущий лист берем без запроса метаданных"""
+        if self.sheet and self.sheet.title == title:
+            return self.sheet
+        if not getattr(self, 'spreadsheet', None):
+            return None
+        return self.spreadsheet.worksheet(title)
+
+    def _update_sheet_row(self, sheet_title: str, row_number: int, data: Optional[Dict],
+                          tenant: Optional[Tenant] = None):
+        """Перезаписывает одну строку A:J одним вызовом update; data=None очищает строку"""
+        values = self._sheet_row(data) if data else [''] * len(config.SHEET_HEADERS)
+        with self.profiler.phase('sheets'):
+            if tenant and not tenant.is_default:
+                if tenant.update_row(sheet_title, row_number, values):
+                    self.last_sheet_write = time.time()
+                else:
+                    logger.warning(f"❌ Команда {tenant.id}: правка строки {row_number} в режиме симуляции: {data}")
+                return
+            # Правка может касаться строки из еще не записанного пакета — иначе сброс затрет ее
+            self._flush_sheet_batch()
+            sheet = self._worksheet_by_title(sheet_title)
+            if not sheet:
+                logger.warning(f"❌ Google Sheets не подключен! Правка строки {row_number} в режиме симуляции: {data}")
+                return
+            self.tenants.default.throttle()
+            sheet.update(f'A{row_number}:J{row_number}', [values], value_input_option='USER_ENTERED')
+            self.last_sheet_write = time.time()
+        logger.info(f"✅ Строка {row_number} листа '{sheet_title}' обновлена: {data}")
     
     def _format_amount(self, amount: float) -> str:
         """Форматирование суммы без пробелов"""
@@ -1308,57 +1777,205 @@ class SalesBot:
             # Для дробных чисел
             return str(amount)
     
-    def _update_stats(self, data: Dict):
-        """Обновление статистики"""
-        self.stats['total_sales'] += 1
+    def _update_stats(self, data: Dict, sign: int = 1):
+        """Обновление статистики (sign=-1 откатывает продажу)"""
+        self.stats['total_sales'] += sign
         
         if data['currency'] == 'USDT':
-            self.stats['total_usdt'] += data['amount']
+            self.stats['total_usdt'] += data['amount'] * sign
         elif data['currency'] == 'RUB':
-            self.stats['total_rub'] += data['amount']
+            self.stats['total_rub'] += data['amount'] * sign
+        try:
+            self.stats['total_normalized'] += self.rates.convert(data['amount'], data['currency'], data.get('date')) * sign
+        except KeyError as e:
+            logger.warning(f"Статистика: {e}")
         
         # Обновляем статистику по методам оплаты
         payment_key = f"{data['currency']}"
-        self.stats['sales_by_payment'][payment_key] = self.stats['sales_by_payment'].get(payment_key, 0) + 1
+        self.stats['sales_by_payment'][payment_key] = self.stats['sales_by_payment'].get(payment_key, 0) + sign
     
     def _handle_sales_message(self, message):
         """Обработчик сообщений о продажах"""
         text = message.text.strip()
         
-        # Парсим сообщение
-        parsed_data = self._parse_sales_message(text)
+        # Болтовню без суммы и даты отсекаем без регулярок; в группах — молча
+        if not self._looks_like_sale(text):
+            if message.chat.type == 'private':
+                self._reply_unrecognized(message)
+            return
+        
+        # Парсим сообщение; канал и тип оплаты ищутся сначала в словаре команды чата
+        tenant = self.tenants.for_chat(message.chat.id)
+        parsed_data = self._parse_cached(text, tenant)
         
         if parsed_data:
+            # Сообщение уже записано (обработано до рестарта, но offset сохранить не успели)
+            if self.message_index.get(message.chat.id, message.message_id):
+                logger.info(f"Сообщение {message.chat.id}:{message.message_id} уже занесено — пропускаем")
+                return
+            
             # Валидируем формат
             if not self._validate_format(parsed_data.get('format', '')):
-                self.bot.send_message(
-                    message.chat.id,
-                    "❌ <b>Ошибка валидации формата!</b>\n\n"
-                    "Принимаются только следующие форматы:\n"
-                    "• <code>1/24</code>\n"
-                    "• <code>1/48</code>\n\n"
-                    "Другие значения не принимаются.",
-                    parse_mode='HTML'
-                )
+                self.bot.send_message(message.chat.id, self.FORMAT_ERROR_TEXT, parse_mode='HTML')
                 return
             
             try:
-                # Добавляем в Google Sheets
-                self._add_to_sheets(parsed_data)
-                
-                # Обновляем статистику
-                self._update_stats(parsed_data)
+                parsed_data['manager_username'] = message.from_user.username
+                parsed_data['commission'] = self.commissions.commission_for_sale(parsed_data)
                 
-                # Создаем клавиатуру с ссылкой на таблицу
-                keyboard = types.InlineKeyboardMarkup()
-                keyboard.add(types.InlineKeyboardButton(
-                    "📊 Открыть таблицу", 
-                    url=f"https://docs.google.com/spreadsheets/d/{self.sheets_id}"
-                ))
+                # Необычная сумма/валюта (лишний ноль, не та валюта) — сначала подтверждение
+                if self._hold_if_anomalous(message, parsed_data, tenant):
+                    return
+                self._commit_sale(parsed_data, message.chat.id, message.message_id, tenant)
                 
-                # Отправляем подтверждение
-                confirmation_text = f"""
-✅ <b>Данные занесены в учет менеджером @{message.from_user.username}</b>
+            except Exception as e:
+                logger.error(f"Ошибка обработки сообщения: {e}")
+                self.bot.send_message(
+                    message.chat.id,
+                    "❌ Произошла ошибка при обработке данных. Попробуйте еще раз."
+                )
+        else:
+            # Если сообщение не распознано как продажа
+            self._reply_unrecognized(message)
+    
+    def _commit_sale(self, parsed_data: Dict, chat_id: int, message_id: int, tenant: Tenant):
+        """Запись продажи в таблицу, локальный учет, подтверждение в чат и уведомление"""
+        # Добавляем в Google Sheets (таблицу команды чата)
+        with self.profiler.phase('sheets'):
+            if tenant.is_default:
+                location = self._add_to_sheets(parsed_data)
+            else:
+                location = self._add_to_tenant_sheet(tenant, parsed_data)
+        self._record_sale(parsed_data, location, chat_id, message_id, tenant)
+        
+        # Отправляем подтверждение
+        confirmation_text, keyboard = self._sale_confirmation(parsed_data)
+        self.bot.send_message(
+            chat_id,
+            confirmation_text,
+            parse_mode='HTML',
+            reply_markup=keyboard
+        )
+        
+        # Отправляем уведомление в другой чат
+        self._send_notification(parsed_data, tenant)
+    
+    def _hold_if_anomalous(self, message, parsed_data: Dict, tenant: Tenant) -> bool:
+        """Откладывает подозрительную продажу до подтверждения; True — продажа отложена"""
+        if not config.ANOMALY_CHECK_ENABLED:
+            return False
+        reasons = self.anomalies.check(parsed_data, scope=self._anomaly_scope(tenant))
+        if not reasons:
+            return False
+        token = self.pending_sales.hold({
+            'data': parsed_data,
+            'chat_id': message.chat.id,
+            'message_id': message.message_id,
+            'user_id': message.from_user.id,
+            'tenant': None if tenant.is_default else tenant.id,
+        })
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.row(
+            types.InlineKeyboardButton("✅ Записать", callback_data=f"anomaly_ok:{token}"),
+            types.InlineKeyboardButton("❌ Отмена", callback_data=f"anomaly_no:{token}")
+        )
+        text = "⚠️ <b>Продажа выглядит необычно — проверьте перед записью</b>\n\n"
+        text += '\n'.join(f"• {reason}" for reason in reasons)
+        text += (
+            f"\n\n💰 <b>Сумма:</b> {parsed_data['amount']} {parsed_data['currency']}\n"
+            f"📺 <b>Канал:</b> {parsed_data['channel']}\n"
+            f"📋 <b>Формат:</b> {parsed_data.get('format', 'Не указан')}"
+        )
+        self.bot.send_message(
+            message.chat.id, text, parse_mode='HTML', reply_markup=keyboard,
+            reply_to_message_id=message.message_id
+        )
+        logger.info(f"Продажа отложена до подтверждения ({token}): {reasons}")
+        return True
+    
+    def _claim_pending(self, call, store: PendingSales) -> Tuple[str, Optional[Dict]]:
+        """Забирает отложенную продажу по кнопке; подтвердить может автор продажи или админ"""
+        action, token = call.data.split(':', 1)
+        item = store.get(token)
+        if not item:
+            self.bot.answer_callback_query(call.id, text="Запрос устарел — отправьте продажу заново")
+            return action, None
+        if call.from_user.id != item['user_id'] and call.from_user.id not in config.ADMIN_USER_IDS:
+            self.bot.answer_callback_query(call.id, text="Подтвердить может только автор продажи")
+            return action, None
+        # None — вторая кнопка/повторное нажатие, пока первое обрабатывалось
+        item = store.pop(token)
+        self.bot.answer_callback_query(call.id)
+        return action, item
+    
+    def _handle_anomaly_callback(self, call):
+        """Кнопки под подозрительной продажей: anomaly_ok — записать, anomaly_no — отменить"""
+        action, item = self._claim_pending(call, self.pending_sales)
+        if not item:
+            return
+        
+        try:
+            if action == 'anomaly_no':
+                self.bot.edit_message_text(
+                    "❌ Запись отменена. Исправьте сообщение и отправьте продажу заново.",
+                    call.message.chat.id, call.message.message_id
+                )
+                return
+            # Сообщение уже записано (например, его исправили и записали, пока висело предупреждение)
+            if self.message_index.get(item['chat_id'], item['message_id']):
+                self.bot.edit_message_text("ℹ️ Эта продажа уже записана", call.message.chat.id, call.message.message_id)
+                return
+            
+            self.bot.edit_message_text(
+                f"✅ Подтверждено @{call.from_user.username or call.from_user.id}, записываем...",
+                call.message.chat.id, call.message.message_id
+            )
+            self._commit_sale(item['data'], item['chat_id'], item['message_id'], self.tenants.get(item['tenant']))
+        except Exception as e:
+            logger.error(f"Ошибка записи подтвержденной продажи: {e}")
+            self.bot.send_message(call.message.chat.id, "❌ Произошла ошибка при обработке данных. Попробуйте еще раз.")
+    
+    @staticmethod
+    def _anomaly_scope(tenant: Optional[Tenant]) -> str:
+        return '' if tenant is None or tenant.is_default else tenant.id
+
+    def _refuse_foreign_tenant(self, message) -> bool:
+        """Зеркало, агрегаты и рейтинг ведутся по таблице команды по умолчанию —
+        в чатах других команд отчеты по ним не показываются."""
+        if self.tenants.for_chat(message.chat.id).is_default:
+            return False
+        self.bot.send_message(message.chat.id, f"⛔ {FOREIGN_TENANT_TEXT}")
+        return True
+    
+    def _record_sale(self, parsed_data: Dict, location: Optional[Tuple[str, int]], chat_id: int, message_id: int,
+                     tenant: Optional[Tenant] = None):
+        """Локальный учет записанной продажи: индекс сообщений, зеркало, статистика, агрегаты, рейтинг.
+
+        Зеркало и аналитика ведутся по таблице команды по умолчанию; для остальных
+        команд запоминается только строка (для правок сообщения).
+        """
+        if location:
+            self.message_index.put(chat_id, message_id, location[0], location[1], parsed_data)
+        self.anomalies.observe(parsed_data, scope=self._anomaly_scope(tenant))
+        if tenant and not tenant.is_default:
+            return
+        sheet_title, row_number = location or (None, None)
+        self.ledger.record_sale(parsed_data, sheet_title, row_number, chat_id, message_id)
+        
+        # Обновляем статистику
+        self._update_stats(parsed_data)
+        self.aggregates.add_sale(parsed_data, commission=parsed_data['commission'])
+        self.leaderboard.add_sale(parsed_data)
+    
+    def _sale_confirmation(self, parsed_data: Dict) -> Tuple[str, types.InlineKeyboardMarkup]:
+        """Текст подтверждения записи и клавиатура со ссылкой на таблицу"""
+        keyboard = types.InlineKeyboardMarkup()
+        keyboard.add(types.InlineKeyboardButton(
+            "📊 Открыть таблицу", 
+            url=f"https://docs.google.com/spreadsheets/d/{self.sheets_id}"
+        ))
+        confirmation_text = f"""
+✅ <b>Данные занесены в учет менеджером @{parsed_data['manager_username']}</b>
 
 👤 <b>Покупатель:</b> {parsed_data['manager']}
 📅 <b>Дата:</b> {parsed_data['date']}
@@ -1369,98 +1986,322 @@ class SalesBot:
 🏢 <b>Внешняя/Внутренняя:</b> {parsed_data.get('internal_external', 'Не указано')}
 📺 <b>Канал:</b> {parsed_data['channel']}
 💬 <b>Комментарий:</b> {parsed_data.get('comment', 'Нет')}
-                """
-                
+        """
+        return confirmation_text, keyboard
+    
+    def _handle_edited_message(self, message):
+        """Правка сообщения о продаже: перезапись той же строки таблицы или ее очистка"""
+        entry = self.message_index.get(message.chat.id, message.message_id)
+        if not entry:
+            # Исходное сообщение не было записано (например, не распознано) — обрабатываем как новое;
+            # кнопки под прежним текстом больше не действуют
+            self.pending_sales.discard_message(message.chat.id, message.message_id)
+            self.pending_suggestions.discard_message(message.chat.id, message.message_id)
+            self._handle_sales_message(message)
+            return
+        
+        text = (message.text or '').strip()
+        old_data = entry['data']
+        tenant = self.tenants.for_chat(message.chat.id)
+        
+        try:
+            if text.lower() in DELETE_MARKERS:
+                self._update_sheet_row(entry['sheet'], entry['row'], None, tenant)
+                if tenant.is_default:
+                    self.ledger.delete_row(entry['sheet'], entry['row'])
+                    self._rollback_sale(old_data)
+                self.message_index.remove(message.chat.id, message.message_id)
                 self.bot.send_message(
                     message.chat.id,
-                    confirmation_text,
-                    parse_mode='HTML',
-                    reply_markup=keyboard
+                    f"🗑 Запись удалена (лист {entry['sheet']}, строка {entry['row']})",
+                    reply_to_message_id=message.message_id
                 )
-                
-                # Отправляем уведомление в другой чат
-                parsed_data['manager_username'] = message.from_user.username
-                self._send_notification(parsed_data)
-                
-            except Exception as e:
-                logger.error(f"Ошибка обработки сообщения: {e}")
+                return
+            
+            parsed_data = self._parse_cached(text, tenant) if self._looks_like_sale(text) else None
+            if not parsed_data:
+                self._reply_unrecognized(message, suggest=False)
+                return
+            if not self._validate_format(parsed_data.get('format', '')):
                 self.bot.send_message(
                     message.chat.id,
-                    "❌ Произошла ошибка при обработке данных. Попробуйте еще раз."
+                    "❌ <b>Ошибка валидации формата!</b> Принимаются только <code>1/24</code> и <code>1/48</code>.",
+                    parse_mode='HTML'
                 )
-        else:
-            # Если сообщение не распознано как продажа
+                return
+            
+            parsed_data['manager_username'] = old_data.get('manager_username') or message.from_user.username
+            parsed_data['commission'] = self.commissions.commission_for_sale(parsed_data)
+            self._update_sheet_row(entry['sheet'], entry['row'], parsed_data, tenant)
+            if tenant.is_default:
+                self.ledger.record_sale(parsed_data, entry['sheet'], entry['row'], message.chat.id, message.message_id)
+                self._rollback_sale(old_data)
+                self._update_stats(parsed_data)
+                self.aggregates.add_sale(parsed_data, commission=parsed_data['commission'])
+                self.leaderboard.add_sale(parsed_data)
+            self.message_index.put(message.chat.id, message.message_id, entry['sheet'], entry['row'], parsed_data)
+            
             self.bot.send_message(
                 message.chat.id,
-                "❓ Не удалось распознать формат сообщения.\n\n"
-                "Используйте формат:\n"
-                "<code>@менеджер дата время сумма [формат] канал</code>\n\n"
-                "Примеры:\n"
-                "• <code>@maxim 12 декабря 11:11 1489usdt 1/24 BusinessChannel</code>\n"
-                "• <code>@anna 14.05 11:11 500р каналбизнес</code>\n\n"
-                "<b>Доступные форматы:</b> 1/24, 1/48",
-                parse_mode='HTML'
+                f"✏️ <b>Запись обновлена</b> (лист {entry['sheet']}, строка {entry['row']})\n\n"
+                f"💰 <b>Сумма:</b> {parsed_data['amount']} {parsed_data['currency']}\n"
+                f"📺 <b>Канал:</b> {parsed_data['channel']}",
+                parse_mode='HTML',
+                reply_to_message_id=message.message_id
             )
-    
+        except Exception as e:
+            logger.error(f"Ошибка обработки правки сообщения: {e}")
+            self.bot.send_message(
+                message.chat.id,
+                "❌ Не удалось обновить запись. Попробуйте еще раз."
+            )
+
+    def _rollback_sale(self, data: Dict):
+        """Откатывает продажу из статистики, агрегатов и рейтинга"""
+        self._update_stats(data, sign=-1)
+        self.leaderboard.remove_sale(data)
+        commission = data.get('commission')
+        if commission is None:
+            commission = self.commissions.commission_for_sale(data)
+        self.aggregates.remove_sale(data, commission=commission)
+
     def run(self):
         """Запуск бота"""
         logger.info("Запуск бота...")
         
-        # Удаляем webhook и очищаем обновления
-        try:
-            self.bot.remove_webhook()
-            import time
-            time.sleep(3)
-            # Очищаем очередь обновлений
-            self.bot.get_updates(offset=-1)
-            time.sleep(2)
-        except Exception as e:
-            logger.warning(f"Ошибка при очистке: {e}")
-        
-        max_retries = 5
-        retry_count = 0
+        # Резервному экземпляру нужны только эндпоинты состояния
+        self._start_health()
         
-        while retry_count < max_retries:
+        prepared = False
+        # polling() сбрасывает флаг остановки при старте — сигнал, пришедший до него, проверяем сами
+        while not self.lifecycle.stopping:
+            # Резервный экземпляр ждет здесь, пока ведущий не освободит или не потеряет аренду
+            if not self.instance_lock.held and not self.instance_lock.wait_acquire(lambda: self.lifecycle.stopping):
+                break
+            self._start_background()
+            
+            if not prepared:
+                # Удаляем webhook и догоняем обновления, пришедшие, пока бот был остановлен
+                try:
+                    self.bot.remove_webhook()
+                    self._replay_backlog()
+                except Exception as e:
+                    logger.warning(f"Ошибка при догоняющей обработке: {e}")
+                prepared = True
+            else:
+                # Аренда захвачена снова: продолжаем с offset, до которого дошел другой ведущий
+                self.bot.last_update_id = max(self.bot.last_update_id, self.offset_store.load() or 0)
+            
             try:
+                # Возвращается при остановке по сигналу или потере аренды (stop_polling)
                 self.bot.polling(none_stop=True, interval=0, timeout=20)
-                break
             except Exception as e:
-                retry_count += 1
-                logger.error(f"Ошибка запуска бота (попытка {retry_count}/{max_retries}): {e}")
-                
-                if "409" in str(e) or "Conflict" in str(e):
-                    logger.info("Обнаружен конфликт 409, пытаемся снять webhook и очистить обновления...")
-                    try:
-                        self.bot.remove_webhook()
-                        import time
-                        time.sleep(5)
-                        # Очищаем очередь обновлений
-                        self.bot.get_updates(offset=-1)
-                        time.sleep(5)
-                    except Exception as webhook_error:
-                        logger.warning(f"Не удалось снять webhook: {webhook_error}")
-                
-                if retry_count < max_retries:
-                    import time
-                    time.sleep(10)  # Увеличиваем время ожидания
-                else:
-                    logger.error("Достигнуто максимальное количество попыток запуска")
-                    raise
+                logger.error(f"Ошибка polling: {e}")
+                time.sleep(5)
+            if not self.lifecycle.stopping and not self.instance_lock.held:
+                self._pause_background()
+        
+        # polling вернулся (stop_polling по сигналу) — дренаж и сохранение состояния
+        self.lifecycle.shutdown()
+
+    def _replay_backlog(self):
+        """Обрабатывает накопившиеся обновления пачками, начиная с сохраненного offset.
+
+        Каждая пачка проходит через обычные обработчики, после нее ждем опустошения
+        пула и записываем строки в таблицу одним запросом. Без сохраненного offset
+        Telegram отдает все неподтвержденные обновления — предыдущий экземпляр
+        подтверждает обработанные при остановке, так что это и есть пропущенное.
+        """
+        saved = self.offset_store.load()
+        self.bot.last_update_id = saved or 0
+        replayed = 0
+        with self._batched_sheet_writes():
+            while not self.lifecycle.stopping:
+                offset = self.bot.last_update_id + 1 if self.bot.last_update_id else None
+                updates = self.bot.get_updates(offset=offset, limit=config.REPLAY_BATCH_SIZE, timeout=0)
+                if not updates:
+                    break
+                self.bot.process_new_updates(updates)
+                self.lifecycle.wait_idle(config.SHUTDOWN_TIMEOUT)
+                self._flush_sheet_batch()
+                replayed += len(updates)
+        if replayed:
+            logger.info(f"Догоняющая обработка: {replayed} обновлений (с offset {saved})")
+
+    def _create_instance_lock(self) -> InstanceLock:
+        ttl = config.INSTANCE_LOCK_TTL
+        if config.INSTANCE_LOCK == 'sheet' and getattr(self, 'spreadsheet', None):
+            lease = SheetLease(self._lease_worksheet, instance_id(), ttl=ttl)
+        elif config.INSTANCE_LOCK in ('file', 'sheet'):
+            if config.INSTANCE_LOCK == 'sheet':
+                logger.warning("Таблица недоступна — блокировка экземпляра через файл")
+            lease = FileLease(config.INSTANCE_LOCK_FILE)
+        else:
+            lease = NoLease()
+        lock = InstanceLock(lease, renew_interval=ttl / 3, retry_interval=min(5.0, ttl / 3))
+        # Потеряв аренду, прекращаем polling и уходим в резерв (run снова ждет захвата)
+        lock.on_lost = self.bot.stop_polling
+        return lock
+
+    def _lease_worksheet(self):
+        """Служебный лист аренды; создается при первом обращении"""
+        if getattr(self, '_lease_sheet', None) is None:
+            try:
+                self._lease_sheet = self.spreadsheet.worksheet(LEASE_SHEET_TITLE)
+            except gspread.WorksheetNotFound:
+                self._lease_sheet = self.spreadsheet.add_worksheet(title=LEASE_SHEET_TITLE, rows=2, cols=3)
+                self._lease_sheet.update('A1:C1', [['holder', 'expires_at', 'renewed_at']])
+        return self._lease_sheet
+
+    def _probe_sheets(self):
+        """Дешевая проверка доступа к таблице: только id из метаданных, без чтения листов"""
+        self.spreadsheet.fetch_sheet_metadata(params={'fields': 'spreadsheetId'})
+
+    def _health_report(self) -> Dict:
+        """Состояние для /healthz и /readyz; к таблице обращается только кэшируемая проверка"""
+        now = time.time()
+        role = 'stopping' if self.lifecycle.stopping else ('leader' if self.instance_lock.held else 'standby')
+        
+        # Polling: ведущий должен получать обновления не реже раза в HEALTH_POLL_STALE_SECONDS
+        poll_age = self.heartbeat.age()
+        since = poll_age if poll_age is not None else now - self.heartbeat.started
+        polling_ok = role != 'leader' or since < config.HEALTH_POLL_STALE_SECONDS
+        
+        if os.getenv('DISABLE_GOOGLE_SHEETS', '').lower() in ['true', '1', 'yes']:
+            sheets = {'state': 'disabled', 'ok': True}
+        elif not self.sheet or not getattr(self, 'spreadsheet', None):
+            # Тихий переход в режим симуляции — продажи не попадают в таблицу
+            sheets = {'state': 'simulation', 'ok': False}
+        else:
+            sheets = {'state': 'connected', 'sheet': self.sheet.title, **self.sheets_probe.status()}
+        
+        notifications = self.notifier.pending() + sum(
+            t.notifier.pending() for t in self.tenants.extra() if t.notifier
+        )
+        live = polling_ok
+        ready = live and role == 'leader' and sheets['ok']
+        return {
+            'live': live,
+            'ready': ready,
+            'role': role,
+            'polling': {
+                'last_poll_age': round(poll_age, 1) if poll_age is not None else None,
+                'stale_after': config.HEALTH_POLL_STALE_SECONDS,
+                'ok': polling_ok,
+            },
+            'sheets': sheets,
+            'last_sheet_write_age': round(now - self.last_sheet_write, 1) if self.last_sheet_write else None,
+            'queues': {
+                'notifications': notifications,
+                'handlers_in_flight': self.lifecycle.in_flight(),
+            },
+            'caches': {
+                'parse': self.parse_cache.stats(),
+                'worksheet_index': self.worksheet_index.stats(),
+            },
+        }
+
+    def _drain_notifications(self, remaining: float) -> bool:
+        deadline = time.monotonic() + remaining
+        queues = [(self.notifier, config.NOTIFICATION_SPOOL_FILE)]
+        queues += [(t.notifier, self._tenant_spool_file(t)) for t in self.tenants.extra() if t.notifier]
+        drained = True
+        for notifier, spool_file in queues:
+            if not notifier.drain(max(0.0, deadline - time.monotonic())):
+                notifier.save_pending(spool_file)
+                drained = False
+        return drained
+
+    def _save_pending_sales(self):
+        """Продажи, ждущие кнопки, переживают рестарт: offset по их сообщениям уже сохранен"""
+        self.pending_sales.save(config.PENDING_SALES_FILE)
+        self.pending_suggestions.save(config.PENDING_SUGGESTIONS_FILE)
+
+    @staticmethod
+    def _tenant_spool_file(tenant: Tenant) -> str:
+        return f"{config.NOTIFICATION_SPOOL_FILE}.{tenant.id}"
+
+    def _start_health(self):
+        if self.health_server:
+            try:
+                self.health_server.start()
+            except OSError as e:
+                logger.error(f"Не удалось запустить эндпоинты состояния на порту {config.HEALTH_PORT}: {e}")
 
-def signal_handler(signum, frame):
-    """Обработчик сигналов для graceful shutdown"""
-    logger.info(f"Получен сигнал {signum}. Завершение работы...")
-    sys.exit(0)
+    def _reload_state(self):
+        """Перечитывает файлы состояния, которые вел прежний ведущий.
+
+        Резервный экземпляр загрузил их при старте и с тех пор не трогал. Без
+        перечитывания новый ведущий перезаписал бы файлы устаревшими данными,
+        повторил бы уже отправленный отчет и принял бы правку записанного
+        сообщения за новую продажу.
+        """
+        self.offset_store.reload()
+        self.message_index.reload()
+        self.aggregates.reload()
+        self.anomalies.reload()
+        self.channel_catalog.reload()
+        for tenant in self.tenants.extra():
+            if tenant.channel_catalog:
+                tenant.channel_catalog.reload()
+        if self.report_scheduler:
+            self.report_scheduler.reload()
+        # Рейтинг держится только в памяти — собираем заново из общего зеркала
+        self.leaderboard.rebuild(self.ledger)
+
+    def _start_background(self):
+        """Фоновые задачи ведущего экземпляра; вызывается после каждого захвата аренды.
+
+        Сначала перечитывается состояние, сохраненное прежним ведущим. Очереди
+        уведомлений восстанавливаются один раз — к этому моменту прежний
+        ведущий уже сохранил свою очередь (аренду он освобождает последним шагом
+        остановки). Отчеты и сверка зеркала работают только у ведущего.
+        """
+        self._reload_state()
+        if not self._background_started:
+            self.notifier.restore_pending(config.NOTIFICATION_SPOOL_FILE)
+            self.pending_sales.restore(config.PENDING_SALES_FILE)
+            self.pending_suggestions.restore(config.PENDING_SUGGESTIONS_FILE)
+            self.notifier.start()
+            self.aliases.start()
+            for tenant in self.tenants.extra():
+                if tenant.notifier:
+                    tenant.notifier.restore_pending(self._tenant_spool_file(tenant))
+                tenant.start()
+            self._background_started = True
+        self.ledger_reconciler.start()
+        if self.report_scheduler:
+            self.report_scheduler.start()
+
+    def _pause_background(self):
+        """Аренда потеряна: в резерве не отправляем отчеты и не сверяем зеркало"""
+        logger.info("Аренда потеряна — отчеты и сверка зеркала приостановлены")
+        self.ledger_reconciler.stop()
+        if self.report_scheduler:
+            self.report_scheduler.stop()
+
+    def _stop_background(self):
+        if self.health_server:
+            self.health_server.stop()
+        self.aliases.stop()
+        for tenant in self.tenants.extra():
+            tenant.stop()
+        self.ledger_reconciler.stop()
+        if self.report_scheduler:
+            self.report_scheduler.stop()
 
 if __name__ == "__main__":
-    # Регистрируем обработчики сигналов
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
-    
     try:
         logger.info("Запуск Sales Bot...")
-        bot = SalesBot()
-        bot.run()
+        if config.BOT_MODE == 'async':
+            # aiohttp нужен только асинхронному режиму — импортируем по требованию
+            from async_bot import AsyncSalesBot
+            AsyncSalesBot(SalesBot(threaded=False)).run()
+        else:
+            bot = SalesBot()
+            # Сигналы (SIGTERM при деплое, SIGINT) запускают плавную остановку вместо sys.exit
+            bot.lifecycle.install_signal_handlers()
+            bot.run()
     except KeyboardInterrupt:
         logger.info("Получен сигнал прерывания. Завершение работы...")
     except Exception as e:
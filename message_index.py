@@ -0,0 +1,59 @@
+import logging
+import threading
+from typing import Dict, Optional
+
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class MessageRowIndex:
+    """Соответствие сообщение Telegram -> строка таблицы, сохраняемое в JSON.
+
+    Вместе с адресом строки хранится распарсенная продажа, чтобы при
+    редактировании можно было откатить ее из агрегатов без чтения таблицы.
+    """
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = load_json(path, {})
+
+    def reload(self):
+        """Перечитывает индекс из файла (его мог изменить другой экземпляр)"""
+        with self._lock:
+            self._entries = load_json(self.path, {})
+
+    @staticmethod
+    def _key(chat_id: int, message_id: int) -> str:
+        return f"{chat_id}:{message_id}"
+
+    def get(self, chat_id: int, message_id: int) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(self._key(chat_id, message_id))
+            return dict(entry) if entry else None
+
+    def put(self, chat_id: int, message_id: int, sheet_title: str, row: int, data: Dict):
+        with self._lock:
+            key = self._key(chat_id, message_id)
+            # Переставляем в конец, чтобы обрезка удаляла самые старые записи
+            self._entries.pop(key, None)
+            self._entries[key] = {'sheet': sheet_title, 'row': row, 'data': data}
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._save_locked()
+
+    def remove(self, chat_id: int, message_id: int):
+        with self._lock:
+            if self._entries.pop(self._key(chat_id, message_id), None) is not None:
+                self._save_locked()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _save_locked(self):
+        try:
+            save_json_atomic(self.path, self._entries)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить индекс сообщений: {e}")
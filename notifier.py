@@ -0,0 +1,197 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from telebot.apihelper import ApiTelegramException
+
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+Destination = Tuple[str, Optional[int]]
+
+
+def parse_destinations(raw: str) -> List[Destination]:
+    """Разбирает список получателей 'chat[#topic],chat2[#topic2]' в пары (chat_id, topic_id)"""
+    destinations: List[Destination] = []
+    for item in (raw or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if '#' in item:
+            chat_id, topic_id = item.split('#', 1)
+            try:
+                destinations.append((chat_id.strip(), int(topic_id)))
+            except ValueError:
+                logger.warning(f"Некорректный ID топика в получателе уведомлений: {item}")
+        else:
+            destinations.append((item, None))
+    return destinations
+
+
+class NotificationQueue:
+    """Очередь исходящих уведомлений с отправкой в отдельном потоке.
+
+    Уведомления о продажах, пришедшие в пределах окна coalesce_window,
+    склеиваются в одно сводное сообщение. Каждое сообщение рассылается во все
+    получатели; при 429 ждем retry_after из ответа Telegram, при прочих
+    временных ошибках — экспоненциальный backoff.
+    """
+
+    def __init__(self, bot, destinations: List[Destination], coalesce_window: float = 3.0,
+                 max_retries: int = 5, max_size: int = 1000):
+        self.bot = bot
+        self.destinations = destinations
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self._queue: "queue.Queue[Tuple[str, Optional[str]]]" = queue.Queue(maxsize=max_size)
+        self._thread: Optional[threading.Thread] = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._loop, name='notification-queue', daemon=True)
+        self._thread.start()
+        logger.info(f"Очередь уведомлений запущена, получателей: {len(self.destinations)}")
+
+    def enqueue(self, text: str, summary: Optional[str] = None):
+        """Ставит сообщение в очередь. summary — строка для сводки при склейке; без нее не склеивается"""
+        if not self.destinations:
+            return
+        try:
+            self._queue.put_nowait((text, summary))
+        except queue.Full:
+            self.failed += 1
+            logger.error("Очередь уведомлений переполнена, уведомление отброшено")
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def drain(self, timeout: float) -> bool:
+        """Ждет отправки всего, что уже в очереди; True — очередь пуста до дедлайна"""
+        # При остановке не ждем окна склейки: все накопленное уйдет одним сообщением сразу
+        self.coalesce_window = 0
+        deadline = time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def save_pending(self, path: str) -> int:
+        """Сохраняет неотправленные уведомления в файл, чтобы отправить их после рестарта"""
+        items = []
+        while True:
+            try:
+                items.append(list(self._queue.get_nowait()))
+            except queue.Empty:
+                break
+            self._queue.task_done()
+        if items:
+            save_json_atomic(path, items)
+            logger.warning(f"Неотправленных уведомлений сохранено: {len(items)}")
+        return len(items)
+
+    def restore_pending(self, path: str) -> int:
+        """Возвращает в очередь уведомления, сохраненные при прошлой остановке"""
+        items = load_json(path, [])
+        for text, summary in items:
+            self.enqueue(text, summary)
+        if items:
+            os.remove(path)
+            logger.info(f"Восстановлено неотправленных уведомлений: {len(items)}")
+        return len(items)
+
+    def _loop(self):
+        while True:
+            text, summary = self._queue.get()
+            if summary is None:
+                self._deliver(text)
+                self._queue.task_done()
+                continue
+
+            # Собираем всплеск продаж, пришедших в пределах окна
+            batch = [(text, summary)]
+            standalone = []
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item[1] is None:
+                    standalone.append(item[0])
+                else:
+                    batch.append(item)
+
+            if len(batch) == 1:
+                self._deliver(batch[0][0])
+            else:
+                header = f"🧾 <b>Новых продаж: {len(batch)}</b>\n\n"
+                self._deliver(header + '\n'.join(s for _, s in batch))
+            for standalone_text in standalone:
+                self._deliver(standalone_text)
+            for _ in range(len(batch) + len(standalone)):
+                self._queue.task_done()
+
+    def _deliver(self, text: str):
+        for chunk in self._chunks(text):
+            for chat_id, topic_id in self.destinations:
+                if self._send_with_retry(chat_id, topic_id, chunk):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+
+    @staticmethod
+    def _chunks(text: str) -> List[str]:
+        if len(text) <= MAX_MESSAGE_LENGTH:
+            return [text]
+        chunks, current = [], ''
+        for line in text.split('\n'):
+            if current and len(current) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _send_with_retry(self, chat_id: str, topic_id: Optional[int], text: str) -> bool:
+        delay = 1.0
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                kwargs = {'parse_mode': 'HTML'}
+                if topic_id is not None:
+                    kwargs['message_thread_id'] = topic_id
+                self.bot.send_message(chat_id, text, **kwargs)
+                return True
+            except ApiTelegramException as e:
+                if e.error_code == 429:
+                    retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', delay)
+                    logger.warning(f"Telegram 429 для {chat_id}, ждем {retry_after} с")
+                    time.sleep(float(retry_after))
+                    continue
+                if 400 <= e.error_code < 500:
+                    # Ошибки запроса (нет доступа к чату, неверный топик) повтор не исправит
+                    logger.error(f"❌ Уведомление в {chat_id}#{topic_id} отклонено: {e}")
+                    return False
+                logger.warning(f"Ошибка Telegram при отправке в {chat_id} (попытка {attempt}): {e}")
+            except Exception as e:
+                logger.warning(f"Ошибка отправки уведомления в {chat_id} (попытка {attempt}): {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+        logger.error(f"❌ Не удалось отправить уведомление в {chat_id}#{topic_id} за {self.max_retries} попыток")
+        return False
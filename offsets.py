@@ -0,0 +1,41 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateOffsetStore:
+    """Последний полностью обработанный update_id, сохраняемый в JSON.
+
+    При старте бот продолжает с него (offset = last + 1) вместо сброса
+    очереди, поэтому продажи, присланные во время рестарта, не теряются.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last: Optional[int] = load_json(path, {}).get('last_update_id')
+
+    def load(self) -> Optional[int]:
+        return self._last
+
+    def reload(self) -> Optional[int]:
+        """Перечитывает файл: пока экземпляр ждал в резерве, offset сохранял ведущий"""
+        with self._lock:
+            self._last = load_json(self.path, {}).get('last_update_id')
+            return self._last
+
+    def save(self, update_id: int):
+        """Сохраняет update_id, если он больше уже сохраненного"""
+        with self._lock:
+            if not update_id or (self._last is not None and update_id <= self._last):
+                return
+            try:
+                save_json_atomic(self.path, {'last_update_id': update_id, 'saved_at': time.time()})
+                self._last = update_id
+            except OSError as e:
+                logger.warning(f"Не удалось сохранить offset обновлений: {e}")
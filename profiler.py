@@ -0,0 +1,206 @@
+import functools
+import html
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from lifecycle import HANDLER_LISTS
+
+logger = logging.getLogger(__name__)
+
+# Глубина стека в сэмпле: глубже — только шум telebot/urllib3
+MAX_STACK_DEPTH = 64
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame) -> str:
+    """Стек кадра в формате collapsed (корень;...;лист), как у flamegraph.pl/speedscope"""
+    labels: List[str] = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class _Capture:
+    """Один профилируемый вызов обработчика"""
+
+    def __init__(self, handler: str, thread_id: int):
+        self.handler = handler
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.samples: Counter = Counter()
+
+
+class HandlerProfiler:
+    """Профилирование следующих N вызовов обработчиков по команде /profile.
+
+    Пока захват не включен, обертка обработчика и phase() стоят одну проверку
+    флага. Во время захвата фоновый поток раз в interval секунд снимает стеки
+    потоков, выполняющих профилируемые обработчики (sys._current_frames), а
+    phase() засекает время участков (Sheets, парсинг, агрегация, отрисовка).
+    По каждому вызову в out_dir пишутся .folded (collapsed stacks) и .json
+    (фазы); по завершению всех N вызывается on_done со сводкой.
+    """
+
+    def __init__(self, out_dir: str, interval: float = 0.005):
+        self.out_dir = out_dir
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._remaining = 0
+        self._on_done: Optional[Callable[[str], None]] = None
+        self._active: Dict[int, _Capture] = {}
+        self._finished: List[_Capture] = []
+        self._files: List[str] = []
+        self._sampler: Optional[threading.Thread] = None
+
+    @property
+    def armed(self) -> int:
+        return self._remaining
+
+    def arm(self, count: int, on_done: Callable[[str], None]):
+        with self._lock:
+            self._remaining = count
+            self._on_done = on_done
+            self._finished = []
+            self._files = []
+
+    def disarm(self):
+        with self._lock:
+            self._remaining = 0
+
+    def instrument(self, bot):
+        """Оборачивает зарегистрированные обработчики TeleBot"""
+        for attribute in HANDLER_LISTS:
+            for handler in getattr(bot, attribute, []):
+                handler['function'] = self._wrap(handler['function'])
+
+    def _wrap(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not self._remaining:
+                return function(*args, **kwargs)
+            capture = self._begin(function.__name__)
+            if capture is None:
+                return function(*args, **kwargs)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._end(capture)
+        return wrapper
+
+    @contextmanager
+    def phase(self, name: str):
+        """Засекает участок обработчика; вне захвата ничего не делает"""
+        capture = getattr(self._local, 'capture', None)
+        if capture is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            capture.phases[name] += time.perf_counter() - started
+
+    def _begin(self, handler: str) -> Optional[_Capture]:
+        with self._lock:
+            if self._remaining <= 0:
+                return None
+            self._remaining -= 1
+            capture = _Capture(handler, threading.get_ident())
+            self._active[capture.thread_id] = capture
+            if not self._sampler or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name='profiler', daemon=True)
+                self._sampler.start()
+        self._local.capture = capture
+        return capture
+
+    def _end(self, capture: _Capture):
+        capture.elapsed = time.perf_counter() - capture.started
+        self._local.capture = None
+        with self._lock:
+            self._active.pop(capture.thread_id, None)
+            self._finished.append(capture)
+            index = len(self._finished)
+            done = self._remaining <= 0 and not self._active
+        try:
+            self._files.extend(self._write(capture, index))
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить профиль: {e}")
+        if done and self._on_done:
+            try:
+                self._on_done(self.summary())
+            except Exception as e:
+                logger.error(f"Не удалось отправить сводку профиля: {e}")
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    return
+                targets = dict(self._active)
+            frames = sys._current_frames()
+            for thread_id, capture in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    capture.samples[collapse_stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def _write(self, capture: _Capture, index: int) -> List[str]:
+        os.makedirs(self.out_dir, exist_ok=True)
+        stem = os.path.join(self.out_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{index:02d}-{capture.handler}")
+        with open(f"{stem}.folded", 'w', encoding='utf-8') as f:
+            for stack, count in capture.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{stem}.json", 'w', encoding='utf-8') as f:
+            json.dump({
+                'handler': capture.handler,
+                'elapsed_ms': round(capture.elapsed * 1000, 1),
+                'phases_ms': {k: round(v * 1000, 1) for k, v in capture.phases.items()},
+                'samples': sum(capture.samples.values()),
+                'interval_ms': self.interval * 1000,
+            }, f, ensure_ascii=False, indent=2)
+        return [f"{stem}.folded", f"{stem}.json"]
+
+    def summary(self, top: int = 5) -> str:
+        """HTML-сводка по завершенным вызовам: время, фазы, самые частые листовые функции"""
+        captures = list(self._finished)
+        lines = [f"🔬 <b>Профиль: {len(captures)} вызовов</b>", ""]
+        phases: Dict[str, float] = defaultdict(float)
+        leaves: Counter = Counter()
+        total = 0.0
+        for capture in captures:
+            total += capture.elapsed
+            phase_text = ', '.join(f"{k} {v * 1000:.0f}" for k, v in sorted(capture.phases.items(), key=lambda kv: -kv[1]))
+            lines.append(f"• {capture.handler}: {capture.elapsed * 1000:.0f} мс" + (f" ({phase_text})" if phase_text else ''))
+            for name, value in capture.phases.items():
+                phases[name] += value
+            for stack, count in capture.samples.items():
+                leaves[stack.rsplit(';', 1)[-1]] += count
+        if total > 0:
+            lines += ["", "<b>Фазы (доля времени):</b>"]
+            for name, value in sorted(phases.items(), key=lambda kv: -kv[1]):
+                lines.append(f"• {name}: {value * 1000:.0f} мс ({value / total:.0%})")
+            rest = total - sum(phases.values())
+            lines.append(f"• прочее: {rest * 1000:.0f} мс ({max(rest, 0) / total:.0%})")
+        samples = sum(leaves.values())
+        if samples:
+            lines += ["", f"<b>Горячие функции ({samples} сэмплов):</b>"]
+            for label, count in leaves.most_common(top):
+                lines.append(f"• <code>{html.escape(label)}</code> — {count / samples:.0%}")
+        lines += ["", f"📁 {self.out_dir} ({len(self._files)} файлов)"]
+        return '\n'.join(lines)
@@ -0,0 +1,219 @@
+import html
+import re
+import shlex
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from ledger import SalesLedger
+
+QUERY_HELP = """🔎 <b>Запрос по продажам</b>
+
+<code>/query [фильтры] [by:группировка]</code>
+
+<b>Фильтры:</b>
+• <code>period:</code> today, yesterday, week, lastweek, month, lastmonth, year, all
+• <code>from:01.11</code> <code>to:30.11.2025</code> — границы дат включительно
+• <code>@username</code> или <code>manager:@username</code> — кто занес продажу
+• <code>buyer:"Имя Фамилия"</code> — покупатель
+• <code>channel:"Русский бизнес"</code>, <code>currency:RUB</code>, <code>payment:сбп</code>, <code>format:1/24</code>
+
+<b>Группировка:</b> <code>by:</code> channel, manager, buyer, currency, payment, format, type, day, month
+
+<b>Примеры:</b>
+• <code>/query channel:рб currency:RUB period:lastweek</code>
+• <code>/query @maxim period:month by:channel</code>"""
+
+# Псевдонимы периодов (русские и английские)
+PERIODS = {
+    'today': 'today', 'сегодня': 'today',
+    'yesterday': 'yesterday', 'вчера': 'yesterday',
+    'week': 'week', 'неделя': 'week',
+    'lastweek': 'lastweek', 'прошлая_неделя': 'lastweek',
+    'month': 'month', 'месяц': 'month',
+    'lastmonth': 'lastmonth', 'прошлый_месяц': 'lastmonth',
+    'year': 'year', 'год': 'year',
+    'all': 'all', 'всё': 'all', 'все': 'all',
+}
+
+# Группировки -> SQL-выражение (только из белого списка)
+GROUPINGS = {
+    'channel': 'channel',
+    'manager': 'manager_username',
+    'buyer': 'manager',
+    'currency': 'currency',
+    'payment': 'payment_type',
+    'format': 'format',
+    'type': 'internal_external',
+    'day': 'date',
+    'month': "substr(date, 1, 7)",
+}
+
+_DATE_RE = re.compile(r'^(\d{1,2})\.(\d{1,2})(?:\.(\d{4}))?$')
+
+
+class QueryError(ValueError):
+    """Ошибка разбора запроса; текст показывается пользователю"""
+
+
+class SalesQuery(NamedTuple):
+    where: List[str]
+    params: List
+    group_by: Optional[str]
+    description: List[str]
+
+
+def period_range(period: str, today: date) -> Tuple[Optional[date], Optional[date]]:
+    if period == 'today':
+        return today, today
+    if period == 'yesterday':
+        day = today - timedelta(days=1)
+        return day, day
+    if period == 'week':
+        return today - timedelta(days=today.weekday()), today
+    if period == 'lastweek':
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if period == 'month':
+        return today.replace(day=1), today
+    if period == 'lastmonth':
+        end = today.replace(day=1) - timedelta(days=1)
+        return end.replace(day=1), end
+    if period == 'year':
+        return today.replace(month=1, day=1), today
+    return None, None
+
+
+def _parse_date(value: str, today: date) -> date:
+    match = _DATE_RE.match(value)
+    if not match:
+        raise QueryError(f"Некорректная дата: {value} (ожидается дд.мм или дд.мм.гггг)")
+    day, month, year = match.groups()
+    try:
+        return date(int(year) if year else today.year, int(month), int(day))
+    except ValueError:
+        raise QueryError(f"Несуществующая дата: {value}")
+
+
+def parse_query(text: str, normalizers: Dict[str, Callable[[str], str]],
+                today: Optional[date] = None) -> SalesQuery:
+    """Разбирает аргументы /query в условия SQL.
+
+    normalizers — функции нормализации значений ('channel', 'payment'), те же,
+    что применяются при записи продаж, чтобы фильтр совпадал с хранимыми данными.
+    """
+    today = today or datetime.now().date()
+    try:
+        tokens = shlex.split(text)
+    except ValueError as e:
+        raise QueryError(f"Ошибка в кавычках: {e}")
+
+    where: List[str] = []
+    params: List = []
+    description: List[str] = []
+    group_by = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+    for token in tokens:
+        if token.startswith('@') and ':' not in token:
+            key, value = 'manager', token
+        elif ':' in token:
+            key, value = token.split(':', 1)
+            key = key.lower()
+        else:
+            raise QueryError(f"Непонятный фильтр: {token}")
+        if not value:
+            raise QueryError(f"Пустое значение фильтра {key}")
+
+        if key == 'period':
+            period = PERIODS.get(value.lower())
+            if not period:
+                raise QueryError(f"Неизвестный период: {value}")
+            start, end = period_range(period, today)
+            description.append(f"период: {value}")
+        elif key == 'from':
+            start = _parse_date(value, today)
+        elif key == 'to':
+            end = _parse_date(value, today)
+        elif key == 'manager':
+            where.append('lower(manager_username) = ?')
+            params.append(value.lstrip('@').lower())
+            description.append(f"менеджер: @{value.lstrip('@')}")
+        elif key == 'buyer':
+            where.append('manager = ?')
+            params.append(value)
+            description.append(f"покупатель: {value}")
+        elif key == 'channel':
+            channel = normalizers.get('channel', str)(value)
+            where.append('channel = ?')
+            params.append(channel)
+            description.append(f"канал: {channel}")
+        elif key == 'currency':
+            currency = value.upper()
+            if currency not in ('RUB', 'USDT'):
+                raise QueryError(f"Неизвестная валюта: {value} (RUB или USDT)")
+            where.append('currency = ?')
+            params.append(currency)
+            description.append(f"валюта: {currency}")
+        elif key == 'payment':
+            payment = normalizers.get('payment', str)(value)
+            where.append('payment_type = ?')
+            params.append(payment)
+            description.append(f"оплата: {payment}")
+        elif key == 'format':
+            where.append('format = ?')
+            params.append(value)
+            description.append(f"формат: {value}")
+        elif key == 'by':
+            if value.lower() not in GROUPINGS:
+                raise QueryError(f"Неизвестная группировка: {value}")
+            group_by = value.lower()
+        else:
+            raise QueryError(f"Неизвестный фильтр: {key}")
+
+    if start:
+        where.append('date >= ?')
+        params.append(start.isoformat())
+    if end:
+        where.append('date <= ?')
+        params.append(end.isoformat())
+    if start or end:
+        description.append(
+            f"даты: {start.strftime('%d.%m.%Y') if start else '…'} — {end.strftime('%d.%m.%Y') if end else '…'}"
+        )
+    return SalesQuery(where, params, group_by, description)
+
+
+def run_query(ledger: SalesLedger, query: SalesQuery, limit: int = 30) -> List[Dict]:
+    """Сумма, количество и средний чек по группам; валюты никогда не складываются между собой"""
+    group_expr = GROUPINGS[query.group_by] if query.group_by else "''"
+    where = ' AND '.join(query.where) if query.where else '1'
+    # Временные группировки показываем хронологически, остальные — по убыванию суммы
+    # в валюте отчетов (сырые суммы USDT и RUB между собой не сравнимы)
+    order = 'grp, currency' if query.group_by in ('day', 'month') else 'total_normalized DESC, currency, total DESC'
+    rows = ledger.fetchall(
+        f"""SELECT {group_expr} AS grp, currency, SUM(amount) AS total, COUNT(*) AS cnt,
+                   COALESCE(SUM(amount_normalized), 0) AS total_normalized
+            FROM sales WHERE {where}
+            GROUP BY grp, currency
+            ORDER BY {order}
+            LIMIT ?""",
+        [*query.params, limit]
+    )
+    return [dict(r) for r in rows]
+
+
+def format_result(query: SalesQuery, rows: List[Dict]) -> str:
+    lines = ["🔎 <b>Результат запроса</b>"]
+    if query.description:
+        lines.append(html.escape(', '.join(query.description)))
+    lines.append('')
+    if not rows:
+        lines.append("Продаж не найдено")
+        return '\n'.join(lines)
+    for r in rows:
+        total = f"{r['total']:,.0f}" if r['currency'] == 'RUB' else f"{r['total']:,.2f}"
+        average = r['total'] / r['cnt'] if r['cnt'] else 0
+        label = f"<b>{html.escape(str(r['grp'] or '—'))}</b>: " if query.group_by else ''
+        lines.append(f"• {label}{total} {r['currency']} — {r['cnt']} шт., средний чек {average:,.0f}")
+    return '\n'.join(lines)
@@ -0,0 +1,107 @@
+import bisect
+import logging
+import os
+import threading
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+from storage import load_json
+
+logger = logging.getLogger(__name__)
+
+# Базовая валюта таблицы курсов: все курсы заданы как "RUB за 1 единицу валюты"
+BASE_CURRENCY = 'RUB'
+
+
+def _as_date(day: Union[date, str, None]) -> Optional[date]:
+    """date, ISO 'YYYY-MM-DD' или 'dd.mm.YYYY' -> date"""
+    if isinstance(day, date):
+        return day
+    for fmt in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime((day or '').strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+class RateTable:
+    """Таблица курсов по дням для приведения выручки к одной валюте отчетов.
+
+    Файл — JSON вида {"USDT": {"2025-11-01": 96.5, ...}} (рублей за единицу).
+    Для даты без курса берется ближайший предыдущий известный курс; до первой
+    даты таблицы и для валют без таблицы — курс по умолчанию. Результаты
+    поиска кэшируются в памяти; reload() перечитывает файл при его изменении.
+    """
+
+    def __init__(self, path: str, default_rates: Dict[str, float], reporting_currency: str = BASE_CURRENCY):
+        self.path = path
+        self.default_rates = {k.upper(): v for k, v in default_rates.items()}
+        self.reporting_currency = reporting_currency.upper()
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Tuple[List[str], List[float]]] = {}
+        self._cache: Dict[Tuple[str, date], float] = {}
+        self._mtime: Optional[float] = None
+        self.reload()
+
+    def reload(self) -> bool:
+        """Перечитывает файл курсов, если он изменился; True — таблица обновлена"""
+        try:
+            mtime = os.path.getmtime(self.path) if self.path else None
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime:
+            return False
+        tables = {}
+        for currency, series in (load_json(self.path, {}) or {}).items():
+            points = []
+            for day, rate in (series or {}).items():
+                parsed = _as_date(day)
+                try:
+                    rate = float(rate)
+                except (TypeError, ValueError):
+                    parsed = None
+                if parsed and rate > 0:
+                    points.append((parsed.isoformat(), rate))
+                else:
+                    logger.warning(f"Курсы: пропущена запись {currency} {day}: {rate}")
+            points.sort()
+            tables[currency.upper()] = ([p[0] for p in points], [p[1] for p in points])
+        with self._lock:
+            self._tables = tables
+            self._cache.clear()
+            self._mtime = mtime
+        if mtime is not None:
+            logger.info(f"Курсы валют загружены из {self.path}: {', '.join(sorted(tables)) or 'пусто'}")
+        return True
+
+    def rate(self, currency: str, day: Union[date, str, None] = None) -> float:
+        """Курс валюты к базовой (RUB) на дату"""
+        currency = (currency or '').upper()
+        if currency == BASE_CURRENCY:
+            return 1.0
+        day = _as_date(day) or datetime.now().date()
+        key = (currency, day)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            dates, values = self._tables.get(currency, ([], []))
+            index = bisect.bisect_right(dates, day.isoformat()) - 1
+            if index >= 0:
+                value = values[index]
+            elif currency in self.default_rates:
+                value = self.default_rates[currency]
+            else:
+                raise KeyError(f"Нет курса для валюты {currency}")
+            self._cache[key] = value
+            return value
+
+    def convert(self, amount: float, currency: str, day: Union[date, str, None] = None,
+                target: Optional[str] = None) -> float:
+        """Сумма в валюте отчетов (или target) по курсу на дату продажи"""
+        target = (target or self.reporting_currency).upper()
+        currency = (currency or '').upper()
+        if currency == target:
+            return float(amount)
+        return float(amount) * self.rate(currency, day) / self.rate(target, day)
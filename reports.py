@@ -0,0 +1,176 @@
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aggregates import SalesAggregates
+from storage import load_json, save_json_atomic
+
+logger = logging.getLogger(__name__)
+
+PERIOD_TITLES = {
+    'daily': 'Ежедневный отчет',
+    'weekly': 'Еженедельный отчет',
+    'monthly': 'Ежемесячный отчет',
+}
+
+
+def previous_period(kind: str, today: date) -> Tuple[str, date, date]:
+    """Возвращает (ключ, начало, конец) последнего завершенного периода"""
+    if kind == 'daily':
+        day = today - timedelta(days=1)
+        return day.isoformat(), day, day
+    if kind == 'weekly':
+        start = today - timedelta(days=today.weekday() + 7)
+        end = start + timedelta(days=6)
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}", start, end
+    if kind == 'monthly':
+        end = today.replace(day=1) - timedelta(days=1)
+        start = end.replace(day=1)
+        return f"{start.year}-{start.month:02d}", start, end
+    raise ValueError(f"Неизвестный тип отчета: {kind}")
+
+
+def current_period(kind: str, today: date) -> Tuple[date, date]:
+    """Возвращает (начало, сегодня) текущего, еще не завершенного периода"""
+    if kind == 'daily':
+        return today, today
+    if kind == 'weekly':
+        return today - timedelta(days=today.weekday()), today
+    if kind == 'monthly':
+        return today.replace(day=1), today
+    raise ValueError(f"Неизвестный тип отчета: {kind}")
+
+
+def _format_value(currency: str, value: float) -> str:
+    return f"{value:,.0f}" if currency == 'RUB' else f"{value:,.2f}"
+
+
+def _format_amounts(amounts: Dict[str, float]) -> str:
+    if not amounts:
+        return '0'
+    return ', '.join(f"{_format_value(c, amounts[c])} {c}" for c in sorted(amounts))
+
+
+def build_digest(kind: str, start: date, end: date, summary: Dict, top_channels: int = 5) -> str:
+    """Формирует HTML-текст сводного отчета за период"""
+    if start == end:
+        period = start.strftime('%d.%m.%Y')
+    else:
+        period = f"{start.strftime('%d.%m.%Y')} — {end.strftime('%d.%m.%Y')}"
+
+    lines: List[str] = [
+        f"📊 <b>{PERIOD_TITLES.get(kind, 'Отчет')}</b>",
+        f"📅 <b>Период:</b> {period}",
+        "",
+        f"🧾 <b>Продаж:</b> {summary['count']}",
+        "",
+        "💵 <b>Выручка:</b>",
+    ]
+    if summary['revenue']:
+        for currency in sorted(summary['revenue']):
+            lines.append(f"• {currency}: {_format_value(currency, summary['revenue'][currency])}")
+        if 'normalized' in summary and len(summary['revenue']) > 1:
+            currency = summary['reporting_currency']
+            lines.append(f"• Итого в {currency}: {_format_value(currency, summary['normalized'])}")
+    else:
+        lines.append("• нет продаж")
+
+    if summary['channels']:
+        lines += ["", "📺 <b>Топ-каналы:</b>"]
+        # По сумме в валюте отчетов; без таблицы курсов — по простой сумме разных валют
+        normalized = summary.get('channels_normalized')
+        if normalized is not None:
+            ranked = sorted(summary['channels'].items(), key=lambda kv: normalized.get(kv[0], 0), reverse=True)
+        else:
+            ranked = sorted(summary['channels'].items(), key=lambda kv: sum(kv[1].values()), reverse=True)
+        for i, (channel, amounts) in enumerate(ranked[:top_channels], 1):
+            lines.append(f"{i}. {channel} — {_format_amounts(amounts)}")
+
+    if summary['managers']:
+        lines += ["", "👨‍💼 <b>Менеджеры:</b>"]
+        ranked = sorted(summary['managers'].items(), key=lambda kv: kv[1]['count'], reverse=True)
+        for manager, stats in ranked:
+            lines.append(f"• @{manager}: {stats['count']} шт. — {_format_amounts(stats['revenue'])}")
+
+        commissions = [(m, s['commission']) for m, s in ranked if s.get('commission')]
+        if commissions:
+            lines += ["", "💼 <b>Комиссии:</b>"]
+            for manager, amounts in commissions:
+                lines.append(f"• @{manager}: {_format_amounts(amounts)}")
+
+    return '\n'.join(lines)
+
+
+class ReportScheduler:
+    """Фоновый поток, публикующий ежедневные/еженедельные/ежемесячные отчеты.
+
+    Отчет за завершенный период отправляется один раз после REPORT_HOUR;
+    ключи отправленных периодов сохраняются, чтобы рестарт не дублировал отчеты.
+    """
+
+    CHECK_INTERVAL = 60
+
+    def __init__(self, aggregates: SalesAggregates, send: Callable[[str], None],
+                 state_path: str, report_hour: int = 9, top_channels: int = 5):
+        self.aggregates = aggregates
+        self.send = send
+        self.state_path = state_path
+        self.report_hour = report_hour
+        self.top_channels = top_channels
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state: Dict[str, str] = load_json(state_path, {})
+        if not self._state:
+            # Первый запуск: не отправляем отчеты за периоды до появления бота
+            today = datetime.now().date()
+            self._state = {kind: previous_period(kind, today)[0] for kind in PERIOD_TITLES}
+            self._save_state()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            if not self._stop.is_set():
+                return
+            # Перезапуск после stop() (экземпляр снова ведущий): ждем выхода прежнего потока
+            self._thread.join()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='report-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Планировщик отчетов запущен (час отправки: {self.report_hour})")
+
+    def stop(self):
+        self._stop.set()
+
+    def reload(self):
+        """Перечитывает отправленные периоды: пока экземпляр был в резерве, отчеты слал ведущий"""
+        self._state = load_json(self.state_path, {}) or self._state
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.tick(datetime.now())
+            except Exception as e:
+                logger.error(f"Ошибка планировщика отчетов: {e}")
+            self._stop.wait(self.CHECK_INTERVAL)
+
+    def tick(self, now: datetime):
+        """Отправляет все отчеты, период которых завершился и еще не был отправлен"""
+        if now.hour < self.report_hour:
+            return
+        today = now.date()
+        for kind in PERIOD_TITLES:
+            key, start, end = previous_period(kind, today)
+            if self._state.get(kind) == key:
+                continue
+            text = build_digest(kind, start, end, self.aggregates.summary(start, end), self.top_channels)
+            self.send(text)
+            self._state[kind] = key
+            self._save_state()
+            logger.info(f"Отправлен отчет {kind} за {key}")
+
+    def _save_state(self):
+        try:
+            save_json_atomic(self.state_path, self._state)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить состояние отчетов: {e}")
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Hashable, List, Optional
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+
+class WorksheetIndex:
+    """Кэш названий листов таблицы с TTL.
+
+    Список листов (метаданные таблицы) запрашивается не чаще раза в ttl секунд;
+    при ошибке запроса отдается последний успешно полученный список.
+    """
+
+    def __init__(self, fetch: Callable[[], List[str]], ttl: float = 300.0,
+                 sort_key: Optional[Callable[[str], Hashable]] = None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.sort_key = sort_key
+        self._lock = threading.Lock()
+        self._titles: List[str] = []
+        self._fetched_at: Optional[float] = None
+
+    def titles(self) -> List[str]:
+        with self._lock:
+            fresh = self._fetched_at is not None and time.monotonic() - self._fetched_at < self.ttl
+            if not fresh:
+                try:
+                    titles = list(self.fetch())
+                    self._titles = sorted(titles, key=self.sort_key) if self.sort_key else titles
+                    self._fetched_at = time.monotonic()
+                except Exception as e:
+                    logger.warning(f"Не удалось получить список листов: {e}")
+            return list(self._titles)
+
+    def invalidate(self):
+        with self._lock:
+            self._fetched_at = None
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        """Размер кэша и его возраст в секундах (без запроса к таблице)"""
+        with self._lock:
+            age = None if self._fetched_at is None else round(time.monotonic() - self._fetched_at, 1)
+            return {'titles': len(self._titles), 'age': age}
+
+    def __contains__(self, title: str) -> bool:
+        return title in self.titles()
+
+
+def add_month_page(keyboard: types.InlineKeyboardMarkup, titles: List[str], page: int, context: str = '',
+                   per_page: int = 9, columns: int = 3) -> int:
+    """Добавляет в клавиатуру страницу кнопок листов и ряд навигации.
+
+    Кнопки листов — money_month:<лист>, навигация — money_page:<страница>:<context>
+    (context — лист, открытый в сообщении, чтобы пересобрать остальную клавиатуру).
+    Возвращает фактический номер страницы (обрезанный до допустимого диапазона).
+    """
+    pages = max(1, (len(titles) + per_page - 1) // per_page)
+    page = min(max(page, 0), pages - 1)
+    chunk = titles[page * per_page:(page + 1) * per_page]
+    for i in range(0, len(chunk), columns):
+        keyboard.row(*[
+            types.InlineKeyboardButton(title, callback_data=f"money_month:{title}")
+            for title in chunk[i:i + columns]
+        ])
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(types.InlineKeyboardButton("◀️", callback_data=f"money_page:{page - 1}:{context}"))
+        navigation.append(types.InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="money_page:noop"))
+        if page < pages - 1:
+            navigation.append(types.InlineKeyboardButton("▶️", callback_data=f"money_page:{page + 1}:{context}"))
+        keyboard.row(*navigation)
+    return page
+
+
+def page_of(titles: List[str], title: str, per_page: int = 9) -> int:
+    """Страница, на которой находится лист (0, если его нет в списке)"""
+    try:
+        return titles.index(title) // per_page
+    except ValueError:
+        return 0
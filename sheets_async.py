@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import re
+from typing import List, Optional
+from urllib.parse import quote
+
+# aiohttp нужен только асинхронному режиму (BOT_MODE=async)
+try:
+    import aiohttp
+except Exception:
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+SHEETS_API = 'https://sheets.googleapis.com/v4/spreadsheets'
+
+# Коды, при которых запрос повторяется с экспоненциальной паузой (квота, временные сбои)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Номер последней строки в диапазоне ответа values:append ('Ноябрь'!A15:J15)
+RANGE_ROW_RE = re.compile(r'(\d+)$')
+
+
+class SheetsApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Sheets API {status}: {message}")
+        self.status = status
+
+
+class AsyncSheetsClient:
+    """Клиент Google Sheets REST API v4 поверх одной aiohttp-сессии.
+
+    Соединения берутся из пула TCPConnector(limit=pool_size), так что сотни
+    одновременных записей не создают по потоку и соединению на каждую.
+    Токен сервисного аккаунта (google-auth) обновляется в исполнителе по
+    истечении или ответу 401; одновременные запросы ждут одно обновление.
+    """
+
+    def __init__(self, credentials, spreadsheet_id: str, pool_size: int = 20, timeout: float = 30.0,
+                 max_retries: int = 3):
+        if aiohttp is None:
+            raise RuntimeError("Для асинхронного клиента Sheets нужен пакет aiohttp")
+        self.credentials = credentials
+        self.spreadsheet_id = spreadsheet_id
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._session: Optional['aiohttp.ClientSession'] = None
+        self._token_lock = asyncio.Lock()
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def _token(self, rejected: Optional[str] = None) -> str:
+        """Действующий токен; rejected — токен, получивший 401 (обновляется один раз на всех)"""
+        async with self._token_lock:
+            if not self.credentials.valid or (rejected and self.credentials.token == rejected):
+                # Обновление синхронное (requests) — выносим из цикла событий
+                from google.auth.transport.requests import Request
+                await asyncio.get_running_loop().run_in_executor(None, self.credentials.refresh, Request())
+            return self.credentials.token
+
+    async def _request(self, method: str, path: str, params: Optional[dict] = None, payload: Optional[dict] = None) -> dict:
+        url = f"{SHEETS_API}/{self.spreadsheet_id}{path}"
+        rejected = None
+        for attempt in range(self.max_retries + 1):
+            token = await self._token(rejected)
+            rejected = None
+            async with self._get_session().request(
+                method, url, params=params, json=payload, headers={'Authorization': f'Bearer {token}'}
+            ) as response:
+                if response.status < 400:
+                    return await response.json()
+                message = await response.text()
+            if response.status == 401 and attempt == 0:
+                rejected = token
+                continue
+            if response.status in RETRY_STATUSES and attempt < self.max_retries:
+                delay = 2 ** attempt
+                logger.warning(f"Sheets API {response.status}, повтор через {delay} с")
+                await asyncio.sleep(delay)
+                continue
+            raise SheetsApiError(response.status, message[:300])
+
+    @staticmethod
+    def _range(sheet_title: str, cells: str) -> str:
+        title = sheet_title.replace("'", "''")
+        return quote(f"'{title}'!{cells}", safe='')
+
+    async def get_values(self, sheet_title: str, cells: str) -> List[List[str]]:
+        result = await self._request('GET', f"/values/{self._range(sheet_title, cells)}")
+        return result.get('values', [])
+
+    async def update_values(self, sheet_title: str, cells: str, values: List[List]):
+        await self._request(
+            'PUT', f"/values/{self._range(sheet_title, cells)}",
+            params={'valueInputOption': 'USER_ENTERED'}, payload={'values': values}
+        )
+
+    async def append_row(self, sheet_title: str, row: List, cells: str = 'A:J') -> int:
+        """Дописывает строку после последней заполненной и возвращает ее номер.
+
+        Следующую строку определяет сервер (values:append), поэтому чтение
+        всего листа не нужно и параллельные записи не попадают в одну строку.
+        """
+        result = await self._request(
+            'POST', f"/values/{self._range(sheet_title, cells)}:append",
+            params={'valueInputOption': 'USER_ENTERED', 'insertDataOption': 'OVERWRITE'},
+            payload={'values': [row]}
+        )
+        updated_range = result.get('updates', {}).get('updatedRange', '')
+        match = RANGE_ROW_RE.search(updated_range)
+        if not match:
+            raise SheetsApiError(200, f"неожиданный ответ append: {updated_range!r}")
+        return int(match.group(1))
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,29 @@
+import json
+import logging
+import os
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def load_json(path: str, default: Any) -> Any:
+    """Читает JSON-файл состояния; при отсутствии или порче файла возвращает default"""
+    if not path or not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Не удалось прочитать {path}: {e}")
+        return default
+
+
+def save_json_atomic(path: str, data: Any):
+    """Атомарно сохраняет JSON: пишем во временный файл и подменяем через os.replace"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
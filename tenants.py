@@ -0,0 +1,188 @@
+import logging
+import re
+import threading
+import time
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import gspread
+
+from aliases import AliasRegistry
+from channels import ChannelCatalog
+from dates import MONTH_NAMES
+from notifier import NotificationQueue
+from storage import load_json
+
+logger = logging.getLogger(__name__)
+
+# Номер строки в диапазоне ответа append ('Ноябрь'!A15:J15)
+RANGE_ROW_RE = re.compile(r'(\d+)$')
+
+
+class TokenBucket:
+    """Бюджет запросов: rate_per_minute в среднем, не больше burst подряд"""
+
+    def __init__(self, rate_per_minute: float, burst: Optional[int] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(rate_per_minute // 6)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = 30.0) -> bool:
+        """Берет токен, при необходимости ожидая; False — не дождались за timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate if self.rate > 0 else timeout
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class Tenant:
+    """Команда: своя таблица, шаблон названия листа, получатели уведомлений и алиасы.
+
+    Клиент gspread общий (один сервисный аккаунт); таблица и листы команды
+    открываются при первом обращении и кэшируются. Каждая запись в Sheets
+    проходит через бюджет команды, чтобы одна команда не выбирала общую квоту.
+    Справочник каналов у команды свой: алиасы команды в нем приоритетнее общих,
+    а выученные в ее чатах каналы не попадают в общий файл.
+    """
+
+    def __init__(self, tenant_id: str, spreadsheet_id: str, chats: Iterable[int] = (),
+                 sheet_title: str = 'Ноябрь', notifier: Optional[NotificationQueue] = None,
+                 aliases: Optional[AliasRegistry] = None, channel_catalog: Optional[ChannelCatalog] = None,
+                 requests_per_minute: float = 60.0,
+                 client: Optional[Callable[[], object]] = None, is_default: bool = False):
+        self.id = tenant_id
+        self.spreadsheet_id = spreadsheet_id
+        self.chats = {int(c) for c in chats}
+        self.sheet_title = sheet_title
+        self.notifier = notifier
+        self.aliases = aliases
+        self.channel_catalog = channel_catalog
+        self.budget = TokenBucket(requests_per_minute)
+        self.client = client
+        self.is_default = is_default
+        self._lock = threading.RLock()
+        self._spreadsheet = None
+        self._worksheets: Dict[str, object] = {}
+
+    def worksheet_title(self, day: Optional[date] = None) -> str:
+        """Лист для продажи: шаблон с {month}/{year} или фиксированное название"""
+        day = day or date.today()
+        return self.sheet_title.format(month=MONTH_NAMES[day.month - 1], year=day.year)
+
+    def throttle(self):
+        if not self.budget.acquire():
+            logger.warning(f"Команда {self.id}: бюджет запросов к Sheets исчерпан, запрос без ожидания")
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                if not self.client or not self.client():
+                    return None
+                self.throttle()
+                self._spreadsheet = self.client().open_by_key(self.spreadsheet_id)
+            return self._spreadsheet
+
+    def worksheet(self, title: str, headers: Optional[List[str]] = None):
+        """Лист по названию (кэшируется); отсутствующий создается с заголовками"""
+        with self._lock:
+            cached = self._worksheets.get(title)
+            if cached is not None:
+                return cached
+            spreadsheet = self.spreadsheet()
+            if spreadsheet is None:
+                return None
+            try:
+                sheet = spreadsheet.worksheet(title)
+            except gspread.WorksheetNotFound:
+                logger.info(f"Команда {self.id}: создаем лист '{title}'")
+                sheet = spreadsheet.add_worksheet(title=title, rows=1000, cols=10)
+                if headers:
+                    sheet.update('A1', [headers])
+            self._worksheets[title] = sheet
+            return sheet
+
+    def append_row(self, title: str, row: List[str], headers: Optional[List[str]] = None) -> Optional[Tuple[str, int]]:
+        """Дописывает строку в лист; номер строки берется из ответа API (без чтения листа)"""
+        sheet = self.worksheet(title, headers)
+        if sheet is None:
+            return None
+        self.throttle()
+        response = sheet.append_row(row, value_input_option='USER_ENTERED', table_range='A1')
+        match = RANGE_ROW_RE.search(response.get('updates', {}).get('updatedRange', ''))
+        if not match:
+            raise ValueError(f"Неожиданный ответ append для команды {self.id}: {response}")
+        return title, int(match.group(1))
+
+    def update_row(self, title: str, row_number: int, values: List[str]):
+        sheet = self.worksheet(title)
+        if sheet is None:
+            return False
+        self.throttle()
+        sheet.update(f'A{row_number}:J{row_number}', [values], value_input_option='USER_ENTERED')
+        return True
+
+    def start(self):
+        if self.notifier:
+            self.notifier.start()
+        if self.aliases:
+            self.aliases.start()
+
+    def stop(self):
+        if self.aliases:
+            self.aliases.stop()
+
+
+class TenantRegistry:
+    """Команды из JSON-файла и соответствие чат -> команда.
+
+    Формат: {"tenants": [{"id": ..., "chats": [...], "spreadsheet_id": ...,
+    "sheet_title": "{month} {year}", "notification_chat_id": "chat#topic,...",
+    "aliases_file": ..., "requests_per_minute": 60}]}. Чаты, не указанные ни у
+    одной команды, обслуживает команда по умолчанию (GOOGLE_SHEETS_ID и
+    NOTIFICATION_CHAT_ID из конфигурации).
+    """
+
+    def __init__(self, default: Tenant, tenants: Iterable[Tenant] = ()):
+        self.default = default
+        self._tenants: Dict[str, Tenant] = {}
+        self._by_chat: Dict[int, Tenant] = {}
+        for tenant in tenants:
+            self.add(tenant)
+
+    @classmethod
+    def from_file(cls, path: str, default: Tenant, build: Callable[[dict], Tenant]) -> 'TenantRegistry':
+        registry = cls(default)
+        for raw in load_json(path, {}).get('tenants', []):
+            try:
+                registry.add(build(raw))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"Некорректное описание команды в {path}: {e}")
+        if registry._tenants:
+            logger.info(f"Команд загружено: {len(registry._tenants)} (плюс команда по умолчанию)")
+        return registry
+
+    def add(self, tenant: Tenant):
+        self._tenants[tenant.id] = tenant
+        for chat_id in tenant.chats:
+            self._by_chat[chat_id] = tenant
+
+    def for_chat(self, chat_id: int) -> Tenant:
+        return self._by_chat.get(chat_id, self.default)
+
+    def get(self, tenant_id: Optional[str]) -> Tenant:
+        return self._tenants.get(tenant_id, self.default) if tenant_id else self.default
+
+    def extra(self) -> List[Tenant]:
+        """Команды, кроме команды по умолчанию"""
+        return list(self._tenants.values())
@@ -0,0 +1,29 @@
+from datetime import date
+
+from aggregates import SalesAggregates
+
+
+def _sale(day, amount, manager='ivan', commission=None):
+    return {'date': day, 'amount': amount, 'currency': 'RUB', 'channel': 'K',
+            'manager_username': manager, 'commission': commission}
+
+
+def test_replace_range_rebuilds_only_days_in_range(tmp_path):
+    aggregates = SalesAggregates(str(tmp_path / 'aggregates.json'))
+    aggregates.add_sale(_sale('01.10.2026', 300))
+    aggregates.add_sale(_sale('05.11.2026', 100))
+
+    count = aggregates.replace_range(date(2026, 11, 1), date(2026, 11, 30), [
+        _sale('05.11.2026', 100),
+        _sale('06.11.2026', 200, commission=20),
+        _sale('01.12.2026', 999),
+    ])
+
+    assert count == 2
+    november = aggregates.summary(date(2026, 11, 1), date(2026, 11, 30))
+    assert november['revenue'] == {'RUB': 300.0}
+    assert aggregates.summary(date(2026, 10, 1), date(2026, 10, 31))['revenue'] == {'RUB': 300.0}
+    assert aggregates.summary(date(2026, 12, 1), date(2026, 12, 31))['revenue'] == {}
+
+    reloaded = SalesAggregates(str(tmp_path / 'aggregates.json'))
+    assert reloaded.summary(date(2026, 11, 1), date(2026, 11, 30))['revenue'] == {'RUB': 300.0}
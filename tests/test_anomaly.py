@@ -0,0 +1,80 @@
+import json
+import math
+
+import pytest
+
+from anomaly import AnomalyDetector, PendingSales, RollingStats
+
+
+def sale(amount, currency='RUB', channel='Русский бизнес', sale_format='1/24'):
+    return {'amount': amount, 'currency': currency, 'channel': channel, 'format': sale_format}
+
+
+@pytest.fixture
+def detector(tmp_path):
+    detector = AnomalyDetector(str(tmp_path / 'sales_stats.json'), alpha=0.05, threshold=3.0, min_samples=8)
+    for amount in (4000, 5000, 4500, 5500, 5000, 4800, 5200, 5000, 4700, 5300):
+        detector.observe(sale(amount), save=False)
+    return detector
+
+
+def test_rolling_stats_are_exact_for_first_samples():
+    stats = RollingStats()
+    values = [1.0, 2.0, 3.0, 4.0]
+    for x in values:
+        stats.update(x, alpha=0.05)
+    assert stats.n == 4
+    assert stats.mean == pytest.approx(2.5)
+    assert stats.var == pytest.approx(1.25)
+
+
+def test_typical_sale_passes(detector):
+    assert detector.check(sale(5100)) == []
+
+
+def test_extra_zero_is_flagged(detector):
+    reasons = detector.check(sale(50000))
+    assert len(reasons) == 2
+    assert 'канала «Русский бизнес»' in reasons[0]
+    assert 'формата «1/24»' in reasons[1]
+
+
+def test_rare_currency_is_flagged(detector):
+    reasons = detector.check(sale(50, currency='USDT'))
+    assert any('валюта USDT необычна' in reason for reason in reasons)
+
+
+def test_unknown_key_or_other_scope_is_not_checked(detector):
+    assert detector.check(sale(50000, channel='Новый канал', sale_format='')) == []
+    assert detector.check(sale(50000), scope='team') == []
+
+
+def test_stats_are_saved_and_loaded(tmp_path, detector):
+    detector.observe(sale(5000))
+    with open(tmp_path / 'sales_stats.json', encoding='utf-8') as f:
+        saved = json.load(f)
+    n, mean, _ = saved['amounts']['|channel|русский бизнес|RUB']
+    assert n == 11
+    assert math.exp(mean) == pytest.approx(4900, rel=0.05)
+    reloaded = AnomalyDetector(str(tmp_path / 'sales_stats.json'))
+    assert len(reloaded) == len(detector)
+    assert reloaded.check(sale(50000))
+
+
+def test_pending_sales_expire_and_persist(tmp_path):
+    pending = PendingSales(ttl=60)
+    token = pending.hold({'data': sale(5000), 'chat_id': 1, 'message_id': 2, 'user_id': 3, 'tenant': None})
+    other = pending.hold({'data': sale(10), 'chat_id': 1, 'message_id': 5, 'user_id': 3, 'tenant': None})
+    assert pending.save(str(tmp_path / 'pending.json')) == 2
+
+    restored = PendingSales(ttl=60)
+    assert restored.restore(str(tmp_path / 'pending.json')) == 2
+    assert not (tmp_path / 'pending.json').exists()
+    assert restored.discard_message(1, 2) == 1
+    assert restored.get(token) is None
+    assert restored.pop(other)['data']['amount'] == 10
+    assert restored.pop(other) is None
+
+    expired = PendingSales(ttl=0)
+    token = expired.hold({'chat_id': 1, 'message_id': 2})
+    assert expired.get(token) is None
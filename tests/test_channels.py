@@ -0,0 +1,58 @@
+import json
+
+from channels import ChannelCatalog, edit_distance, max_typos, normalize_key
+
+
+def make_catalog(tmp_path, aliases=None):
+    return ChannelCatalog(aliases or {}, str(tmp_path / 'channel_aliases.json'))
+
+
+def test_normalize_key_ignores_case_and_punctuation():
+    assert normalize_key('  Русский-Бизнес!! ') == 'русский бизнес'
+
+
+def test_edit_distance_stops_at_limit():
+    assert edit_distance('канал', 'канал', 1) == 0
+    assert edit_distance('канал', 'кнал', 1) == 1
+    assert edit_distance('канал', 'совсем другое', 2) == 3
+
+
+def test_short_names_get_no_typo_budget():
+    assert max_typos('крипто') == 0
+    assert max_typos('русский бизнес') == 1
+    assert max_typos('x' * 100) == 3
+
+
+def test_typo_in_long_name_is_corrected(tmp_path):
+    catalog = make_catalog(tmp_path, {'рб': 'Русский бизнес'})
+    assert catalog.resolve('Руский бизнес') == 'Русский бизнес'
+    assert catalog.resolve('РБ') == 'Русский бизнес'
+
+
+def test_similar_channels_are_not_merged(tmp_path):
+    catalog = make_catalog(tmp_path)
+    catalog.learn(['Экономист', 'Криптон'])
+    assert catalog.resolve('Экономика') == 'Экономика'
+    assert catalog.resolve('Крипто') == 'Крипто'
+
+
+def test_fuzzy_match_in_a_sale_is_not_persisted(tmp_path):
+    catalog = make_catalog(tmp_path, {'рб': 'Русский бизнес'})
+    assert catalog.resolve('Руский бизнес') == 'Русский бизнес'
+    assert not (tmp_path / 'channel_aliases.json').exists()
+
+
+def test_learn_remembers_rare_spelling_as_alias(tmp_path):
+    catalog = make_catalog(tmp_path)
+    catalog.learn(['Русский бизнес'] * 5 + ['Руский бизнес'])
+    with open(tmp_path / 'channel_aliases.json', encoding='utf-8') as f:
+        assert json.load(f) == {'руский бизнес': 'Русский бизнес'}
+    assert make_catalog(tmp_path).resolve('руский  бизнес', learn=False) == 'Русский бизнес'
+
+
+def test_resolve_without_learn_does_not_add_channel(tmp_path):
+    catalog = make_catalog(tmp_path)
+    catalog.resolve('Новый канал', learn=False)
+    assert catalog.channels() == []
+    catalog.resolve('Новый канал')
+    assert catalog.channels() == ['Новый канал']
@@ -0,0 +1,41 @@
+import json
+import os
+
+from commissions import CommissionEngine
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'commission_rules.json')
+
+
+def write_rules(tmp_path, rules):
+    path = tmp_path / 'commission_rules.json'
+    path.write_text(json.dumps(rules, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def test_shipped_rules_keep_sheet_columns_for_every_seller():
+    engine = CommissionEngine.from_file(RULES_FILE)
+    assert [(r.name, r.rate, r.sheet_column) for r in engine.sheet_rules()] == [
+        ('Дима', 0.05, 'O'), ('Алина', 0.15, 'P'), ('Ксения', 0.10, 'Q'), ('Роман', 0.10, 'R'),
+    ]
+    assert engine.rate_for('mqwou', 'RUB') == 0.05
+
+
+def test_unmapped_seller_is_not_applied_to_sales(tmp_path):
+    engine = CommissionEngine.from_file(write_rules(tmp_path, [
+        {'manager': None, 'name': 'Дима', 'rate': 0.05, 'sheet_column': 'o'},
+        {'manager': None, 'name': 'Без колонки', 'rate': 0.5},
+    ]))
+    assert [r.sheet_column for r in engine.sheet_rules()] == ['O']
+    assert engine.commission_for_sale({'manager_username': '', 'amount': 100, 'currency': 'RUB'}) == 0
+
+
+def test_rule_picks_currency_and_latest_start(tmp_path):
+    engine = CommissionEngine.from_file(write_rules(tmp_path, [
+        {'manager': '@Seller', 'rate': 0.1},
+        {'manager': 'seller', 'rate': 0.2, 'from': '2026-06-01'},
+        {'manager': 'seller', 'rate': 0.3, 'currency': 'usdt'},
+    ]))
+    sale = {'manager_username': 'Seller', 'amount': 100, 'currency': 'RUB', 'date': '01.05.2026'}
+    assert engine.commission_for_sale(sale) == 10
+    assert engine.commission_for_sale(dict(sale, date='01.07.2026')) == 20
+    assert engine.commission_for_sale(dict(sale, currency='USDT')) == 30
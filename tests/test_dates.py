@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+from dates import month_number, parse_sale_date, resolve_year, title_month
+
+
+@pytest.mark.parametrize('day, month, today, expected', [
+    (14, 5, date(2026, 5, 20), date(2026, 5, 14)),
+    (30, 12, date(2027, 1, 2), date(2026, 12, 30)),
+    (3, 1, date(2026, 12, 30), date(2027, 1, 3)),
+    (20, 2, date(2026, 1, 1), date(2026, 2, 20)),
+    # Далекое будущее не выбирается, даже если оно ближе прошлого
+    (15, 6, date(2026, 12, 20), date(2026, 6, 15)),
+    (1, 10, date(2026, 1, 1), date(2025, 10, 1)),
+])
+def test_resolve_year(day, month, today, expected):
+    assert resolve_year(day, month, today) == expected
+
+
+def test_resolve_year_rejects_impossible_dates():
+    assert resolve_year(31, 4, date(2026, 5, 1)) is None
+    assert resolve_year(29, 2, date(2026, 3, 1)) is None
+    assert resolve_year(29, 2, date(2028, 3, 1)) == date(2028, 2, 29)
+
+
+@pytest.mark.parametrize('word, expected', [
+    ('декабря', 12), ('дек.', 12), ('Сент', 9), ('мае', 5), ('ёлка', None), ('ма', None),
+])
+def test_month_number(word, expected):
+    assert month_number(word) == expected
+
+
+def test_parse_sale_date():
+    today = date(2026, 10, 19)
+    assert parse_sale_date('14.05', today) == date(2026, 5, 14)
+    assert parse_sale_date('14/05', today) == date(2026, 5, 14)
+    assert parse_sale_date('12 декабря', today) == date(2026, 12, 12)
+    assert parse_sale_date('12 янв.', today) == date(2026, 1, 12)
+    assert parse_sale_date('14.13', today) is None
+    assert parse_sale_date('12 недели', today) is None
+
+
+def test_title_month():
+    assert title_month('Ноябрь') == 11
+    assert title_month('Продажи май 2026') == 5
+    assert title_month('Итоги') is None
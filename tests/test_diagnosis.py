@@ -0,0 +1,49 @@
+from datetime import date
+
+from diagnosis import diagnose_sale, format_sale_line
+
+TODAY = date(2026, 10, 19)
+
+
+def sale(**fields):
+    data = {
+        'manager': '@ivan', 'date': '14.05.2026', 'time': '17:30', 'amount': 500.0, 'currency': 'RUB',
+        'payment_type': '', 'format': '', 'internal_external': '', 'channel': 'Русский бизнес', 'comment': '',
+    }
+    data.update(fields)
+    return data
+
+
+def test_format_sale_line_minimal():
+    assert format_sale_line(sale()) == '@ivan 14.05 17:30 500р Русский бизнес'
+
+
+def test_format_sale_line_shows_every_written_field():
+    assert format_sale_line(sale(payment_type='СБП')) == '@ivan 14.05 17:30 500р СБП Русский бизнес'
+    assert format_sale_line(sale(payment_type='СБП', format='1/24', internal_external='Внешняя',
+                                 amount=148.5, currency='USDT', comment='повтор')) == (
+        '@ivan 14.05 17:30 148.5usdt СБП 1/24 Внешняя Русский бизнес / повтор'
+    )
+
+
+def test_diagnose_fields_in_any_order():
+    diagnosis = diagnose_sale('@ivan 500р 14.05 сбп в 17:30 Русский бизнес', TODAY, payment_types={'сбп'})
+    assert diagnosis.complete()
+    data = diagnosis.sale_data()
+    assert (data['date'], data['time'], data['amount'], data['currency']) == ('14.05.2026', '17:30', 500.0, 'RUB')
+    assert data['payment_type'] == 'сбп'
+    assert data['channel'] == 'Русский бизнес'
+
+
+def test_diagnose_reports_invalid_values():
+    diagnosis = diagnose_sale('@ivan 31.04 25:10 500р 1/72 Канал', TODAY)
+    assert diagnosis.fields['date'].confidence == 0
+    assert diagnosis.fields['time'].confidence == 0
+    assert diagnosis.fields['format'].confidence == 0
+    assert set(diagnosis.problems()) == {'date', 'time', 'format'}
+
+
+def test_dot_time_is_not_a_date():
+    diagnosis = diagnose_sale('@ivan 14.05 17.30 500р Канал', TODAY)
+    assert diagnosis.fields['time'].value == '17:30'
+    assert diagnosis.fields['date'].value == date(2026, 5, 14)
@@ -0,0 +1,48 @@
+import time
+
+from instance_lock import SheetLease
+
+
+class FakeWorksheet:
+    """Лист аренды; render — как Sheets отдает число без UNFORMATTED_VALUE (русская локаль)"""
+
+    def __init__(self):
+        self.row = []
+
+    def get(self, range_name, value_render_option='FORMATTED_VALUE'):
+        if not self.row:
+            return [[]]
+        holder, expires_at = self.row[:2]
+        if value_render_option != 'UNFORMATTED_VALUE':
+            expires_at = str(expires_at).replace('.', ',')
+        return [[holder, expires_at]]
+
+    def update(self, range_name, values):
+        self.row = list(values[0])
+
+
+def make_lease(sheet, holder):
+    return SheetLease(lambda: sheet, holder, ttl=30.0, confirm_delay=0)
+
+
+def test_standby_does_not_take_a_live_lease():
+    sheet = FakeWorksheet()
+    leader, standby = make_lease(sheet, 'a'), make_lease(sheet, 'b')
+    assert leader.acquire()
+    sheet.row[1] = time.time() + 29.5
+    assert not standby.acquire()
+    assert sheet.row[0] == 'a'
+
+
+def test_expired_lease_is_taken_over():
+    sheet = FakeWorksheet()
+    assert make_lease(sheet, 'a').acquire()
+    sheet.row[1] = int(time.time()) - 1
+    assert make_lease(sheet, 'b').acquire()
+    assert sheet.row[0] == 'b'
+
+
+def test_expiry_is_written_as_whole_seconds():
+    sheet = FakeWorksheet()
+    make_lease(sheet, 'a').acquire()
+    assert isinstance(sheet.row[1], int)
@@ -0,0 +1,70 @@
+import pytest
+
+from ledger import SalesLedger
+
+HEADERS = ['Покупатель', 'Дата', 'Время', 'Сумма', 'Валюта', 'Тип оплаты', 'Формат',
+           'Внешняя/Внутренняя', 'Канал', 'Комментарий']
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SalesLedger(str(tmp_path / 'ledger.sqlite3'))
+    yield ledger
+    ledger.close()
+
+
+def sale(manager, amount, day='14.10.2026'):
+    return {'manager': manager, 'date': day, 'time': '12:00', 'amount': amount, 'currency': 'RUB',
+            'channel': 'Канал', 'manager_username': 'ivan', 'commission': 10.0}
+
+
+def row(manager, amount, day='14.10.2026'):
+    return [manager, day, '12:00', str(amount), 'RUB', '', '', '', 'Канал', '']
+
+
+def bot_columns(ledger, sheet_row):
+    record = ledger.fetchone(
+        'SELECT manager, manager_username, commission, chat_id, message_id FROM sales WHERE sheet = ? AND row = ?',
+        ('Октябрь', sheet_row)
+    )
+    return tuple(record) if record else None
+
+
+def test_sync_keeps_bot_metadata_for_the_same_sale(ledger):
+    ledger.record_sale(sale('Иван Петров', 500), 'Октябрь', 2, chat_id=1, message_id=10)
+    ledger.sync_sheet('Октябрь', [HEADERS, row('Иван Петров', '500')])
+    assert bot_columns(ledger, 2) == ('Иван Петров', 'ivan', 10.0, 1, 10)
+
+
+def test_sync_drops_bot_metadata_when_rows_shift(ledger):
+    ledger.record_sale(sale('Иван Петров', 500), 'Октябрь', 2, chat_id=1, message_id=10)
+    # Над продажей бота вручную вставили строку: под номером 2 теперь другая продажа
+    ledger.sync_sheet('Октябрь', [HEADERS, row('Анна Смирнова', '700'), row('Иван Петров', '500')])
+    assert bot_columns(ledger, 2) == ('Анна Смирнова', None, None, None, None)
+    assert bot_columns(ledger, 3) == ('Иван Петров', None, None, None, None)
+
+
+def test_sync_removes_rows_missing_from_sheet(ledger):
+    ledger.record_sale(sale('Иван Петров', 500), 'Октябрь', 2)
+    ledger.record_sale(sale('Анна Смирнова', 700), 'Октябрь', 3)
+    ledger.sync_sheet('Октябрь', [HEADERS, row('Иван Петров', '500'), ['', '', '', '', '']])
+    assert bot_columns(ledger, 3) is None
+    assert ledger.sheet_rows('Октябрь') == [['Иван Петров', '14.10.2026', '12:00', 500.0, 'RUB',
+                                              '', '', '', 'Канал', '']]
+    assert ledger.synced_at('Октябрь') is not None
+
+
+def test_sync_of_empty_sheet_clears_it(ledger):
+    ledger.record_sale(sale('Иван Петров', 500), 'Октябрь', 2)
+    ledger.record_sale(sale('Иван Петров', 500), 'Сентябрь', 2)
+    ledger.sync_sheet('Октябрь', [HEADERS])
+    assert ledger.sheet_rows('Октябрь') == []
+    assert len(ledger.sheet_rows('Сентябрь')) == 1
+
+
+def test_sync_keeps_the_sheet_summary_block(ledger):
+    summary_row = row('Иван Петров', '500') + ['', 'RUB', '90 000', '60 000,5', '4 500', '', 'x', '0']
+    ledger.sync_sheet('Октябрь', [HEADERS, summary_row])
+    assert ledger.sheet_summary('Октябрь') == {'RUB': {'M': 90000.0, 'N': 60000.5, 'O': 4500.0, 'R': 0.0}}
+    ledger.sync_sheet('Октябрь', [HEADERS, row('Иван Петров', '500')])
+    assert ledger.sheet_summary('Октябрь') == {}
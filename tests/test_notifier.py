@@ -0,0 +1,71 @@
+import threading
+import time
+
+from notifier import MAX_MESSAGE_LENGTH, NotificationQueue, parse_destinations
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            self.sent.append((chat_id, kwargs.get('message_thread_id'), text))
+
+
+def wait_sent(notifier, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while notifier._queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not notifier._queue.unfinished_tasks
+
+
+def test_parse_destinations():
+    assert parse_destinations('-100, -200#5, -300#x,') == [('-100', None), ('-200', 5)]
+
+
+def test_burst_of_sales_is_coalesced():
+    bot = FakeBot()
+    notifier = NotificationQueue(bot, [('-100', None), ('-200', 7)], coalesce_window=0.5)
+    for i in range(3):
+        notifier.enqueue(f"Продажа {i}", summary=f"• продажа {i}")
+    notifier.enqueue("Отчет за день")
+    notifier.start()
+    wait_sent(notifier)
+
+    texts = [text for chat_id, _, text in bot.sent if chat_id == '-100']
+    assert texts == ["🧾 <b>Новых продаж: 3</b>\n\n• продажа 0\n• продажа 1\n• продажа 2", "Отчет за день"]
+    assert ('-200', 7, "Отчет за день") in bot.sent
+    assert notifier.sent == 4
+
+
+def test_single_sale_is_sent_as_is():
+    bot = FakeBot()
+    notifier = NotificationQueue(bot, [('-100', None)], coalesce_window=0.05)
+    notifier.enqueue("Продажа", summary="• продажа")
+    notifier.start()
+    wait_sent(notifier)
+    assert [text for _, _, text in bot.sent] == ["Продажа"]
+
+
+def test_long_text_is_split_by_lines():
+    line = 'x' * 1000
+    chunks = NotificationQueue._chunks('\n'.join([line] * 10))
+    assert len(chunks) == 3
+    assert all(len(chunk) <= MAX_MESSAGE_LENGTH for chunk in chunks)
+    assert '\n'.join(chunks).count(line) == 10
+
+
+def test_pending_notifications_survive_restart(tmp_path):
+    path = str(tmp_path / 'pending_notifications.json')
+    notifier = NotificationQueue(FakeBot(), [('-100', None)])
+    notifier.enqueue("Продажа", summary="• продажа")
+    notifier.enqueue("Отчет")
+    assert notifier.save_pending(path) == 2
+    assert notifier.pending() == 0
+
+    restored = NotificationQueue(FakeBot(), [('-100', None)])
+    assert restored.restore_pending(path) == 2
+    assert restored.pending() == 2
+    assert not (tmp_path / 'pending_notifications.json').exists()
@@ -0,0 +1,66 @@
+from datetime import date
+
+import pytest
+
+from ledger import SalesLedger
+from query import QueryError, format_result, parse_query, run_query
+
+TODAY = date(2026, 10, 19)
+# Курс для теста: 1 USDT = 100 RUB
+RATES = {'RUB': 1.0, 'USDT': 100.0}
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SalesLedger(str(tmp_path / 'ledger.sqlite3'),
+                         normalize=lambda amount, currency, iso_date: amount * RATES[currency])
+    yield ledger
+    ledger.close()
+
+
+def add(ledger, row, channel, amount, currency, day='14.10.2026'):
+    ledger.record_sale({
+        'manager': 'Иван Петров', 'date': day, 'time': '12:00', 'amount': amount, 'currency': currency,
+        'channel': channel, 'manager_username': 'ivan',
+    }, 'Октябрь', row)
+
+
+def test_parse_query_builds_filters():
+    query = parse_query('channel:рб currency:usdt @Ivan period:month by:channel',
+                        {'channel': lambda value: 'Русский бизнес'}, today=TODAY)
+    assert query.group_by == 'channel'
+    assert query.params == ['Русский бизнес', 'USDT', 'ivan', '2026-10-01', '2026-10-19']
+    assert query.where[:3] == ['channel = ?', 'currency = ?', 'lower(manager_username) = ?']
+
+
+@pytest.mark.parametrize('text', ['by:weekday', 'period:someday', 'currency:EUR', 'from:31.02', 'просто', 'channel:"'])
+def test_parse_query_rejects_bad_input(text):
+    with pytest.raises(QueryError):
+        parse_query(text, {}, today=TODAY)
+
+
+def test_groups_are_ranked_by_normalized_total(ledger):
+    add(ledger, 2, 'Рубли', 20000, 'RUB')
+    add(ledger, 3, 'Крипта', 300, 'USDT')
+    add(ledger, 4, 'Крипта', 100, 'USDT')
+    add(ledger, 5, 'Мелочь', 5000, 'RUB')
+    rows = run_query(ledger, parse_query('by:channel', {}, today=TODAY))
+    # 400 USDT = 40 000 RUB: больше 20 000 RUB, хотя сырая сумма меньше
+    assert [(r['grp'], r['currency'], r['total'], r['cnt']) for r in rows] == [
+        ('Крипта', 'USDT', 400, 2), ('Рубли', 'RUB', 20000, 1), ('Мелочь', 'RUB', 5000, 1),
+    ]
+
+
+def test_time_groups_are_chronological(ledger):
+    add(ledger, 2, 'A', 100, 'RUB', day='02.10.2026')
+    add(ledger, 3, 'A', 900, 'RUB', day='01.10.2026')
+    rows = run_query(ledger, parse_query('by:day', {}, today=TODAY))
+    assert [r['grp'] for r in rows] == ['2026-10-01', '2026-10-02']
+
+
+def test_format_result_escapes_labels(ledger):
+    add(ledger, 2, '<b>Канал & Ко</b>', 100, 'RUB')
+    query = parse_query('channel:"<i>x</i>" by:channel', {'channel': lambda value: '<b>Канал & Ко</b>'}, today=TODAY)
+    text = format_result(query, run_query(ledger, query))
+    assert '&lt;b&gt;Канал &amp; Ко&lt;/b&gt;' in text
+    assert '<b>Канал' not in text
@@ -0,0 +1,84 @@
+import json
+import os
+
+import pytest
+
+from textmatch import CommentSplitter, KeywordAutomaton
+
+ALIASES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'aliases.json')
+
+
+def legacy_split(text, delimiters, keywords):
+    """Прежний поиск комментария: split по каждому разделителю, затем find по каждому ключевому слову"""
+    text = text.strip()
+    for delim in delimiters:
+        if delim in text:
+            parts = text.split(delim, 1)
+            return parts[0].strip(), parts[1].strip()
+    lowered = text.lower()
+    keyword_positions = [lowered.find(' ' + kw) for kw in keywords]
+    keyword_positions = [pos for pos in keyword_positions if pos > 0]
+    if keyword_positions:
+        split_pos = min(keyword_positions)
+        return text[:split_pos].strip(), text[split_pos:].strip()
+    return text, ''
+
+
+def automaton_split(splitter, text):
+    text = text.strip()
+    split = splitter.find_split(text)
+    if split:
+        channel_end, comment_start = split
+        return text[:channel_end].strip(), text[comment_start:].strip()
+    return text, ''
+
+
+@pytest.fixture(scope='module')
+def dictionary():
+    with open(ALIASES_FILE, encoding='utf-8') as f:
+        raw = json.load(f)
+    return raw['comment_delimiters'], raw['comment_keywords']
+
+
+SAMPLES = [
+    'Русский бизнес',
+    'Русский бизнес / повтор через неделю',
+    'Русский бизнес -- закреп',
+    'БиБ — мб еще возьмет',
+    'БиБ | доп. размещение',
+    'Крипта  без закрепа',
+    'Крипта Может быть повтор',
+    'Крипта коммент: оплатил частями',
+    'Деньги +1 пост',
+    'Канал Скорее всего продлит / note',
+    'Новостиещё',
+    'еще канал',
+    'Канал ещё | и еще',
+    'Инвестиции потом допишу',
+    'Business NOTE later',
+    'ДОП канал',
+    '  Канал с пробелами по краям  ',
+]
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_splitter_matches_legacy_split(dictionary, text):
+    delimiters, keywords = dictionary
+    splitter = CommentSplitter(delimiters, keywords)
+    assert automaton_split(splitter, text) == legacy_split(text, delimiters, keywords)
+
+
+def test_delimiter_order_beats_position():
+    # ' / ' стоит в списке раньше, хотя ' | ' встречается в тексте раньше
+    splitter = CommentSplitter([' / ', ' | '], [])
+    assert splitter.find_split('a | b / c') == (5, 8)
+
+
+def test_keyword_at_start_is_not_a_split():
+    splitter = CommentSplitter([], ['мб'])
+    assert splitter.find_split('мб канал') is None
+
+
+def test_automaton_reports_first_occurrence_of_each_pattern():
+    automaton = KeywordAutomaton(['he', 'she', 'his', 'hers'])
+    assert automaton.first_occurrences('ushers hers') == {1: 1, 0: 2, 3: 2}
@@ -0,0 +1,85 @@
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+class KeywordAutomaton:
+    """Автомат Ахо–Корасик: находит вхождения всех шаблонов за один проход по тексту"""
+
+    def __init__(self, patterns: Sequence[str]):
+        self.patterns = list(patterns)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for pattern_id, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][ch] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append(pattern_id)
+
+        # Суффиксные ссылки строим обходом в ширину
+        pending = deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, next_state in self._goto[state].items():
+                pending.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def first_occurrences(self, text: str) -> Dict[int, int]:
+        """Позиция первого вхождения для каждого найденного шаблона: {pattern_id: start}"""
+        found: Dict[int, int] = {}
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern_id in out[state]:
+                if pattern_id not in found:
+                    found[pattern_id] = pos - len(self.patterns[pattern_id]) + 1
+        return found
+
+
+class CommentSplitter:
+    """Поиск места, где после названия канала начинается комментарий.
+
+    Разделители и ключевые слова компилируются в один автомат. Разделители
+    сохраняют приоритет по порядку в списке; если их нет, берется самое раннее
+    ключевое слово, перед которым стоит пробел.
+    """
+
+    def __init__(self, delimiters: Sequence[str], keywords: Sequence[str]):
+        self.delimiters = list(delimiters)
+        self.keywords = list(keywords)
+        self._automaton = KeywordAutomaton(self.delimiters + [' ' + kw.lower() for kw in self.keywords])
+
+    def find_split(self, text: str) -> Optional[Tuple[int, int]]:
+        """Возвращает (конец названия канала, начало комментария) или None"""
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            # Редкие символы меняют длину при lower() — ищем по исходному тексту
+            lowered = text
+        found = self._automaton.first_occurrences(lowered)
+        if not found:
+            return None
+        for delim_id, delim in enumerate(self.delimiters):
+            if delim_id in found:
+                pos = found[delim_id]
+                return pos, pos + len(delim)
+        keyword_positions = [pos for pattern_id, pos in found.items()
+                             if pattern_id >= len(self.delimiters) and pos > 0]
+        if keyword_positions:
+            split_pos = min(keyword_positions)
+            return split_pos, split_pos
+        return None